@@ -0,0 +1,556 @@
+"""Vectorized aggregation of positions across accounts
+
+``PositionTable`` holds positions as parallel NumPy columns: symbol, account,
+broker and currency as integer codes, and quantity, price and value as
+fixed-point integers with ``QUANTITY_SCALE`` and ``MONEY_SCALE`` decimal
+places (the same scales as the history index). Prices and values are in each
+position's own currency until ``convert`` puts them in one. Totals by
+symbol, account or broker are single grouped sums over those columns and
+stay exact; amounts are turned back into ``Decimal`` only for the groups
+that are shown.
+
+Each position also carries its cost basis (quantity times average cost),
+or ``NO_COST`` if the broker did not report one. Every view sums cost and
+unrealized gain in the same grouped pass as value, over the positions
+whose cost is known.
+
+A position's value is computed from its fixed-point quantity and price in
+64-bit integer arithmetic, split so that no intermediate product overflows,
+and rounded half to even to ``MONEY_SCALE`` places, as ``Decimal`` would.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .models import Account, Position
+from .store import AccountRecord
+from .timeseries import MONEY_SCALE, QUANTITY_SCALE, from_fixed, to_fixed
+
+
+@dataclass
+class SymbolTotal:
+    """A symbol's holdings across all accounts"""
+    symbol: str
+    description: str
+    quantity: Decimal
+    value: Decimal
+    brokers: List[str]
+    accounts: int
+    # (symbol, value) of each symbol merged into this one by ``relabel``, largest first
+    components: List[Tuple[str, Decimal]] = field(default_factory=list)
+    # Cost basis and unrealized gain of the positions with a known cost; None if none has one
+    cost: Optional[Decimal] = None
+    gain: Optional[Decimal] = None
+
+
+@dataclass
+class AccountHolding:
+    """One position in an account"""
+    symbol: str
+    description: str
+    quantity: Decimal
+    price: Decimal
+    value: Decimal
+    cost: Optional[Decimal] = None
+    gain: Optional[Decimal] = None
+
+
+@dataclass
+class AccountTotal:
+    """An account's positions, largest first"""
+    account: Account
+    value: Decimal
+    holdings: List[AccountHolding]
+    cost: Optional[Decimal] = None
+    gain: Optional[Decimal] = None
+
+
+@dataclass
+class BrokerTotal:
+    """A broker's holdings by symbol, largest first"""
+    broker: str
+    value: Decimal
+    holdings: List[Tuple[str, Decimal]]
+    cost: Optional[Decimal] = None
+    gain: Optional[Decimal] = None
+
+
+# Cost column of a position whose cost basis is unknown
+NO_COST = np.iinfo(np.int64).min
+
+
+def _fixed(values: List[Decimal], scale: int) -> np.ndarray:
+    """Fixed-point column of ``values`` with ``scale`` decimal places"""
+    factor = Decimal(10) ** scale
+    return np.fromiter((round(value * factor) for value in values), dtype=np.int64, count=len(values))
+
+
+def _value(quantity: np.ndarray, price: np.ndarray) -> np.ndarray:
+    """``quantity * price`` in ``MONEY_SCALE`` units, rounded half to even
+    
+    Exact for prices below 10**(18 - MONEY_SCALE - 4); values, like every
+    total, must stay below 2**63 money units (about 9.2 trillion).
+    """
+    unit = 10 ** QUANTITY_SCALE
+    whole, fraction = np.divmod(quantity, unit)
+    high, low = np.divmod(fraction, 10 ** 4)
+    # fraction * price / unit == high * price / 10**4 + low * price / unit
+    carry, rest = np.divmod(high * price, 10 ** 4)
+    extra, remainder = np.divmod(rest * 10 ** 4 + low * price, unit)
+    value = whole * price + carry + extra
+    return value + ((2 * remainder > unit) | ((2 * remainder == unit) & (value % 2 == 1)))
+
+
+def _group_sum(codes: np.ndarray, values: np.ndarray, groups: int) -> np.ndarray:
+    totals = np.zeros(groups, dtype=np.int64)
+    np.add.at(totals, codes, values)
+    return totals
+
+
+def _gains(value: np.ndarray, cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Whether each position's cost is known, and its cost and gain (zero if not)"""
+    known = cost != NO_COST
+    cost = np.where(known, cost, 0)
+    return known, cost, np.where(known, value - cost, 0)
+
+
+def _optional(amount: int, known: int) -> Optional[Decimal]:
+    """A money total, or None if no position contributed to it"""
+    return from_fixed(int(amount), MONEY_SCALE) if known else None
+
+
+# Largest (row, column) matrix ``_distinct_pairs`` marks densely instead of sorting
+DENSE_PAIRS_LIMIT = 1 << 24
+
+
+def _distinct_pairs(rows: np.ndarray, columns: np.ndarray, row_count: int,
+                    column_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row and column codes of each distinct (row, column) pair, ordered by row"""
+    if row_count * column_count <= DENSE_PAIRS_LIMIT:
+        present = np.zeros((row_count, column_count), dtype=bool)
+        present[rows, columns] = True
+        return np.nonzero(present)
+    pairs = np.unique(rows.astype(np.int64) * column_count + columns)
+    return pairs // column_count, pairs % column_count
+
+
+class PositionTable:
+    """Positions of many accounts, aggregated in vectorized passes"""
+    
+    def __init__(self):
+        self.symbols: List[str] = []
+        self.descriptions: List[str] = []
+        self.accounts: List[Account] = []
+        self.brokers: List[str] = []
+        self.currencies: List[str] = []
+        self._symbol_codes: Dict[str, int] = {}
+        self._account_codes: Dict[Tuple[Optional[str], str], int] = {}
+        self._broker_codes: Dict[str, int] = {}
+        self._currency_codes: Dict[str, int] = {}
+        self._chunks: List[Tuple[np.ndarray, ...]] = []
+        self._columns: Optional[Tuple[np.ndarray, ...]] = None
+    
+    @classmethod
+    def from_records(cls, records: Iterable[AccountRecord], include: Iterable[str] = ()) -> 'PositionTable':
+        """Table of the positions in (account, positions, errors) records
+        
+        Accounts with errors are left out, as their positions may be partial,
+        unless their ids are in ``include`` (e.g. holdings kept from an
+        earlier fetch).
+        """
+        include = set(include)
+        table = cls()
+        for account, positions, errors in records:
+            if not errors or account.id in include:
+                table.add_account(account, positions)
+        return table
+    
+    # Loading
+    
+    def _symbol_code(self, symbol: str, description: str) -> int:
+        code = self._symbol_codes.get(symbol)
+        if code is None:
+            code = self._symbol_codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            self.descriptions.append(description)
+        elif description and not self.descriptions[code]:
+            self.descriptions[code] = description
+        return code
+    
+    def _account_code(self, account: Account) -> int:
+        key = (account.id, account.name)
+        code = self._account_codes.get(key)
+        if code is None:
+            code = self._account_codes[key] = len(self.accounts)
+            self.accounts.append(account)
+        return code
+    
+    def _broker_code(self, broker: str) -> int:
+        code = self._broker_codes.get(broker)
+        if code is None:
+            code = self._broker_codes[broker] = len(self.brokers)
+            self.brokers.append(broker)
+        return code
+    
+    def _currency_code(self, currency: str) -> int:
+        code = self._currency_codes.get(currency)
+        if code is None:
+            code = self._currency_codes[currency] = len(self.currencies)
+            self.currencies.append(currency)
+        return code
+    
+    def _append(self, symbols: np.ndarray, account: Account, quantity: np.ndarray, price: np.ndarray,
+                value: np.ndarray, currencies: np.ndarray, cost: Optional[np.ndarray] = None):
+        rows = len(symbols)
+        self._chunks.append((
+            symbols,
+            np.full(rows, self._account_code(account), dtype=np.int32),
+            np.full(rows, self._broker_code(account.institution), dtype=np.int32),
+            quantity, price, value, symbols, currencies,
+            np.full(rows, NO_COST, dtype=np.int64) if cost is None else cost
+        ))
+        self._columns = None
+    
+    def add_account(self, account: Account, positions: List[Position]):
+        """Add an account's positions
+        
+        A zero average cost is what SnapTrade reports when it has none, so
+        such positions are taken to have no known cost basis.
+        """
+        if not positions:
+            return
+        symbols = np.fromiter(
+            (self._symbol_code(position.symbol, position.description) for position in positions),
+            dtype=np.int32, count=len(positions)
+        )
+        quantity = _fixed([position.quantity for position in positions], QUANTITY_SCALE)
+        price = _fixed([position.price for position in positions], MONEY_SCALE)
+        currencies = np.fromiter(
+            (self._currency_code(position.currency) for position in positions),
+            dtype=np.int32, count=len(positions)
+        )
+        avg_cost = _fixed([position.avg_cost for position in positions], MONEY_SCALE)
+        cost = np.where(avg_cost != 0, _value(quantity, avg_cost), NO_COST)
+        self._append(symbols, account, quantity, price, _value(quantity, price), currencies, cost)
+    
+    def add_rows(self, accounts: List[Account], account_rows: np.ndarray, symbols: List[str],
+                 descriptions: List[str], quantity: np.ndarray, price: np.ndarray, value: np.ndarray,
+                 currencies: List[str], cost: Optional[np.ndarray] = None):
+        """Add positions of several accounts already in fixed-point columns
+        
+        Args:
+            accounts: Accounts the positions are in
+            account_rows: Index into ``accounts`` of each position
+            quantity, price, value: ``QUANTITY_SCALE`` and ``MONEY_SCALE`` amounts
+            cost: ``MONEY_SCALE`` cost basis of each position, ``NO_COST``
+                where unknown (default: all unknown)
+        """
+        rows = len(symbols)
+        if not rows:
+            return
+        account_codes = np.array([self._account_code(account) for account in accounts], dtype=np.int32)
+        broker_codes = np.array([self._broker_code(account.institution) for account in accounts], dtype=np.int32)
+        symbol_codes = np.fromiter(
+            (self._symbol_code(symbol, description) for symbol, description in zip(symbols, descriptions)),
+            dtype=np.int32, count=rows
+        )
+        currency_codes = np.fromiter((self._currency_code(currency) for currency in currencies),
+                                     dtype=np.int32, count=rows)
+        self._chunks.append((
+            symbol_codes, account_codes[account_rows], broker_codes[account_rows],
+            quantity, price, value, symbol_codes, currency_codes,
+            np.full(rows, NO_COST, dtype=np.int64) if cost is None else cost
+        ))
+        self._columns = None
+    
+    def add_position(self, account: Account, symbol: str, description: str, quantity: Decimal,
+                     price: Decimal, value: Optional[Decimal] = None, currency: str = 'USD',
+                     cost: Optional[Decimal] = None):
+        """Add a single position whose value, and total cost basis, may be given"""
+        value = quantity * price if value is None else value
+        self._append(
+            np.array([self._symbol_code(symbol, description)], dtype=np.int32), account,
+            np.array([to_fixed(quantity, QUANTITY_SCALE)], dtype=np.int64),
+            np.array([to_fixed(price, MONEY_SCALE)], dtype=np.int64),
+            np.array([to_fixed(value, MONEY_SCALE)], dtype=np.int64),
+            np.array([self._currency_code(currency)], dtype=np.int32),
+            np.array([NO_COST if cost is None else to_fixed(cost, MONEY_SCALE)], dtype=np.int64)
+        )
+    
+    def columns(self) -> Tuple[np.ndarray, ...]:
+        """(symbol, account, broker, quantity, price, value, original symbol, currency, cost) columns"""
+        if self._columns is None:
+            if self._chunks:
+                self._columns = tuple(np.concatenate(column) for column in zip(*self._chunks))
+            else:
+                self._columns = tuple(np.empty(0, dtype=dtype)
+                                      for dtype in (np.int32,) * 3 + (np.int64,) * 3 + (np.int32,) * 2 + (np.int64,))
+            self._chunks = [self._columns]
+        return self._columns
+    
+    def __len__(self) -> int:
+        return len(self.columns()[0])
+    
+    def held_currencies(self) -> List[str]:
+        """Currencies the positions are in"""
+        return [self.currencies[code] for code in np.unique(self.columns()[7]).tolist()]
+    
+    # Relabeling
+    
+    def relabel(self, mapping: Dict[str, str], descriptions: Optional[Dict[str, str]] = None) -> 'PositionTable':
+        """A copy with symbols renamed or merged, e.g. ``{"GOOG": "GOOG/L", "GOOGL": "GOOG/L"}``
+        
+        Merged symbols are reported as the new symbol's ``components`` by
+        ``by_symbol``. Positions added to the copy later are not relabeled.
+        
+        Args:
+            mapping: Symbol -> the symbol it is counted as
+            descriptions: Descriptions for new symbols (default: that of
+                the first symbol mapped to them)
+        """
+        symbol, account, broker, quantity, price, value, original, currency, cost = self.columns()
+        table = self._copy()
+        
+        remap = np.arange(len(self.symbols), dtype=np.int32)
+        for source, target in mapping.items():
+            if source not in self._symbol_codes or source == target:
+                continue
+            description = (descriptions or {}).get(target) or self.descriptions[self._symbol_codes[source]]
+            remap[self._symbol_codes[source]] = table._symbol_code(target, description)
+        if len(table.symbols) > len(remap):
+            remap = np.concatenate([remap, np.arange(len(remap), len(table.symbols), dtype=np.int32)])
+        
+        table._columns = (remap[symbol], account, broker, quantity, price, value, original, currency, cost)
+        table._chunks = [table._columns]
+        return table
+    
+    def _copy(self) -> 'PositionTable':
+        """An empty table sharing this one's codes"""
+        table = PositionTable()
+        table.symbols = list(self.symbols)
+        table.descriptions = list(self.descriptions)
+        table.accounts = self.accounts
+        table.brokers = self.brokers
+        table.currencies = list(self.currencies)
+        table._symbol_codes = dict(self._symbol_codes)
+        table._account_codes = self._account_codes
+        table._broker_codes = self._broker_codes
+        table._currency_codes = dict(self._currency_codes)
+        return table
+    
+    # Repricing
+    
+    def reprice(self, quotes: Dict[str, Tuple[Decimal, str]]) -> Tuple['PositionTable', int]:
+        """A copy with positions valued at new prices, keeping their quantities
+        
+        Quotes are (price, currency) looked up by the symbol a position was
+        added with (before any ``relabel``), and only reprice positions held
+        in the quote's currency. Other positions keep their price and value.
+        
+        Returns:
+            The repriced table, and the number of positions left as they
+            were because their quote is in another currency
+        """
+        symbol, account, broker, quantity, price, value, original, currency, cost = self.columns()
+        table = self._copy()
+        
+        # Currency code each symbol's quote is in, -1 where there is no quote
+        quote_currencies = np.full(len(self.symbols), -1, dtype=np.int32)
+        new_prices = np.zeros(len(self.symbols), dtype=np.int64)
+        for name, (new_price, quote_currency) in quotes.items():
+            code = self._symbol_codes.get(name)
+            if code is not None:
+                quote_currencies[code] = self._currency_codes.get(quote_currency, len(self.currencies))
+                new_prices[code] = to_fixed(new_price, MONEY_SCALE)
+        
+        quoted = quote_currencies[original] >= 0
+        repriced = quoted & (quote_currencies[original] == currency)
+        price = np.where(repriced, new_prices[original], price)
+        value = np.where(repriced, _value(quantity, price), value)
+        table._columns = (symbol, account, broker, quantity, price, value, original, currency, cost)
+        table._chunks = [table._columns]
+        return table, int(np.count_nonzero(quoted & ~repriced))
+    
+    # Currency conversion
+    
+    def convert(self, rates: Dict[str, Decimal], currency: str) -> 'PositionTable':
+        """A copy with every price, value and cost in ``currency``
+        
+        Rates are applied per currency code, so each position costs one
+        fixed-point multiplication and no lookup. Rates are used to
+        ``QUANTITY_SCALE`` decimal places.
+        
+        Args:
+            rates: Units of ``currency`` per unit of each currency held
+            currency: Currency to convert into
+        
+        Raises:
+            KeyError: If a currency held has no rate
+        """
+        symbol, account, broker, quantity, price, value, original, codes, cost = self.columns()
+        table = self._copy()
+        target = table._currency_code(currency)
+        
+        factors = np.zeros(len(self.currencies), dtype=np.int64)
+        for code in np.unique(codes).tolist():
+            name = self.currencies[code]
+            if name != currency:
+                factors[code] = to_fixed(rates[name], QUANTITY_SCALE)
+        
+        foreign = codes != target if target < len(self.currencies) else np.ones(len(codes), dtype=bool)
+        if foreign.any():
+            factor = factors[codes[foreign]]
+            price = price.copy()
+            value = value.copy()
+            price[foreign] = _value(factor, price[foreign])
+            value[foreign] = _value(factor, value[foreign])
+            costed = foreign & (cost != NO_COST)
+            cost = cost.copy()
+            cost[costed] = _value(factors[codes[costed]], cost[costed])
+        table._columns = (symbol, account, broker, quantity, price, value, original,
+                          np.full(len(codes), target, dtype=np.int32), cost)
+        table._chunks = [table._columns]
+        return table
+    
+    def select_currencies(self, currencies: Iterable[str]) -> 'PositionTable':
+        """A copy with only the positions in ``currencies``"""
+        columns = self.columns()
+        wanted = [self._currency_codes[code] for code in currencies if code in self._currency_codes]
+        keep = np.isin(columns[7], wanted)
+        table = self._copy()
+        table._columns = tuple(column[keep] for column in columns)
+        table._chunks = [table._columns]
+        return table
+    
+    # Aggregation
+    
+    def total_value(self) -> Decimal:
+        """Value of every position"""
+        return from_fixed(int(self.columns()[5].sum()), MONEY_SCALE)
+    
+    def total_gain(self) -> Tuple[Optional[Decimal], Optional[Decimal], int]:
+        """Cost basis and unrealized gain of the positions with a known cost,
+        and the number of positions without one"""
+        columns = self.columns()
+        known, cost, gain = _gains(columns[5], columns[8])
+        costed = int(known.sum())
+        return _optional(cost.sum(), costed), _optional(gain.sum(), costed), len(known) - costed
+    
+    def by_symbol(self) -> List[SymbolTotal]:
+        """Holdings per symbol, largest value first"""
+        symbol, account, broker, quantity, _, value, original, _, cost = self.columns()
+        if not len(symbol):
+            return []
+        groups = len(self.symbols)
+        counts = np.bincount(symbol, minlength=groups)
+        quantities = _group_sum(symbol, quantity, groups)
+        values = _group_sum(symbol, value, groups)
+        known, cost, gain = _gains(value, cost)
+        costed = np.bincount(symbol[known], minlength=groups)
+        costs = _group_sum(symbol, cost, groups)
+        gains = _group_sum(symbol, gain, groups)
+        
+        # Distinct (symbol, broker) and (symbol, account) pairs
+        brokers: Dict[int, List[str]] = {}
+        symbol_codes, broker_codes = _distinct_pairs(symbol, broker, groups, len(self.brokers))
+        for code, broker_code in zip(symbol_codes.tolist(), broker_codes.tolist()):
+            brokers.setdefault(code, []).append(self.brokers[broker_code])
+        account_counts = np.bincount(_distinct_pairs(symbol, account, groups, len(self.accounts))[0], minlength=groups)
+        
+        components: Dict[int, List[Tuple[str, Decimal]]] = {}
+        merged = original != symbol
+        if merged.any():
+            pairs, inverse = np.unique(symbol[merged].astype(np.int64) * groups + original[merged], return_inverse=True)
+            pair_values = _group_sum(inverse, value[merged], len(pairs))
+            # Symbols kept under their own name alongside merged ones are components too
+            for code in np.unique(symbol[merged]):
+                own = value[(symbol == code) & ~merged]
+                if own.size:
+                    components.setdefault(int(code), []).append((self.symbols[code], from_fixed(int(own.sum()), MONEY_SCALE)))
+            for pair, pair_value in zip(pairs, pair_values):
+                components.setdefault(int(pair) // groups, []).append(
+                    (self.symbols[int(pair) % groups], from_fixed(int(pair_value), MONEY_SCALE)))
+        
+        order = np.argsort(-values, kind="stable")
+        order = order[counts[order] > 0]
+        totals = []
+        for code, symbol_quantity, symbol_value, symbol_accounts, symbol_costed, symbol_cost, symbol_gain in zip(
+                order.tolist(), quantities[order].tolist(), values[order].tolist(), account_counts[order].tolist(),
+                costed[order].tolist(), costs[order].tolist(), gains[order].tolist()):
+            totals.append(SymbolTotal(
+                symbol=self.symbols[code],
+                description=self.descriptions[code],
+                quantity=from_fixed(symbol_quantity, QUANTITY_SCALE),
+                value=from_fixed(symbol_value, MONEY_SCALE),
+                brokers=sorted(brokers.get(code, [])),
+                accounts=symbol_accounts,
+                components=sorted(components.get(code, []), key=lambda item: item[1], reverse=True),
+                cost=_optional(symbol_cost, symbol_costed),
+                gain=_optional(symbol_gain, symbol_costed)
+            ))
+        return totals
+    
+    def by_account(self) -> List[AccountTotal]:
+        """Positions per account, accounts by name and positions by value"""
+        symbol, account, _, quantity, price, value, _, _, cost = self.columns()
+        values = _group_sum(account, value, len(self.accounts))
+        known, position_costs, position_gains = _gains(value, cost)
+        costed = np.bincount(account[known], minlength=len(self.accounts))
+        costs = _group_sum(account, position_costs, len(self.accounts))
+        gains = _group_sum(account, position_gains, len(self.accounts))
+        order = np.lexsort((-value, account))
+        starts = np.searchsorted(account[order], np.arange(len(self.accounts) + 1))
+        
+        totals = []
+        for code, acct in enumerate(self.accounts):
+            rows = order[starts[code]:starts[code + 1]]
+            if not rows.size:
+                continue
+            totals.append(AccountTotal(
+                account=acct,
+                value=from_fixed(int(values[code]), MONEY_SCALE),
+                holdings=[
+                    AccountHolding(
+                        symbol=self.symbols[symbol_code],
+                        description=self.descriptions[symbol_code],
+                        quantity=from_fixed(position_quantity, QUANTITY_SCALE),
+                        price=from_fixed(position_price, MONEY_SCALE),
+                        value=from_fixed(position_value, MONEY_SCALE),
+                        cost=_optional(position_cost, position_known),
+                        gain=_optional(position_gain, position_known)
+                    )
+                    for symbol_code, position_quantity, position_price, position_value,
+                    position_known, position_cost, position_gain in zip(
+                        symbol[rows].tolist(), quantity[rows].tolist(), price[rows].tolist(), value[rows].tolist(),
+                        known[rows].tolist(), position_costs[rows].tolist(), position_gains[rows].tolist())
+                ],
+                cost=_optional(costs[code], costed[code]),
+                gain=_optional(gains[code], costed[code])
+            ))
+        return sorted(totals, key=lambda total: total.account.name)
+    
+    def by_broker(self) -> List[BrokerTotal]:
+        """Holdings per broker and symbol, largest broker first"""
+        symbol, _, broker, _, _, value, _, _, cost = self.columns()
+        known, cost, gain = _gains(value, cost)
+        costed = np.bincount(broker[known], minlength=len(self.brokers))
+        costs = _group_sum(broker, cost, len(self.brokers))
+        gains = _group_sum(broker, gain, len(self.brokers))
+        groups = len(self.symbols)
+        pair_codes = broker.astype(np.int64) * groups + symbol
+        pair_values = _group_sum(pair_codes, value, len(self.brokers) * groups)
+        pairs = np.flatnonzero(np.bincount(pair_codes, minlength=len(pair_values)))
+        pairs = pairs[np.argsort(-pair_values[pairs], kind="stable")]
+        
+        holdings: Dict[int, List[Tuple[str, Decimal]]] = {}
+        for pair, pair_value in zip(pairs.tolist(), pair_values[pairs].tolist()):
+            holdings.setdefault(pair // groups, []).append((self.symbols[pair % groups], from_fixed(pair_value, MONEY_SCALE)))
+        
+        totals = [
+            BrokerTotal(self.brokers[code], sum((item[1] for item in items), Decimal(0)), items,
+                        _optional(costs[code], costed[code]), _optional(gains[code], costed[code]))
+            for code, items in holdings.items()
+        ]
+        return sorted(totals, key=lambda total: total.value, reverse=True)
@@ -0,0 +1,252 @@
+"""Content-addressed archive of raw sync payloads
+
+Each sync is stored as a small manifest that points at compressed,
+content-addressed blobs: one per account record (``info``, ``balances``,
+``positions`` exactly as ``SnapTradeClient.sync_all_data`` produced them),
+plus the connections, sync state and the list of account hashes. A blob is
+written only the first time its content is seen, so a sync in which nothing
+changed costs just its manifest, and any past sync can be rebuilt from its
+manifest alone.
+
+Blobs are compressed with zstd when the ``zstandard`` package is installed
+and with gzip otherwise; both can be read back either way.
+
+Layout under ``Config.ARCHIVE_DIR``::
+
+    objects/ab/cdef....json.zst|.json.gz
+    manifests/2026-02-09T143000.123456.json
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .config import Config
+from .storage import atomic_write
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+MANIFEST_VERSION = 1
+
+
+def canonical_json(value: Any) -> bytes:
+    """Deterministic JSON encoding used for hashing"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+def content_hash(value: Any) -> str:
+    """SHA-256 of a value's canonical JSON encoding"""
+    return hashlib.sha256(canonical_json(value)).hexdigest()
+
+
+class SnapshotArchive:
+    """Deduplicated, compressed history of sync payloads"""
+    
+    CODECS = (".json.zst", ".json.gz")
+    
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or Config.ARCHIVE_DIR)
+        self.objects_dir = self.root / "objects"
+        self.manifests_dir = self.root / "manifests"
+        self.bytes_written = 0
+        self.objects_written = 0
+    
+    # Blobs
+    
+    def _object_path(self, digest: str, suffix: str) -> Path:
+        return self.objects_dir / digest[:2] / (digest[2:] + suffix)
+    
+    def _existing(self, digest: str) -> Optional[Path]:
+        for suffix in self.CODECS:
+            path = self._object_path(digest, suffix)
+            if path.exists():
+                return path
+        return None
+    
+    def has(self, digest: str) -> bool:
+        return self._existing(digest) is not None
+    
+    def put(self, value: Any) -> str:
+        """Store a JSON value once and return its hash"""
+        data = canonical_json(value)
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self._existing(digest)
+        if existing is not None:
+            # Reused blobs count as new for garbage collection, so a
+            # concurrent ``collect_garbage`` leaves them for this manifest
+            try:
+                os.utime(existing)
+            except FileNotFoundError:
+                pass
+            else:
+                return digest
+        
+        if zstandard is not None:
+            suffix, compressed = ".json.zst", zstandard.ZstdCompressor(level=10).compress(data)
+        else:
+            suffix, compressed = ".json.gz", gzip.compress(data, compresslevel=9, mtime=0)
+        
+        atomic_write(self._object_path(digest, suffix), compressed)
+        self.bytes_written += len(compressed)
+        self.objects_written += 1
+        return digest
+    
+    def get(self, digest: str) -> Any:
+        """Load the JSON value stored under ``digest``
+        
+        Raises:
+            KeyError: If no such blob exists
+            RuntimeError: If the blob is zstd-compressed but zstandard is missing
+        """
+        path = self._object_path(digest, ".json.zst")
+        if path.exists():
+            if zstandard is None:
+                raise RuntimeError(f"Blob {digest} is zstd-compressed; install zstandard to read it")
+            with open(path, "rb") as f:
+                return json.loads(zstandard.ZstdDecompressor().decompress(f.read()))
+        
+        path = self._object_path(digest, ".json.gz")
+        if path.exists():
+            with gzip.open(path, "rb") as f:
+                return json.loads(f.read())
+        
+        raise KeyError(f"Unknown archive object: {digest}")
+    
+    # Manifests
+    
+    @staticmethod
+    def snapshot_id(synced_at: str) -> str:
+        """Sortable, filename-safe id for a sync timestamp"""
+        return synced_at.replace(":", "")
+    
+    def add(self, portfolio_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Archive a sync result and write its manifest
+        
+        Returns:
+            Tuple of (snapshot id, manifest)
+        """
+        account_hashes = []
+        for record in portfolio_data.get("accounts", []):
+            info = record.get("info", {})
+            account_id = info.get("id") if isinstance(info, dict) else None
+            account_hashes.append([account_id, self.put(record)])
+        
+        synced_at = str(portfolio_data.get("synced_at"))
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "synced_at": synced_at,
+            "user": self.put(portfolio_data.get("user", {})),
+            "connections": self.put(portfolio_data.get("connections", [])),
+            "sync_state": self.put(portfolio_data.get("sync_state", {})),
+            "accounts": self.put(account_hashes)
+        }
+        
+        snapshot_id = self.snapshot_id(synced_at)
+        data = json.dumps(manifest, indent=1).encode()
+        atomic_write(self.manifests_dir / f"{snapshot_id}.json", data)
+        self.bytes_written += len(data)
+        return snapshot_id, manifest
+    
+    def list(self) -> List[str]:
+        """Ids of all archived snapshots, oldest first"""
+        if not self.manifests_dir.exists():
+            return []
+        return sorted(path.stem for path in self.manifests_dir.glob("*.json"))
+    
+    def resolve(self, ref: str) -> Optional[str]:
+        """Snapshot id for ``ref``: an exact id, ``latest``, or the newest id starting with ``ref``"""
+        ids = self.list()
+        if ref == "latest":
+            return ids[-1] if ids else None
+        ref = self.snapshot_id(ref)
+        if ref in ids:
+            return ref
+        matches = [snapshot_id for snapshot_id in ids if snapshot_id.startswith(ref)]
+        return matches[-1] if matches else None
+    
+    def manifest(self, snapshot_id: str) -> Dict[str, Any]:
+        """Load a snapshot's manifest
+        
+        Raises:
+            KeyError: If the snapshot does not exist
+        """
+        path = self.manifests_dir / f"{snapshot_id}.json"
+        if not path.exists():
+            raise KeyError(f"Unknown snapshot: {snapshot_id}")
+        with open(path, "r") as f:
+            return json.load(f)
+    
+    def account_hashes(self, snapshot_id: str) -> List[Tuple[Optional[str], str]]:
+        """(account id, record hash) pairs of a snapshot, in sync order"""
+        return [tuple(pair) for pair in self.get(self.manifest(snapshot_id)["accounts"])]
+    
+    def delete(self, snapshot_id: str):
+        """Remove a snapshot's manifest; its blobs go with the next ``collect_garbage``"""
+        path = self.manifests_dir / f"{snapshot_id}.json"
+        if path.exists():
+            path.unlink()
+    
+    def referenced_objects(self) -> Set[str]:
+        """Hashes of every blob some manifest still needs"""
+        referenced = set()
+        for snapshot_id in self.list():
+            try:
+                manifest = self.manifest(snapshot_id)
+            except KeyError:
+                # Deleted since it was listed
+                continue
+            referenced.update(manifest[key] for key in ("user", "connections", "sync_state", "accounts"))
+            referenced.update(digest for _, digest in self.get(manifest["accounts"]))
+        return referenced
+    
+    def collect_garbage(self, grace: float) -> Tuple[int, int]:
+        """Delete blobs no manifest refers to
+        
+        Blobs written or reused within the last ``grace`` seconds are kept
+        even when unreferenced, since a sync running concurrently may not
+        have written the manifest that needs them yet.
+        
+        Returns:
+            Tuple of (blobs deleted, bytes freed)
+        """
+        if not self.objects_dir.exists():
+            return 0, 0
+        
+        referenced = self.referenced_objects()
+        cutoff = time.time() - grace
+        deleted = freed = 0
+        for directory in os.scandir(self.objects_dir):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                digest = directory.name + entry.name.split(".", 1)[0]
+                if digest in referenced:
+                    continue
+                try:
+                    stat = entry.stat()
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                deleted += 1
+                freed += stat.st_size
+        return deleted, freed
+    
+    def load(self, snapshot_id: str) -> Dict[str, Any]:
+        """Rebuild the full sync result of an archived snapshot"""
+        manifest = self.manifest(snapshot_id)
+        return {
+            "user": self.get(manifest["user"]),
+            "connections": self.get(manifest["connections"]),
+            "accounts": [self.get(digest) for _, digest in self.account_hashes(snapshot_id)],
+            "sync_state": self.get(manifest["sync_state"]),
+            "synced_at": manifest["synced_at"]
+        }
@@ -0,0 +1,156 @@
+"""Local portfolio cache shared by every command
+
+``PortfolioCache`` is the one way commands read what fenn keeps locally:
+
+- ``holdings()``: per-account holdings with freshness (``fenn portfolio``,
+  ``fenn plot``, ``portfolio.py``), seeded from the latest sync when that
+  is newer than the latest holdings fetch
+- ``status_summary()``: the compact summary of the latest sync
+  (``fenn status``), rebuilt from ``portfolio.json`` and written back when
+  it is missing or out of date
+
+Everything is parsed into ``Account``/``Position`` records with ``Decimal``
+amounts when it is written, so readers never convert types themselves.
+Files from older versions of fenn are upgraded on open: the snapshot
+store migrates its schema, and a ``portfolio.json`` or
+``holdings_cache.json`` written before snapshots existed is imported once.
+"""
+import json
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .config import Config
+from .holdings import HoldingsCache
+from .models import Account, Position
+from .store import AccountRecord, SnapshotStore
+from .summary import build_summary, load_summary, source_stamp, summarize_sync, write_summary
+
+
+class PortfolioCache:
+    """Read access to synced and fetched portfolio data
+    
+    Args:
+        data_dir: Directory holding fenn's files; defaults to ``Config.DATA_DIR``
+    """
+    
+    def __init__(self, data_dir: Optional[Path] = None):
+        data_dir = Path(data_dir) if data_dir else None
+        self.portfolio_file = data_dir / Config.PORTFOLIO_DB.name if data_dir else Config.PORTFOLIO_DB
+        self.summary_file = data_dir / Config.SUMMARY_FILE.name if data_dir else Config.SUMMARY_FILE
+        self.legacy_holdings_file = (data_dir or Config.DATA_DIR) / "holdings_cache.json"
+        
+        (data_dir or Config.DATA_DIR).mkdir(parents=True, exist_ok=True)
+        self.store = SnapshotStore(data_dir / Config.SNAPSHOT_DB.name if data_dir else None)
+        self._import_legacy_files()
+    
+    def close(self):
+        self.store.close()
+    
+    def __enter__(self) -> 'PortfolioCache':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    # Upgrades
+    
+    def _import_legacy_files(self):
+        """Import data written before the snapshot store existed"""
+        if self.store.latest_snapshot("sync") is None and self.portfolio_file.exists():
+            try:
+                with open(self.portfolio_file, "r") as f:
+                    self.store.add_sync(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                pass
+        
+        if self.legacy_holdings_file.exists():
+            if self.store.latest_snapshot("holdings") is None:
+                try:
+                    with open(self.legacy_holdings_file, "r") as f:
+                        cached = json.load(f)
+                    records = _legacy_holdings_records(cached)
+                    if records:
+                        self.store.add_snapshot("holdings", records, taken_at=cached["cached_at"])
+                except (OSError, json.JSONDecodeError, KeyError, ValueError):
+                    pass
+            # Keep the original, but never import it again
+            self.legacy_holdings_file.rename(self.legacy_holdings_file.with_name("holdings_cache.json.imported"))
+    
+    # Holdings
+    
+    def holdings(self, max_age: Optional[float] = None, max_stale: Optional[float] = None) -> HoldingsCache:
+        """Per-account holdings with their freshness; see ``HoldingsCache``"""
+        return HoldingsCache(self.store, max_age=max_age, max_stale=max_stale)
+    
+    # Sync summary
+    
+    def status_summary(self, top_n: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Summary of the latest sync, or None if there has been none"""
+        summary = load_summary(self.summary_file, self.portfolio_file)
+        if summary is not None:
+            return summary
+        
+        top_n = Config.STATUS_POSITIONS if top_n is None else top_n
+        
+        # Rebuild from portfolio.json itself: it need not hold the store's
+        # latest sync (written some other way, or the store write failed)
+        stamp = source_stamp(self.portfolio_file)
+        if stamp is not None:
+            try:
+                with open(self.portfolio_file, "r") as f:
+                    portfolio_data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                portfolio_data = None
+            if isinstance(portfolio_data, dict):
+                summary = summarize_sync(portfolio_data, top_n)
+                try:
+                    write_summary(summary, self.summary_file, self.portfolio_file, stamp)
+                except OSError:
+                    pass
+                return summary
+        
+        # No readable portfolio.json: summarize the store's latest sync, but
+        # do not record it as a summary of the file
+        snapshot = self.store.latest_snapshot("sync")
+        if snapshot is None:
+            return None
+        
+        position_counts = self.store.position_counts(snapshot["id"])
+        first_positions = self.store.positions(snapshot["id"], limit_per_account=top_n)
+        return build_summary(
+            snapshot["taken_at"],
+            snapshot["connection_count"],
+            ((account, position_counts.get(account.id, 0), first_positions.get(account.id, []), bool(errors))
+             for account, errors in self.store.accounts(snapshot["id"]))
+        )
+
+
+def _legacy_holdings_records(cached: Dict[str, Any]) -> List[AccountRecord]:
+    """Account records from an old ``holdings_cache.json`` (symbol-aggregated, with floats)"""
+    accounts: Dict[str, Account] = {}
+    positions: Dict[str, List[Position]] = {}
+    
+    for symbol, holding in cached.get("holdings", {}).items():
+        brokers = holding.get("brokers") or []
+        for entry in holding.get("accounts", []):
+            account_id = entry.get("account_id")
+            if not account_id or entry.get("manual"):
+                continue
+            if account_id not in accounts:
+                accounts[account_id] = Account(
+                    account_id,
+                    entry.get("account_name") or "Unknown Account",
+                    brokers[0] if len(brokers) == 1 else "Unknown"
+                )
+                positions[account_id] = []
+            positions[account_id].append(Position(
+                symbol=symbol,
+                description=holding.get("description", ""),
+                quantity=Decimal(str(entry.get("quantity", 0))),
+                price=Decimal(str(entry.get("price", 0))),
+                avg_cost=Decimal(str(entry.get("avg_cost", 0))),
+                currency=holding.get("currency", "USD")
+            ))
+    
+    return [(account, positions[account_id], None) for account_id, account in accounts.items()]
@@ -1,11 +1,29 @@
 """Command-line interface for Fenn"""
 import json
+import sqlite3
 import click
-from datetime import datetime
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
+from .aggregate import PositionTable
+from .archive import SnapshotArchive
+from .cache import PortfolioCache
 from .config import Config
+from .diff import diff_snapshots
+from .fx import FxRates
+from .holdings import parse_duration, spawn_refresh
+from .manual import ManualHoldings, ManualTotals, holding_entry, read_entries
+from .quotes import open_provider
 from .snaptrade_client import SnapTradeClient
+from .storage import atomic_open, file_lock, lock_file
+from .store import SnapshotStore
+from .symbols import SymbolRules
+from .summary import load_summary
+from .sync import save_sync
+from .timeseries import TimeSeriesIndex
+from .sync_writer import SyncWriter
+from .watch import Watcher
 
 
 @click.group()
@@ -19,38 +37,104 @@ def cli():
 
 
 @cli.command()
-def sync():
-    """Download and sync portfolio data from all connected brokers"""
+@click.option('--workers', '-j', type=int, default=None,
+              help='Maximum concurrent API requests (default: FENN_SYNC_MAX_WORKERS or 8)')
+@click.option('--incremental', '-i', is_flag=True,
+              help='Only refetch accounts the brokerage has refreshed since the last sync')
+@click.option('--timeout', type=float, default=None,
+              help='Seconds to wait for each API request (default: FENN_API_CALL_TIMEOUT or 30, 0 disables)')
+@click.option('--deadline', type=float, default=None,
+              help='Seconds after which the sync saves whatever it has (default: FENN_SYNC_DEADLINE, 0 disables)')
+@click.option('--hedge', is_flag=True,
+              help='Race slow position requests against the holdings endpoint')
+@click.option('--resume', is_flag=True,
+              help='Continue an interrupted sync, reusing the accounts it already fetched')
+def sync(workers, incremental, timeout, deadline, hedge, resume):
+    """Download and sync portfolio data from all connected brokers
+    
+    Each account is checkpointed to portfolio.json.journal as soon as it is
+    fetched, and portfolio.json is replaced atomically once the sync is
+    complete. An interrupted sync can be continued with --resume.
+    
+    Only one sync runs at a time. A sync started while another is running
+    waits for it and then shows its result instead of fetching again.
+    
+    Call counts, latencies, retries and response sizes per endpoint, and the
+    time spent in each stage, are written to sync_metrics.json and
+    sync_metrics.prom next to portfolio.json.
+    """
+    client = None
+    writer = None
+    sync_status = "error"
+    locks = ExitStack()
     try:
         Config.ensure_data_dir()
         
+        # One sync at a time; one that had to wait reuses the result of the one it waited for
+        started = datetime.utcnow().isoformat()
+        waited = locks.enter_context(file_lock(
+            lock_file(Config.DATA_DIR, "sync"),
+            on_wait=lambda: click.echo("Waiting for another sync to finish...")
+        ))
+        if waited and not resume:
+            summary = load_summary(Config.SUMMARY_FILE, Config.PORTFOLIO_DB)
+            if summary is not None and summary["synced_at"] >= started:
+                print(f"✓ Another sync just finished at {summary['synced_at']}, using its result")
+                _print_sync_summary(summary)
+                return
+        
         # Initialize SnapTrade client
         client = SnapTradeClient()
+        if timeout is not None:
+            client.resilience.timeout = timeout
+        if hedge:
+            client.hedge_positions = True
+        
+        # Load the previous sync to carry unchanged accounts forward
+        previous = None
+        if incremental and Config.PORTFOLIO_DB.exists():
+            try:
+                with client.metrics.stage("load_previous"), open(Config.PORTFOLIO_DB, 'r') as f:
+                    previous = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                click.echo(f"Warning: Could not read previous sync, doing a full sync: {e}")
+        
+        # Pick up the checkpoint of an interrupted sync, or start afresh
+        output_file = Config.PORTFOLIO_DB
+        writer = SyncWriter(output_file)
+        checkpoint = None
+        if resume:
+            checkpoint = writer.checkpoint()
+            if checkpoint is None:
+                click.echo("No interrupted sync to resume, doing a full sync")
+            else:
+                click.echo(f"Resuming interrupted sync ({len(checkpoint)} account(s) already fetched)")
+        else:
+            if writer.journal_path.exists():
+                click.echo("Discarding an interrupted sync (use --resume to continue it)")
+            writer.discard()
         
-        # Sync all data
-        portfolio_data = client.sync_all_data()
+        # Sync all data, journaling each account as it completes
+        portfolio_data = client.sync_all_data(max_workers=workers, previous=previous, deadline=deadline,
+                                              writer=writer, checkpoint=checkpoint)
         
         # Add timestamp
         portfolio_data["synced_at"] = datetime.utcnow().isoformat()
         
-        # Save to file
-        output_file = Config.PORTFOLIO_DB
-        with open(output_file, 'w') as f:
-            json.dump(portfolio_data, f, indent=2, default=str)
+        # Save to file, the snapshot store and the archive
+        saved = save_sync(portfolio_data, writer, client.metrics)
+        sync_status = "ok"
         
         print(f"\n✓ Portfolio data saved to {output_file}")
+        print(f"✓ Archived snapshot {saved.snapshot_id} "
+              f"({saved.objects_written} new object(s), {saved.bytes_written:,} bytes)")
         
-        # Display summary
-        total_accounts = len(portfolio_data.get("accounts", []))
-        print(f"\n📊 Summary:")
-        print(f"  Accounts: {total_accounts}")
-        
-        for account in portfolio_data.get("accounts", []):
-            account_info = account.get("info", {})
-            account_name = account_info.get("name", "Unknown")
-            positions = account.get("positions", [])
-            print(f"  - {account_name}: {len(positions)} position(s)")
-        
+        _print_sync_summary(saved.summary)
+        writer.discard()
+    
+    except KeyboardInterrupt:
+        click.echo("\n⚠️  Sync interrupted. Run 'fenn sync --resume' to continue where it stopped.", err=True)
+        raise click.Abort()
     except ValueError as e:
         click.echo(f"❌ Configuration error: {e}", err=True)
         click.echo("\nTo get started:", err=True)
@@ -61,65 +145,164 @@ def sync():
     except Exception as e:
         click.echo(f"❌ Error: {e}", err=True)
         raise click.Abort()
+    finally:
+        if writer is not None:
+            writer.close()
+        if client is not None:
+            try:
+                client.metrics.write(Config.METRICS_FILE, Config.METRICS_PROM_FILE, status=sync_status)
+            except OSError as e:
+                click.echo(f"Warning: Could not write sync metrics: {e}", err=True)
+        locks.close()
+
+
+def _print_sync_summary(summary):
+    """Display the summary of a sync"""
+    print(f"\n📊 Summary:")
+    print(f"  Accounts: {summary['totals']['accounts']}")
+    
+    for account in summary["accounts"]:
+        incomplete = " (incomplete, see errors)" if account["incomplete"] else ""
+        print(f"  - {account['name']}: {account['position_count']} position(s){incomplete}")
+
 
 
 @cli.command()
-def status():
-    """Show current portfolio status from local archive"""
+@click.option('--interval', default=None,
+              help='How often to sync each connection, e.g. 30m or 6h (default: FENN_WATCH_INTERVAL or 1h)')
+@click.option('--every', 'every', multiple=True, metavar='CONNECTION=INTERVAL',
+              help='Interval for one connection, by id or brokerage name (repeatable)')
+@click.option('--jitter', default=None,
+              help='Random delay added to every scheduled sync, e.g. 5m (default: FENN_WATCH_JITTER or 5m)')
+@click.option('--incremental', '-i', is_flag=True,
+              help='Only refetch accounts the brokerage has refreshed since the last sync')
+@click.option('--workers', '-j', type=int, default=None,
+              help='Maximum concurrent API requests (default: FENN_SYNC_MAX_WORKERS or 8)')
+@click.option('--timeout', type=float, default=None,
+              help='Seconds to wait for each API request (default: FENN_API_CALL_TIMEOUT or 30, 0 disables)')
+@click.option('--deadline', type=float, default=None,
+              help='Seconds after which a sync saves whatever it has (default: FENN_SYNC_DEADLINE, 0 disables)')
+def watch(interval, every, jitter, incremental, workers, timeout, deadline):
+    """Keep syncing in the background on a schedule
+    
+    Runs until stopped, syncing each brokerage connection every --interval
+    (plus a random --jitter) with one warm API client. Connections that come
+    due together are synced in one run, which refetches only their accounts
+    and saves the result like `fenn sync`.
+    
+    Stop with SIGTERM or Ctrl-C (the running sync is saved first); send
+    SIGUSR1 to sync every connection now. The daemon's state and last run
+    are written to watch_status.json.
+    """
+    try:
+        interval = parse_duration(interval) if interval is not None else Config.WATCH_INTERVAL
+        jitter = parse_duration(jitter) if jitter is not None else Config.WATCH_JITTER
+        intervals = {}
+        for entry in every:
+            connection, sep, duration = entry.rpartition("=")
+            if not sep or not connection:
+                raise ValueError(f"Expected CONNECTION=INTERVAL, got {entry!r}")
+            intervals[connection.strip()] = parse_duration(duration)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    
+    def log(message):
+        click.echo(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {message}")
+    
     try:
-        data_file = Config.PORTFOLIO_DB
+        client = SnapTradeClient()
+        if timeout is not None:
+            client.resilience.timeout = timeout
         
-        if not data_file.exists():
-            click.echo("No portfolio data found. Run 'fenn sync' first.")
-            return
+        watcher = Watcher(
+            client,
+            interval=interval,
+            intervals=intervals,
+            jitter=jitter,
+            coalesce=Config.WATCH_COALESCE,
+            retry_delay=Config.WATCH_RETRY_DELAY,
+            incremental=incremental,
+            max_workers=workers,
+            deadline=deadline,
+            log=log
+        )
+        watcher.run()
+        log("Stopped")
+    
+    except KeyboardInterrupt:
+        click.echo("\n⚠️  Sync interrupted. Run 'fenn sync --resume' to continue where it stopped.", err=True)
+        raise click.Abort()
+    except ValueError as e:
+        click.echo(f"❌ Configuration error: {e}", err=True)
+        raise click.Abort()
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        raise click.Abort()
+
+
+@cli.command()
+def status():
+    """Show current portfolio status from local archive
+    
+    Reads the summary written by the last sync, rebuilding it from the
+    snapshot store when it is missing or older than portfolio.json.
+    """
+    try:
+        from decimal import Decimal
         
-        with open(data_file, 'r') as f:
-            data = json.load(f)
+        summary = load_summary(Config.SUMMARY_FILE, Config.PORTFOLIO_DB)
         
-        synced_at = data.get("synced_at", "Unknown")
-        accounts = data.get("accounts", [])
-        connections = data.get("connections", [])
+        if summary is None:
+            if not Config.SNAPSHOT_DB.exists() and not Config.PORTFOLIO_DB.exists():
+                click.echo("No portfolio data found. Run 'fenn sync' first.")
+                return
+            
+            with PortfolioCache() as cache:
+                summary = cache.status_summary()
+            
+            if summary is None:
+                click.echo("No portfolio data found. Run 'fenn sync' first.")
+                return
         
         click.echo(f"📊 Portfolio Status")
-        click.echo(f"Last synced: {synced_at}")
-        click.echo(f"Connections: {len(connections)}")
-        click.echo(f"Accounts: {len(accounts)}")
+        click.echo(f"Last synced: {summary['synced_at']}")
+        click.echo(f"Connections: {summary['connection_count']}")
+        click.echo(f"Accounts: {len(summary['accounts'])}")
         click.echo()
         
-        for account in accounts:
-            account_info = account.get("info", {})
-            account_name = account_info.get("name", "Unknown")
-            positions = account.get("positions", [])
+        for account in summary["accounts"]:
+            position_count = account["position_count"]
             
-            click.echo(f"Account: {account_name}")
+            click.echo(f"Account: {account['name']}")
             
-            # Show balance - check both locations
-            balance_info = account_info.get("balance", {})
-            if balance_info:
-                total = balance_info.get("total", {})
-                if isinstance(total, dict) and total.get("amount") is not None:
-                    amount = total.get("amount", 0)
-                    currency = total.get("currency", "USD")
-                    click.echo(f"  Balance: ${amount:,.2f} {currency}")
+            # Show balance
+            balance = account["balance"]
+            if balance is not None:
+                sign = "$" if balance['currency'] == "USD" else ""
+                click.echo(f"  Balance: {sign}{Decimal(balance['amount']):,.2f} {balance['currency']}")
             
-            click.echo(f"  Positions: {len(positions)}")
+            click.echo(f"  Positions: {position_count}")
             
-            # Show positions
-            for position in positions[:5]:  # Show first 5
-                if isinstance(position, dict):
-                    symbol_info = position.get("symbol", {})
-                    if isinstance(symbol_info, dict):
-                        symbol = symbol_info.get("symbol", "Unknown")
-                    else:
-                        symbol = str(symbol_info)
-                    
-                    quantity = position.get("quantity", 0)
-                    click.echo(f"    - {symbol}: {quantity}")
+            # Show the first few positions
+            for position in account["positions"]:
+                click.echo(f"    - {position['symbol']}: {position['quantity']}")
             
-            if len(positions) > 5:
-                click.echo(f"    ... and {len(positions) - 5} more")
+            if position_count > len(account["positions"]):
+                click.echo(f"    ... and {position_count - len(account['positions'])} more")
             
             click.echo()
+        
+        # Balances are reported per currency; total them in the base currency
+        balances = {currency: Decimal(amount) for currency, amount in summary["totals"]["balances"].items()}
+        if balances:
+            base = Config.BASE_CURRENCY
+            try:
+                rates, day = FxRates().conversion(balances, base)
+                total = sum((amount * rates[currency] for currency, amount in balances.items()), Decimal(0))
+                click.echo(f"Total balance: {total:,.2f} {base}" + (f" (at rates of {day})" if day else ""))
+            except KeyError as e:
+                click.echo("Total balance: " + ", ".join(f"{amount:,.2f} {currency}" for currency, amount in sorted(balances.items())))
+                click.echo(f"  ⚠️  {e.args[0]}")
             
     except Exception as e:
         click.echo(f"❌ Error reading portfolio data: {e}", err=True)
@@ -128,22 +311,37 @@ def status():
 
 @cli.command()
 @click.option('--output', '-o', type=click.Path(), help='Output file path')
-def export(output):
+@click.option('--snapshot', '-s', help="Export an archived sync: its id, a timestamp prefix, or 'latest'")
+@click.option('--list', 'list_snapshots', is_flag=True, help='List archived syncs and exit')
+def export(output, snapshot, list_snapshots):
     """Export portfolio data to JSON"""
     try:
-        data_file = Config.PORTFOLIO_DB
-        
-        if not data_file.exists():
-            click.echo("No portfolio data found. Run 'fenn sync' first.")
+        if list_snapshots:
+            for snapshot_id in SnapshotArchive().list():
+                click.echo(snapshot_id)
             return
         
+        if snapshot:
+            archive = SnapshotArchive()
+            snapshot_id = archive.resolve(snapshot)
+            if snapshot_id is None:
+                click.echo(f"No archived sync matches '{snapshot}'. Use --list to see them.")
+                return
+            data = archive.load(snapshot_id)
+        else:
+            data_file = Config.PORTFOLIO_DB
+            
+            if not data_file.exists():
+                click.echo("No portfolio data found. Run 'fenn sync' first.")
+                return
+            
+            with open(data_file, 'r') as f:
+                data = json.load(f)
+        
         if not output:
             output = f"portfolio_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-        
-        with open(output, 'w') as f:
+        with atomic_open(output) as f:
             json.dump(data, f, indent=2, default=str)
         
         click.echo(f"✓ Portfolio data exported to {output}")
@@ -153,307 +351,696 @@ def export(output):
         raise click.Abort()
 
 
-def main():
-    """Entry point for the CLI"""
-    cli()
-
-
 @cli.command()
-@click.option('--by-account', '-a', is_flag=True, help='Group holdings by account')
-@click.option('--refresh', '-r', is_flag=True, help='Fetch latest data from brokerages')
-def portfolio(by_account, refresh):
-    """Show aggregated portfolio holdings across all accounts"""
+@click.argument('ref')
+@click.option('--last', '-n', default=20, help='Number of most recent syncs to show (0 for all)')
+@click.option('--by-account', '-a', is_flag=True, help='Show each account separately (symbols only)')
+@click.option('--rebuild', is_flag=True, help='Rebuild the history index from the snapshot store first')
+@click.option('--currency', '-c', help='Currency to total symbol values in (default FENN_BASE_CURRENCY)')
+def history(ref, last, by_account, rebuild, currency):
+    """Show a symbol's or an account's history across syncs
+    
+    REF is a symbol (e.g. VOO) or an account id or name. A symbol's totals
+    are converted to --currency at the exchange rates of each sync's date.
+    """
+    currency = (currency or Config.BASE_CURRENCY).upper()
     try:
-        from collections import defaultdict
+        from collections import OrderedDict
         from decimal import Decimal
-        from datetime import date
+        from .timeseries import MONEY_SCALE, QUANTITY_SCALE, from_fixed, from_micros
         
-        client = SnapTradeClient()
-        Config.ensure_data_dir()
+        index = TimeSeriesIndex()
         
-        # Check cache
-        holdings_cache_path = Config.DATA_DIR / 'holdings_cache.json'
-        use_cache = False
-        cached_data = None
+        # Catch up on syncs the index has not seen (e.g. from before it existed)
+        if Config.SNAPSHOT_DB.exists():
+            with SnapshotStore() as store:
+                count = index.rebuild(store) if rebuild else index.update(store)
+            if count:
+                click.echo(f"Indexed {count} sync(s)")
         
-        if not refresh and holdings_cache_path.exists():
-            try:
-                with open(holdings_cache_path, 'r') as f:
-                    cached_data = json.load(f)
-                    cache_date = datetime.fromisoformat(cached_data.get('cached_at', '')).date()
-                    if cache_date == date.today():
-                        use_cache = True
-                        click.echo("Using cached holdings from today...")
-            except (json.JSONDecodeError, ValueError, KeyError):
-                pass
-        
-        if use_cache:
-            aggregated = {k: {**v, 'total_quantity': Decimal(str(v['total_quantity'])), 
-                              'total_value': Decimal(str(v['total_value'])),
-                              'brokers': set(v.get('brokers', []))}
-                          for k, v in cached_data['holdings'].items()}
-            total_portfolio_value = Decimal(str(cached_data['total_value']))
-            accounts_with_errors = cached_data.get('errors', [])
-        else:
-            if refresh:
-                click.echo("Fetching latest holdings from brokerages...")
-            else:
-                click.echo("Fetching holdings from all accounts...")
+        if index.last_indexed is None:
+            click.echo("No history found. Run 'fenn sync' first.")
+            return
+        
+        symbol = index.find_symbol(ref)
+        account = None if symbol else index.find_account(ref)
         
-            # Get all accounts
-            accounts = client.get_all_accounts()
+        if symbol:
+            columns = index.symbol_history(symbol, last=last)
+            rows = zip(*(columns[name] for name in ('time', 'account', 'quantity', 'price', 'value')))
             
-            if not accounts:
-                click.echo("No accounts found")
-                return
+            click.echo(f"{symbol} history")
+            click.echo("=" * 100)
+            if by_account:
+                # Each account's rows are in its own currency
+                click.echo(f"{'Synced at':<20} {'Account':<30} {'Quantity':>15} {'Price':>12} {'Value':>15}")
+                click.echo("=" * 100)
+                for time, account_index, quantity, price, value in rows:
+                    code = index.account_currency(account_index)
+                    sign = "$" if code == "USD" else " "
+                    click.echo(f"{from_micros(time):%Y-%m-%d %H:%M:%S} {index.account_name(account_index)[:30]:<30} "
+                               f"{float(from_fixed(quantity, QUANTITY_SCALE)):>15.6f} "
+                               f"{sign}{float(from_fixed(price, MONEY_SCALE)):>11,.2f} "
+                               f"{sign}{float(from_fixed(value, MONEY_SCALE)):>14,.2f} {code}")
+            else:
+                # Sum each sync's rows across accounts, per currency
+                totals = OrderedDict()
+                for time, account_index, quantity, price, value in rows:
+                    total = totals.setdefault(time, {}).setdefault(index.account_currency(account_index), [0, 0, set()])
+                    total[0] += quantity
+                    total[1] += value
+                    total[2].add(account_index)
+                
+                # Convert each sync's sums at the rates of its date; currencies
+                # without a rate get a row of their own
+                fx = FxRates()
+                lines = []
+                missing_pairs = set()
+                for time, by_currency in totals.items():
+                    rates, _, missing = fx.partial_conversion(
+                        [code for code in by_currency if code != currency], currency, on=from_micros(time).date())
+                    rates[currency] = Decimal(1)
+                    missing_pairs.update(missing)
+                    
+                    converted = [Decimal(0), Decimal(0), set()]
+                    for code, (quantity, value, accounts) in by_currency.items():
+                        if code in rates:
+                            converted[0] += from_fixed(quantity, QUANTITY_SCALE)
+                            converted[1] += from_fixed(value, MONEY_SCALE) * rates[code]
+                            converted[2] |= accounts
+                    if converted[2]:
+                        lines.append((time, *converted, currency))
+                    for code in missing:
+                        quantity, value, accounts = by_currency[code]
+                        lines.append((time, from_fixed(quantity, QUANTITY_SCALE), from_fixed(value, MONEY_SCALE),
+                                      accounts, code))
+                
+                if missing_pairs:
+                    click.echo(f"⚠️  No exchange rate for {', '.join(f'{code}/{currency}' for code in sorted(missing_pairs))}; "
+                               f"run 'fenn fx update'. Those rows are shown in their own currency.")
+                if currency != "USD" or missing_pairs:
+                    click.echo(f"Values in {currency}")
+                click.echo(f"{'Synced at':<20} {'Quantity':>15} {'Price':>12} {'Value':>15} {'Accounts':>9}")
+                click.echo("=" * 100)
+                for time, quantity, value, accounts, code in lines:
+                    sign = "$" if code == "USD" else " "
+                    price = value / quantity if quantity else Decimal('0')
+                    click.echo(f"{from_micros(time):%Y-%m-%d %H:%M:%S} {float(quantity):>15.6f} "
+                               f"{sign}{float(price):>11,.2f} {sign}{float(value):>14,.2f} {len(accounts):>9}"
+                               + (f" {code}" if code != currency else ""))
+        elif account:
+            columns = index.account_history(account['id'], last=last)
+            currency = account.get('currency', '')
             
-            # Parse holdings data
-            aggregated = defaultdict(lambda: {
-                'symbol': '',
-                'description': '',
-                'total_quantity': Decimal('0'),
-                'total_value': Decimal('0'),
-                'accounts': [],
-                'brokers': set(),
-                'currency': 'USD'
-            })
+            click.echo(f"{account['name']} ({account['institution']}) history")
+            click.echo("=" * 60)
+            click.echo(f"{'Synced at':<20} {'Balance':>18} {'Positions value':>18}")
+            click.echo("=" * 60)
+            for time, balance, value in zip(columns['time'], columns['balance'], columns['value']):
+                click.echo(f"{from_micros(time):%Y-%m-%d %H:%M:%S} ${float(from_fixed(balance, MONEY_SCALE)):>17,.2f} "
+                           f"${float(from_fixed(value, MONEY_SCALE)):>17,.2f} {currency}")
+        else:
+            click.echo(f"No symbol or account named '{ref}' in the history index.")
+    
+    except Exception as e:
+        click.echo(f"❌ Error reading history: {e}", err=True)
+        raise click.Abort()
+
+
+@cli.command()
+@click.argument('from_ref', required=False)
+@click.argument('to_ref', required=False)
+def diff(from_ref, to_ref):
+    """Show what changed between two syncs
+    
+    FROM and TO are archived syncs (an id, a prefix of one, or 'latest';
+    see 'fenn export --list'). Without arguments the last two syncs are
+    compared; with only FROM, it is compared with the latest sync.
+    """
+    try:
+        archive = SnapshotArchive()
+        snapshot_ids = archive.list()
+        
+        if from_ref is None:
+            if len(snapshot_ids) < 2:
+                click.echo("Need at least two archived syncs to compare. Run 'fenn sync' again later.")
+                return
+            from_id, to_id = snapshot_ids[-2], snapshot_ids[-1]
+        else:
+            from_id = archive.resolve(from_ref)
+            to_id = archive.resolve(to_ref or 'latest')
+            for ref, snapshot_id in ((from_ref, from_id), (to_ref or 'latest', to_id)):
+                if snapshot_id is None:
+                    click.echo(f"No archived sync matches '{ref}'. Use 'fenn export --list' to see them.")
+                    return
+        
+        result = diff_snapshots(archive, from_id, to_id)
+        
+        click.echo(f"Changes from {archive.manifest(from_id)['synced_at']} to {archive.manifest(to_id)['synced_at']}")
+        click.echo(f"{len(result.accounts)} account(s) changed, "
+                   f"{result.unchanged + result.compared - len(result.accounts)} unchanged")
+        click.echo("=" * 80)
+        
+        if not result.accounts:
+            click.echo("No changes.")
+            return
+        
+        def money(amount):
+            return f"${amount:,.2f}" if amount >= 0 else f"-${-amount:,.2f}"
+        
+        def signed(amount):
+            return f"+{money(amount)}" if amount >= 0 else money(amount)
+        
+        for account_diff in result.accounts:
+            account = account_diff.account
+            label = {'added': ' (new account)', 'removed': ' (account removed)'}.get(account_diff.status, '')
+            click.echo(f"\n{account.name} ({account.institution}){label}")
+            if account_diff.incomplete:
+                click.echo("  ⚠️  Sync incomplete for this account; some changes may be missing")
             
-            total_portfolio_value = Decimal('0')
-            accounts_with_errors = []
+            if account_diff.balance_changed:
+                old, new = account_diff.old_balance, account_diff.new_balance
+                old_amount = old.amount if old and old.amount is not None else None
+                new_amount = new.amount if new and new.amount is not None else None
+                currency = (new or old).currency
+                if old_amount is not None and new_amount is not None:
+                    click.echo(f"  Balance: {money(old_amount)} → {money(new_amount)} "
+                               f"({signed(new_amount - old_amount)}) {currency}")
+                else:
+                    click.echo(f"  Balance: {money(old_amount) if old_amount is not None else 'N/A'} → "
+                               f"{money(new_amount) if new_amount is not None else 'N/A'} {currency}")
             
-            # Fetch holdings for each account
-            for account in accounts:
-                account_id = account.get('id')
-                account_name = account.get('name', 'Unknown Account')
-                institution_name = account.get('institution_name', 'Unknown')
-                
-                click.echo(f"  {account_name}...", nl=False)
-                
-                try:
-                    # Use get_user_holdings which works reliably
-                    response = client.client.account_information.get_user_holdings(
-                        user_id=client.user_id,
-                        user_secret=client.user_secret,
-                        account_id=account_id
-                    )
-                    
-                    # Extract holdings data
-                    if hasattr(response, 'body'):
-                        holdings_data = response.body
-                        if hasattr(holdings_data, 'to_dict'):
-                            holdings_data = holdings_data.to_dict()
-                    elif hasattr(response, 'to_dict'):
-                        holdings_data = response.to_dict().get('body', {})
-                    else:
-                        holdings_data = response
-                    
-                    # Get positions array
-                    positions = holdings_data.get('positions', [])
-                    positions_processed = 0
-                    positions_skipped = 0
-                    
-                    for position in positions:
-                        try:
-                            # Handle both dict and object types
-                            if hasattr(position, 'to_dict'):
-                                pos = position.to_dict()
-                            else:
-                                pos = position
-                            
-                            # Extract symbol data
-                            symbol_data = pos.get('symbol', {})
-                            if isinstance(symbol_data, dict):
-                                symbol_info = symbol_data.get('symbol', {})
-                            else:
-                                symbol_info = symbol_data
-                            
-                            if isinstance(symbol_info, dict):
-                                symbol = symbol_info.get('symbol', 'UNKNOWN')
-                                description = symbol_info.get('description', '')
-                            else:
-                                symbol = 'UNKNOWN'
-                                description = ''
-                            
-                            # Get quantity and price with error handling - catch ALL exceptions
-                            try:
-                                quantity = Decimal(str(pos.get('units', 0)))
-                            except Exception:
-                                quantity = Decimal('0')
-                            
-                            try:
-                                price = Decimal(str(pos.get('price', 0)))
-                            except Exception:
-                                price = Decimal('0')
-                            
-                            try:
-                                avg_cost = Decimal(str(pos.get('average_purchase_price', 0)))
-                            except Exception:
-                                avg_cost = Decimal('0')
-                            
-                            # Calculate value
-                            value = quantity * price
-                            
-                            # Aggregate by symbol
-                            agg = aggregated[symbol]
-                            agg['symbol'] = symbol
-                            agg['description'] = description
-                            agg['total_quantity'] += quantity
-                            agg['total_value'] += value
-                            agg['brokers'].add(institution_name)
-                            agg['accounts'].append({
-                                'account_id': account_id,
-                                'account_name': account_name,
-                                'quantity': float(quantity),
-                                'price': float(price),
-                                'avg_cost': float(avg_cost),
-                                'value': float(value)
-                            })
-                            
-                            # Track total
-                            total_portfolio_value += value
-                            positions_processed += 1
-                            
-                        except Exception as pos_error:
-                            # Skip positions with bad data
-                            positions_skipped += 1
-                            continue
-                    
-                    # Report results
-                    if positions_skipped > 0:
-                        click.echo(f" {positions_processed} positions ({positions_skipped} skipped)")
-                    else:
-                        click.echo(f" {positions_processed} positions")
-                        
-                except Exception as e:
-                    click.echo(f" ERROR: {e}")
-                    accounts_with_errors.append(account_name)
-                    continue
+            if account_diff.cash_changed:
+                for currency in sorted(account_diff.old_cash.keys() | account_diff.new_cash.keys()):
+                    old_cash = account_diff.old_cash.get(currency)
+                    new_cash = account_diff.new_cash.get(currency)
+                    if old_cash != new_cash:
+                        click.echo(f"  Cash {currency}: {money(old_cash) if old_cash is not None else 'N/A'} → "
+                                   f"{money(new_cash) if new_cash is not None else 'N/A'}")
             
-            # Save to cache (after all accounts processed)
-            cache_data = {
-                'cached_at': datetime.now().isoformat(),
-                'total_value': float(total_portfolio_value),
-                'holdings': {k: {**v, 'total_quantity': float(v['total_quantity']),
-                                  'total_value': float(v['total_value']),
-                                  'brokers': list(v['brokers'])}
-                            for k, v in aggregated.items()},
-                'errors': accounts_with_errors
-            }
-            with open(holdings_cache_path, 'w') as f:
-                json.dump(cache_data, f, indent=2)
-        
-        # Load and merge manual holdings
-        manual_holdings_path = Config.DATA_DIR / 'manual_holdings.json'
-        if manual_holdings_path.exists():
-            try:
-                with open(manual_holdings_path, 'r') as f:
-                    manual_data = json.load(f)
-                    manual_holdings = manual_data.get('holdings', [])
-                    
-                    if manual_holdings:
-                        click.echo(f"\nMerging {len(manual_holdings)} manual holdings...")
-                        
-                        for holding in manual_holdings:
-                            symbol = holding.get('symbol', 'UNKNOWN')
-                            quantity = Decimal(str(holding.get('quantity', 0)))
-                            price = Decimal(str(holding.get('price', 0)))
-                            value = Decimal(str(holding.get('value', quantity * price)))
-                            
-                            # Get or create aggregated entry
-                            if symbol not in aggregated:
-                                aggregated[symbol] = {
-                                    'symbol': symbol,
-                                    'description': holding.get('description', ''),
-                                    'total_quantity': Decimal('0'),
-                                    'total_value': Decimal('0'),
-                                    'accounts': [],
-                                    'brokers': set(),
-                                    'currency': 'USD'
-                                }
-                            
-                            agg = aggregated[symbol]
-                            agg['total_quantity'] += quantity
-                            agg['total_value'] += value
-                            agg['brokers'].add(holding.get('institution_name', 'Manual'))
-                            agg['accounts'].append({
-                                'account_id': 'manual',
-                                'account_name': holding.get('account_name', 'Manual Account'),
-                                'quantity': float(quantity),
-                                'price': float(price),
-                                'avg_cost': float(price),
-                                'value': float(value),
-                                'manual': True
-                            })
-                            
-                            total_portfolio_value += value
-            except Exception as e:
-                click.echo(f"Warning: Could not load manual holdings: {e}")
+            for change in account_diff.positions:
+                if change.status == 'added':
+                    click.echo(f"  + {change.symbol:<8} {float(change.new.quantity):>15.6f} {money(change.new.value):>15}")
+                elif change.status == 'removed':
+                    click.echo(f"  - {change.symbol:<8} {float(change.old.quantity):>15.6f} {money(change.old.value):>15}")
+                else:
+                    quantity = f"{float(change.new.quantity):>15.6f}"
+                    if change.quantity_change:
+                        quantity += f" ({float(change.quantity_change):+.6f})"
+                    click.echo(f"  ~ {change.symbol:<8} {quantity} {money(change.new.value):>15} "
+                               f"({signed(change.value_change)})")
+    
+    except Exception as e:
+        click.echo(f"❌ Error comparing syncs: {e}", err=True)
+        raise click.Abort()
+
+
+@cli.command()
+@click.option('--keep-all', type=int, default=None,
+              help=f'Days to keep every snapshot (default {Config.RETAIN_ALL_DAYS})')
+@click.option('--keep-daily', type=int, default=None,
+              help=f'Days to keep one snapshot per day (default {Config.RETAIN_DAILY_DAYS})')
+@click.option('--keep-monthly', type=int, default=None,
+              help='Months to keep one snapshot per month (default: forever)')
+@click.option('--dry-run', is_flag=True, help='Show what would be removed without removing it')
+def compact(keep_all, keep_daily, keep_monthly, dry_run):
+    """Thin out old snapshots and reclaim their space
+    
+    Keeps every snapshot from the last few days, then one per day, then one
+    per month, in both snapshots.db and the payload archive. Unreferenced
+    archive blobs are removed, snapshots.db is vacuumed and the history
+    index is rebuilt. Safe to run while a sync is in progress.
+    """
+    try:
+        from .retention import RetentionPolicy, compact as compact_snapshots
         
-        click.echo()
+        policy = RetentionPolicy()
+        if keep_all is not None:
+            policy.all_days = keep_all
+        if keep_daily is not None:
+            policy.daily_days = keep_daily
+        if keep_monthly is not None:
+            policy.monthly_months = keep_monthly
         
-        # Display results
-        if by_account:
-            # Group by account
-            accounts_data = defaultdict(lambda: {'holdings': [], 'total': Decimal('0')})
+        if not Config.SNAPSHOT_DB.exists() and not Config.ARCHIVE_DIR.exists():
+            click.echo("No snapshots found. Run 'fenn sync' first.")
+            return
+        
+        db_size = Config.SNAPSHOT_DB.stat().st_size if Config.SNAPSHOT_DB.exists() else 0
+        with SnapshotStore() as store:
+            report = compact_snapshots(store, SnapshotArchive(), policy, dry_run=dry_run)
             
-            for symbol, data in aggregated.items():
-                for acct in data['accounts']:
-                    account_name = acct['account_name']
-                    accounts_data[account_name]['holdings'].append({
-                        'symbol': symbol,
-                        'description': data['description'],
-                        'quantity': acct['quantity'],
-                        'price': acct['price'],
-                        'value': acct['value']
-                    })
-                    accounts_data[account_name]['total'] += Decimal(str(acct['value']))
+            verb = "Would remove" if dry_run else "Removed"
+            for source, (total, removed) in report.snapshots.items():
+                click.echo(f"{verb} {removed} of {total} {source} snapshot(s)")
+            click.echo(f"{verb} {report.manifests[1]} of {report.manifests[0]} archived sync(s)")
+            if dry_run:
+                return
+            click.echo(f"Removed {report.objects_removed} unreferenced archive object(s) "
+                       f"({report.bytes_freed:,} bytes)")
             
-            # Display each account
-            for account_name, account_data in sorted(accounts_data.items()):
-                click.echo(f"\n{account_name}")
-                click.echo("-" * 100)
-                click.echo(f"{'Symbol':<8} {'Description':<40} {'Quantity':>15} {'Price':>12} {'Value':>15}")
-                click.echo("-" * 100)
-                
-                for holding in sorted(account_data['holdings'], key=lambda x: x['value'], reverse=True):
-                    desc = holding['description'][:40] if len(holding['description']) > 40 else holding['description']
-                    click.echo(f"{holding['symbol']:<8} {desc:<40} {holding['quantity']:>15.6f} ${holding['price']:>11,.2f} ${holding['value']:>14,.2f}")
-                
-                click.echo("-" * 100)
-                click.echo(f"{'Account Total:':<49} ${float(account_data['total']):>14,.2f}")
+            # Reclaim space and rebuild what was derived from removed snapshots
+            try:
+                store.vacuum()
+                click.echo(f"✓ Vacuumed {Config.SNAPSHOT_DB.name}: {db_size:,} → "
+                           f"{Config.SNAPSHOT_DB.stat().st_size:,} bytes")
+            except sqlite3.OperationalError as e:
+                click.echo(f"Warning: Could not vacuum {Config.SNAPSHOT_DB.name} ({e}); try again later", err=True)
+            
+            indexed = TimeSeriesIndex().rebuild(store)
+            click.echo(f"✓ Rebuilt history index ({indexed} sync(s))")
+    
+    except Exception as e:
+        click.echo(f"❌ Error compacting snapshots: {e}", err=True)
+        raise click.Abort()
+
+
+@cli.command('fake-server')
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', '-p', default=8765, help='Port to listen on')
+@click.option('--connections', default=3, help='Synthetic brokerage connections')
+@click.option('--accounts', default=10, help='Synthetic accounts')
+@click.option('--positions', default=20, help='Synthetic positions per account')
+@click.option('--seed', default=0, help='Seed for synthetic data and fault injection')
+@click.option('--currency', 'currencies', multiple=True,
+              help='Currency of synthetic accounts, repeat to assign several in turn (default USD)')
+@click.option('--record', 'record_dir', type=click.Path(file_okay=False),
+              help='Proxy to the real API and record responses into this directory')
+@click.option('--replay', 'replay_dir', type=click.Path(exists=True, file_okay=False),
+              help='Serve responses recorded with --record')
+@click.option('--upstream', default='https://api.snaptrade.com/api/v1', help='API to proxy when recording')
+@click.option('--latency', default=0.0, help='Added latency per request (ms)')
+@click.option('--jitter', default=0.0, help='Random extra latency per request, up to this many ms')
+@click.option('--rate-429', default=0.0, help='Fraction of requests answered with 429')
+@click.option('--rate-5xx', default=0.0, help='Fraction of requests answered with 503')
+@click.option('--hang-rate', default=0.0, help='Fraction of requests that never get an answer')
+@click.option('--fault-path', help='Only inject faults into paths matching this regex (e.g. positions)')
+@click.option('--verbose', '-v', is_flag=True, help='Log every request')
+def fake_server(host, port, connections, accounts, positions, seed, currencies, record_dir, replay_dir, upstream,
+                latency, jitter, rate_429, rate_5xx, hang_rate, fault_path, verbose):
+    """Run a local SnapTrade stand-in for offline testing and benchmarks
+    
+    Point fenn at it with SNAPTRADE_API_HOST (any client ID / consumer key
+    values will do):
+    
+      SNAPTRADE_API_HOST=http://127.0.0.1:8765/api/v1 fenn sync
+    """
+    from .fakeserver import Cassette, Faults, FakeSnapTradeServer, SyntheticPortfolio
+    
+    if record_dir and replay_dir:
+        raise click.UsageError("--record and --replay cannot be combined")
+    
+    faults = Faults(latency_ms=latency, jitter_ms=jitter, rate_429=rate_429, rate_5xx=rate_5xx,
+                    hang_rate=hang_rate, path_pattern=fault_path, seed=seed)
+    
+    if record_dir:
+        server = FakeSnapTradeServer((host, port), cassette=Cassette(Path(record_dir)), upstream=upstream,
+                                     faults=faults, quiet=not verbose)
+        mode = f"recording {upstream} into {record_dir}"
+    elif replay_dir:
+        server = FakeSnapTradeServer((host, port), cassette=Cassette(Path(replay_dir)), faults=faults,
+                                     quiet=not verbose)
+        mode = f"replaying {replay_dir}"
+    else:
+        portfolio_data = SyntheticPortfolio(connections=connections, accounts=accounts, positions=positions,
+                                            seed=seed, currencies=[c.upper() for c in currencies])
+        server = FakeSnapTradeServer((host, port), portfolio=portfolio_data, faults=faults, quiet=not verbose)
+        mode = f"synthetic portfolio: {accounts} account(s) x {positions} position(s)"
+    
+    click.echo(f"Fake SnapTrade API ({mode})")
+    click.echo(f"  export SNAPTRADE_API_HOST={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    """Entry point for the CLI"""
+    cli()
+
+
+def _add_manual_holdings(table):
+    """Merge data/manual_holdings.json into a position table for `portfolio` and `plot`"""
+    try:
+        totals = ManualTotals.load()
+    except (OSError, ValueError) as e:
+        click.echo(f"Warning: Could not load manual holdings: {e}")
+        return
+    
+    if len(totals):
+        click.echo(f"Merging {len(totals)} manual holdings...")
+        totals.add_to(table)
+
+
+def _symbol_rules():
+    """Symbol rules for `portfolio` and `plot`; none if the rules file is broken"""
+    try:
+        return SymbolRules.load()
+    except (OSError, ValueError) as e:
+        click.echo(f"Warning: Could not load symbol rules, showing symbols as reported: {e}")
+        return SymbolRules()
+
+
+def _format_age(age):
+    """Short human form of a timedelta, e.g. '45s', '12m' or '3h'"""
+    seconds = int(age.total_seconds())
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h"
+    return f"{seconds // 86400}d"
+
+
+def _revalidate_holdings():
+    """Refresh expired holdings in the background for `portfolio` and `plot`"""
+    with PortfolioCache() as cache:
+        holdings = cache.holdings()
+        expired = holdings.expired()
+        if expired:
+            # Another refresh already running will pick these up
+            holdings.refresh(SnapTradeClient(), expired, blocking=False)
+
+
+def _load_holdings(cache, refresh=False, max_age=None, offline=False):
+    """Account records for `portfolio` and `plot`, refetching only what must be
+    
+    With ``offline``, cached holdings are used whatever their age, and are
+    only fetched if there are none.
+    
+    Returns:
+        List of (account, positions, errors) records, empty if there are no
+        accounts, and the age of the holdings kept for each account whose
+        refresh failed
+    """
+    holdings = cache.holdings(max_age=max_age)
+    
+    def report(account, position_count, skipped, error):
+        if error:
+            click.echo(f"  {account.name}... ERROR: {error}")
+        elif skipped > 0:
+            click.echo(f"  {account.name}... {position_count} positions ({skipped} skipped)")
+        else:
+            click.echo(f"  {account.name}... {position_count} positions")
+    
+    def waiting():
+        click.echo("Waiting for another refresh or sync to finish...")
+    
+    if refresh or not holdings.records:
+        if refresh:
+            click.echo("Fetching latest holdings from brokerages...")
+        else:
+            click.echo("Fetching holdings from all accounts...")
+        holdings.refresh(SnapTradeClient(), progress=report, on_wait=waiting)
+    else:
+        unusable = [] if offline else holdings.unusable()
+        if unusable:
+            click.echo(f"Refreshing holdings for {len(unusable)} account(s)...")
+            holdings.refresh(SnapTradeClient(), unusable, progress=report, on_wait=waiting)
+        
+        # Anything else past its max age is served now and refreshed for next time
+        expired = [] if offline else holdings.expired()
+        source = "latest sync" if holdings.source == "sync" else "cached holdings"
+        if expired:
+            if not holdings.refreshing():
+                spawn_refresh()
+            click.echo(f"Using {source} ({len(expired)} account(s) refreshing in the background)...")
         else:
-            # Display aggregated view
-            click.echo("=" * 135)
-            click.echo(f"{'Symbol':<8} {'Broker':<12} {'Description':<35} {'Quantity':>15} {'Value':>15} {'Allocation':>10}")
-            click.echo("=" * 135)
+            oldest = max((holdings.age(account.id) or timedelta(0) for account, _, _ in holdings.records),
+                         default=timedelta(0))
+            click.echo(f"Using {source} (up to {_format_age(oldest)} old)...")
+    
+    return holdings.records, {account_id: holdings.age(account_id) for account_id in holdings.kept()}
+
+
+def _quote_provider(reprice, quotes):
+    """Quote provider for --reprice/--quotes, or None if not repricing"""
+    if not reprice and quotes is None:
+        return None
+    try:
+        return open_provider(quotes)
+    except (OSError, ValueError) as e:
+        raise click.BadParameter(str(e), param_hint='--quotes')
+
+
+def _reprice(table, provider):
+    """Value a position table at the provider's quotes, keeping its quantities"""
+    import time
+    
+    started = time.perf_counter()
+    with provider:
+        quotes = provider.quotes(table.symbols)
+    table, skipped = table.reprice(quotes)
+    elapsed = time.perf_counter() - started
+    
+    missing = len(table.symbols) - len(quotes)
+    click.echo(f"Repriced {len(quotes)} symbol(s) from {getattr(provider, 'path', 'quotes')} in {elapsed * 1000:.0f}ms"
+               + (f" ({missing} without a quote keep their cached price)" if missing else ""))
+    if skipped:
+        click.echo(f"⚠️  {skipped} position(s) held in another currency than their quote keep their cached price")
+    return table
+
+
+def _to_currency(table, currency):
+    """Convert a position table's prices and values into `currency` with the cached FX rates
+    
+    Positions in currencies without a rate are left out of the converted
+    table and returned separately, one table per currency, in their own
+    amounts.
+    """
+    foreign = [code for code in table.held_currencies() if code != currency]
+    if not foreign:
+        return table, {}
+    rates, day, missing = FxRates().partial_conversion(foreign, currency)
+    unconverted = {}
+    if missing:
+        click.echo(f"⚠️  No exchange rate for {', '.join(f'{code}/{currency}' for code in missing)}; "
+                   f"run 'fenn fx update'. Those holdings are shown in their own currency.")
+        unconverted = {code: table.select_currencies([code]) for code in missing}
+        table = table.select_currencies([code for code in table.held_currencies() if code not in missing])
+    if rates:
+        click.echo(f"Converting {', '.join(rates)} to {currency}" + (f" at rates of {day}" if day else "") + "...")
+    return table.convert(rates, currency), unconverted
+
+
+def _print_holdings(table, currency, by_account, gains):
+    """The holdings tables of `portfolio`, with values in `currency`
+    
+    Returns:
+        Symbols shown and the total value
+    """
+    from decimal import Decimal
+    
+    sign = "$" if currency == "USD" else " "
+    holdings = table.by_symbol()
+    total_portfolio_value = table.total_value()
+    if by_account and gains:
+        for account_total in table.by_account():
+            click.echo(f"\n{account_total.account.name}")
+            click.echo("-" * 113)
+            click.echo(f"{'Symbol':<8} {'Description':<30} {'Quantity':>15} {'Value':>15} {GAIN_HEADER}")
+            click.echo("-" * 113)
             
-            # Sort by value descending
-            sorted_holdings = sorted(aggregated.items(), key=lambda x: x[1]['total_value'], reverse=True)
+            for holding in account_total.holdings:
+                desc = holding.description[:30]
+                click.echo(f"{holding.symbol:<8} {desc:<30} {float(holding.quantity):>15.6f} {sign}{float(holding.value):>14,.2f} {_gain_cells(holding.cost, holding.gain, sign)}")
             
-            for symbol, data in sorted_holdings:
-                quantity = data['total_quantity']
-                value = data['total_value']
-                allocation = (value / total_portfolio_value * 100) if total_portfolio_value > 0 else Decimal('0')
-                
-                desc = data['description'][:35] if len(data['description']) > 35 else data['description']
-                brokers = ', '.join(sorted(data['brokers']))[:12] if data['brokers'] else ''
-                
-                click.echo(f"{symbol:<8} {brokers:<12} {desc:<35} {float(quantity):>15.6f} ${float(value):>14,.2f} {float(allocation):>9.2f}%")
+            click.echo("-" * 113)
+            click.echo(f"{'Account Total:':<55} {sign}{float(account_total.value):>14,.2f} {_gain_cells(account_total.cost, account_total.gain, sign)}")
+    elif by_account:
+        for account_total in table.by_account():
+            click.echo(f"\n{account_total.account.name}")
+            click.echo("-" * 100)
+            click.echo(f"{'Symbol':<8} {'Description':<40} {'Quantity':>15} {'Price':>12} {'Value':>15}")
+            click.echo("-" * 100)
             
-            click.echo("=" * 135)
-            click.echo(f"{'TOTAL':<8} {'':12} {'':35} {'':>15} ${float(total_portfolio_value):>14,.2f} {'100.00%':>10}")
-            click.echo("=" * 135)
+            for holding in account_total.holdings:
+                desc = holding.description[:40]
+                click.echo(f"{holding.symbol:<8} {desc:<40} {float(holding.quantity):>15.6f} {sign}{float(holding.price):>11,.2f} {sign}{float(holding.value):>14,.2f}")
+            
+            click.echo("-" * 100)
+            click.echo(f"{'Account Total:':<49} {sign}{float(account_total.value):>14,.2f}")
+    elif gains:
+        # Aggregated view with cost basis, largest holdings first
+        total_cost, total_gain, _ = table.total_gain()
+        click.echo("=" * 135)
+        click.echo(f"{'Symbol':<8} {'Broker':<12} {'Description':<35} {'Value':>15} {GAIN_HEADER}")
+        click.echo("=" * 135)
+        
+        for holding in holdings:
+            desc = holding.description[:35]
+            brokers = ', '.join(holding.brokers)[:12]
+            click.echo(f"{holding.symbol:<8} {brokers:<12} {desc:<35} {sign}{float(holding.value):>14,.2f} {_gain_cells(holding.cost, holding.gain, sign)}")
+        
+        click.echo("=" * 135)
+        click.echo(f"{'TOTAL':<8} {'':12} {'':35} {sign}{float(total_portfolio_value):>14,.2f} {_gain_cells(total_cost, total_gain, sign)}")
+        click.echo("=" * 135)
+    else:
+        # Display aggregated view, largest holdings first
+        click.echo("=" * 135)
+        click.echo(f"{'Symbol':<8} {'Broker':<12} {'Description':<35} {'Quantity':>15} {'Value':>15} {'Allocation':>10}")
+        click.echo("=" * 135)
+        
+        for holding in holdings:
+            allocation = (holding.value / total_portfolio_value * 100) if total_portfolio_value > 0 else Decimal('0')
+            desc = holding.description[:35]
+            brokers = ', '.join(holding.brokers)[:12]
+            
+            click.echo(f"{holding.symbol:<8} {brokers:<12} {desc:<35} {float(holding.quantity):>15.6f} {sign}{float(holding.value):>14,.2f} {float(allocation):>9.2f}%")
+        
+        click.echo("=" * 135)
+        click.echo(f"{'TOTAL':<8} {'':12} {'':35} {'':>15} {sign}{float(total_portfolio_value):>14,.2f} {'100.00%':>10}")
+        click.echo("=" * 135)
+    return {holding.symbol for holding in holdings}, total_portfolio_value
+
+
+# Column headings matching _gain_cells
+GAIN_HEADER = f"{'Cost Basis':>15} {'Gain/Loss':>15} {'Gain %':>9}"
+
+
+def _gain_cells(cost, gain, sign):
+    """Cost basis, gain and gain % columns of `portfolio --gains`"""
+    if cost is None:
+        return f"{'N/A':>15} {'N/A':>15} {'N/A':>9}"
+    percent = f"{float(gain / cost * 100):+.2f}%" if cost else "N/A"
+    return f"{sign}{float(cost):>14,.2f} {sign}{float(gain):>+14,.2f} {percent:>9}"
+
+
+def _format_gain(cost, gain, currency):
+    """e.g. '+$1,234.56 (+4.20%)', or '+1,234.56 EUR (+4.20%)'"""
+    amount = f"${abs(float(gain)):,.2f}" if currency == "USD" else f"{abs(float(gain)):,.2f} {currency}"
+    percent = f" ({float(gain / cost * 100):+.2f}%)" if cost else ""
+    return f"{'-' if gain < 0 else '+'}{amount}{percent}"
+
+
+def _print_gains(table, currency):
+    """Portfolio and per-broker unrealized gains for the `portfolio --gains` summary"""
+    cost, gain, uncosted = table.total_gain()
+    if cost is None:
+        click.echo("  Unrealized Gain/Loss: N/A (no cost basis reported)")
+        return
+    if currency == "USD":
+        click.echo(f"  Cost Basis: ${float(cost):,.2f}")
+    else:
+        click.echo(f"  Cost Basis: {float(cost):,.2f} {currency}")
+    click.echo(f"  Unrealized Gain/Loss: {_format_gain(cost, gain, currency)}")
+    for broker in table.by_broker():
+        if broker.cost is not None:
+            click.echo(f"    {broker.broker:<20} {_format_gain(broker.cost, broker.gain, currency)}")
+    if uncosted:
+        click.echo(f"  Cost basis unknown for {uncosted} position(s); they are left out of gains")
+
+
+@cli.command()
+@click.option('--by-account', '-a', is_flag=True, help='Group holdings by account')
+@click.option('--refresh', '-r', is_flag=True, help='Fetch latest data from brokerages')
+@click.option('--max-age', default=None,
+              help='Refetch accounts whose holdings are older than this (e.g. 30m, 6h, 1d)')
+@click.option('--raw', is_flag=True, help='Show symbols as reported, without symbol rules')
+@click.option('--reprice', is_flag=True,
+              help='Value cached quantities at prices from the quotes file instead of refetching holdings')
+@click.option('--quotes', type=click.Path(dir_okay=False),
+              help='Quotes file for --reprice (.csv or SQLite; default data/quotes.csv)')
+@click.option('--currency', '-c', help='Currency to show values in (default FENN_BASE_CURRENCY)')
+@click.option('--gains', '-g', is_flag=True, help='Show cost basis and unrealized gain or loss')
+@click.option('--revalidate', is_flag=True, hidden=True)
+def portfolio(by_account, refresh, max_age, raw, reprice, quotes, currency, gains, revalidate):
+    """Show aggregated portfolio holdings across all accounts
+    
+    Holdings are cached per account. Accounts older than --max-age
+    (FENN_HOLDINGS_MAX_AGE) are shown from the cache while they are
+    refreshed in the background, unless they are too old to show
+    (FENN_HOLDINGS_MAX_STALE) or their last fetch failed, in which case
+    only those accounts are refetched first.
+    
+    Symbols are renamed and grouped by data/symbol_rules.json; groups are
+    only applied to the aggregated view.
+    
+    --reprice keeps the cached quantities, whatever their age, and values
+    them at the prices in a local quotes file (symbol,price CSV or a SQLite
+    quotes table), without contacting the brokerages.
+    
+    Positions in other currencies are converted at the latest rates cached
+    by `fenn fx update`.
+    
+    --gains shows each position's cost basis (quantity x the average
+    purchase price the broker reports) and unrealized gain or loss, totaled
+    by symbol, account, broker and portfolio. Positions without a reported
+    cost are left out of the gains.
+    """
+    if revalidate:
+        _revalidate_holdings()
+        return
+    
+    if max_age is not None:
+        try:
+            max_age = parse_duration(max_age)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--max-age')
+    provider = _quote_provider(reprice, quotes)
+    currency = (currency or Config.BASE_CURRENCY).upper()
+    
+    try:
+        with PortfolioCache() as cache:
+            records, kept = _load_holdings(cache, refresh=refresh, max_age=max_age, offline=provider is not None)
+        
+        if not records:
+            click.echo("No accounts found")
+            return
+        
+        table = PositionTable.from_records(records, include=kept)
+        accounts_with_errors = [account.name for account, _, errors in records if errors and account.id not in kept]
+        stale_accounts = [
+            account.name + (f" ({_format_age(kept[account.id])} old)" if kept[account.id] is not None else "")
+            for account, _, _ in records if account.id in kept
+        ]
+        _add_manual_holdings(table)
+        if provider is not None:
+            table = _reprice(table, provider)
+        table, unconverted = _to_currency(table, currency)
+        if not raw:
+            rules = _symbol_rules()
+            mapping = rules.mapping(groups=not by_account)
+            table = table.relabel(mapping, rules.descriptions)
+            unconverted = {code: other.relabel(mapping, rules.descriptions) for code, other in unconverted.items()}
+        
+        click.echo()
+        symbols, total_portfolio_value = set(), table.total_value()
+        if len(table) or not unconverted:
+            if currency != "USD":
+                click.echo(f"Values in {currency}")
+            symbols, total_portfolio_value = _print_holdings(table, currency, by_account, gains)
+        for code, other in unconverted.items():
+            click.echo(f"\nValues in {code} (no exchange rate into {currency})")
+            symbols |= _print_holdings(other, code, by_account, gains)[0]
         
         # Summary
         click.echo()
         click.echo(f"Portfolio Summary:")
-        click.echo(f"  Total Holdings: {len(aggregated)} unique symbols")
-        click.echo(f"  Total Value: ${float(total_portfolio_value):,.2f}")
+        click.echo(f"  Total Holdings: {len(symbols)} unique symbols")
+        if currency == "USD":
+            click.echo(f"  Total Value: ${float(total_portfolio_value):,.2f}")
+        else:
+            click.echo(f"  Total Value: {float(total_portfolio_value):,.2f} {currency}")
+        for code, other in unconverted.items():
+            click.echo(f"  Not converted: {float(other.total_value()):,.2f} {code}")
+        if gains:
+            _print_gains(table, currency)
         
+        if stale_accounts:
+            click.echo()
+            click.echo(f"⚠️  Could not refresh {len(stale_accounts)} account(s), showing their last fetched holdings: "
+                       f"{', '.join(stale_accounts)}")
         if accounts_with_errors:
             click.echo()
             click.echo(f"⚠️  Errors fetching {len(accounts_with_errors)} account(s): {', '.join(accounts_with_errors)}")
         
+    except click.Abort:
+        raise
     except Exception as e:
         click.echo(f"❌ Error: {e}", err=True)
         import traceback
@@ -466,7 +1053,13 @@ def portfolio(by_account, refresh):
 @click.option('--top', '-t', default=10, help='Number of top holdings to show (for allocation/top-holdings)')
 @click.option('--output', '-o', help='Output file path (default: temp file)')
 @click.option('--no-browser', is_flag=True, help="Don't auto-open in browser")
-def plot(chart_type, top, output, no_browser):
+@click.option('--raw', is_flag=True, help='Show symbols as reported, without symbol rules')
+@click.option('--reprice', is_flag=True,
+              help='Value cached quantities at prices from the quotes file instead of refetching holdings')
+@click.option('--quotes', type=click.Path(dir_okay=False),
+              help='Quotes file for --reprice (.csv or SQLite; default data/quotes.csv)')
+@click.option('--currency', '-c', help='Currency to show values in (default FENN_BASE_CURRENCY)')
+def plot(chart_type, top, output, no_browser, raw, reprice, quotes, currency):
     """Generate portfolio visualization charts
     
     Chart types:
@@ -474,10 +1067,14 @@ def plot(chart_type, top, output, no_browser):
       top-holdings    - Bar chart of largest positions
       by-broker       - Treemap of broker distribution
       concentration   - Cumulative allocation curve
+    
+    Symbols are renamed and grouped by data/symbol_rules.json, and
+    --reprice values holdings at local quotes, and other currencies are
+    converted to --currency, as in `fenn portfolio`.
     """
+    provider = _quote_provider(reprice, quotes)
+    currency = (currency or Config.BASE_CURRENCY).upper()
     try:
-        from decimal import Decimal
-        from datetime import date
         from .plotting import (
             create_allocation_chart,
             create_top_holdings_chart,
@@ -486,170 +1083,47 @@ def plot(chart_type, top, output, no_browser):
             save_and_open_chart
         )
         
-        client = SnapTradeClient()
-        Config.ensure_data_dir()
+        # Same holdings as `fenn portfolio`, fetched only if there are none yet
+        with PortfolioCache() as cache:
+            records, kept = _load_holdings(cache, offline=provider is not None)
         
-        # Load data from cache
-        holdings_cache_path = Config.DATA_DIR / 'holdings_cache.json'
-        
-        if not holdings_cache_path.exists():
-            click.echo("No portfolio data found. Run 'fenn portfolio' first to fetch data.")
-            raise click.Abort()
+        table = PositionTable.from_records(records, include=kept)
+        _add_manual_holdings(table)
+        if provider is not None:
+            table = _reprice(table, provider)
         
-        try:
-            with open(holdings_cache_path, 'r') as f:
-                cached_data = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            click.echo(f"Error reading cache: {e}")
-            click.echo("Run 'fenn portfolio --refresh' to fetch fresh data.")
+        if not len(table):
+            click.echo("No holdings data found.")
             raise click.Abort()
         
-        # Convert cached data back to proper types
-        aggregated = {k: {**v, 'total_quantity': Decimal(str(v['total_quantity'])), 
-                          'total_value': Decimal(str(v['total_value'])),
-                          'brokers': set(v.get('brokers', []))}
-                      for k, v in cached_data['holdings'].items()}
-        total_portfolio_value = Decimal(str(cached_data['total_value']))
-        
-        if not aggregated:
-            click.echo("No holdings data found.")
+        table, unconverted = _to_currency(table, currency)
+        for code, other in unconverted.items():
+            click.echo(f"Not charted: {float(other.total_value()):,.2f} {code} in {len(other)} position(s)")
+        if not len(table):
+            click.echo(f"No holdings with values in {currency} to chart.")
             raise click.Abort()
+        if not raw:
+            rules = _symbol_rules()
+            table = table.relabel(rules.mapping(), rules.descriptions)
+        holdings = table.by_symbol()
+        total_portfolio_value = table.total_value()
         
-        # Load and merge manual holdings
-        manual_holdings_path = Config.DATA_DIR / 'manual_holdings.json'
-        if manual_holdings_path.exists():
-            try:
-                with open(manual_holdings_path, 'r') as f:
-                    manual_data = json.load(f)
-                    manual_holdings = manual_data.get('holdings', [])
-                    
-                    if manual_holdings:
-                        click.echo(f"Merging {len(manual_holdings)} manual holdings...")
-                        
-                        for holding in manual_holdings:
-                            symbol = holding.get('symbol', 'UNKNOWN')
-                            quantity = Decimal(str(holding.get('quantity', 0)))
-                            price = Decimal(str(holding.get('price', 0)))
-                            value = Decimal(str(holding.get('value', quantity * price)))
-                            
-                            # Get or create aggregated entry
-                            if symbol not in aggregated:
-                                aggregated[symbol] = {
-                                    'symbol': symbol,
-                                    'description': holding.get('description', ''),
-                                    'total_quantity': Decimal('0'),
-                                    'total_value': Decimal('0'),
-                                    'accounts': [],
-                                    'brokers': set(),
-                                    'currency': 'USD'
-                                }
-                            
-                            agg = aggregated[symbol]
-                            agg['total_quantity'] += quantity
-                            agg['total_value'] += value
-                            agg['brokers'].add(holding.get('institution_name', 'Manual'))
-                            
-                            total_portfolio_value += value
-            except Exception as e:
-                click.echo(f"Warning: Could not load manual holdings: {e}")
-
-        # Merge GOOG and GOOGL
-        if 'GOOG' in aggregated and 'GOOGL' in aggregated:
-            click.echo("Merging GOOG and GOOGL...")
-            goog = aggregated['GOOG']
-            googl = aggregated['GOOGL']
-            
-            merged_quantity = goog['total_quantity'] + googl['total_quantity']
-            merged_value = goog['total_value'] + googl['total_value']
-            merged_brokers = goog['brokers'].union(googl['brokers'])
-            
-            # Create merged entry
-            aggregated['GOOG/L'] = {
-                'symbol': 'GOOG/L',
-                'description': 'Alphabet Inc. (Class A & C)',
-                'total_quantity': merged_quantity,
-                'total_value': merged_value,
-                'brokers': merged_brokers,
-                'accounts': goog.get('accounts', []) + googl.get('accounts', []),
-                'currency': 'USD'
-            }
-            
-            # Remove original entries
-            del aggregated['GOOG']
-            del aggregated['GOOGL']
-
-        # Merge BRK.B and BRKB
-        if 'BRKB' in aggregated:
-            if 'BRK.B' in aggregated:
-                click.echo("Merging BRKB into BRK.B...")
-                source = aggregated['BRKB']
-                target = aggregated['BRK.B']
-                
-                target['total_quantity'] += source['total_quantity']
-                target['total_value'] += source['total_value']
-                target['brokers'].update(source['brokers'])
-                target['accounts'].extend(source.get('accounts', []))
-                
-                del aggregated['BRKB']
-            else:
-                # Rename BRKB to BRK.B
-                aggregated['BRK.B'] = aggregated.pop('BRKB')
-                aggregated['BRK.B']['symbol'] = 'BRK.B'
-
-        # Merge S&P 500 and similar funds
-        # FNILX is Fidelity ZERO Large Cap Index (tracks similar to S&P 500)
-        sp500_tickers = ['VOO', 'SPY', 'IVV', 'FXAIX', 'O8I1', 'VFIAX', 'FNILX'] 
-        found_sp500 = [t for t in sp500_tickers if t in aggregated]
+        for holding in holdings:
+            merged = [symbol for symbol, _ in holding.components if symbol != holding.symbol]
+            if merged:
+                click.echo(f"Merging {', '.join(merged)} into {holding.symbol}...")
         
-        if len(found_sp500) > 0:
-            click.echo(f"Merging S&P 500 funds: {', '.join(found_sp500)}...")
-            
-            total_qty = Decimal('0')
-            total_val = Decimal('0')
-            brokers = set()
-            accounts = []
-            breakdown_parts = []
-            
-            # Sort tickers by value for better display
-            sorted_tickers = sorted(found_sp500, key=lambda t: aggregated[t]['total_value'], reverse=True)
-            
-            for ticker in sorted_tickers:
-                data = aggregated[ticker]
-                val = data['total_value']
-                
-                total_qty += data['total_quantity']
-                total_val += val
-                brokers.update(data['brokers'])
-                accounts.extend(data.get('accounts', []))
-                
-                breakdown_parts.append(f"{ticker}: ${float(val):,.0f}")
-                del aggregated[ticker]
-            
-            # List components in description
-            components_str = ', '.join(sorted_tickers)
-            
-            aggregated['S&P-track'] = {
-                'symbol': 'S&P-track',
-                'description': f'S&P 500 Trackers ({components_str})',
-                'total_quantity': total_qty,
-                'total_value': total_val,
-                'brokers': brokers,
-                'accounts': accounts,
-                'currency': 'USD',
-                'breakdown': "<br>".join(breakdown_parts)
-            }
-
         click.echo(f"Generating {chart_type} chart...")
         
         # Create the appropriate chart
         if chart_type == 'allocation':
-            fig = create_allocation_chart(aggregated, total_portfolio_value, top_n=top)
+            fig = create_allocation_chart(holdings, total_portfolio_value, top_n=top, currency=currency)
         elif chart_type == 'top-holdings':
-            fig = create_top_holdings_chart(aggregated, limit=top)
+            fig = create_top_holdings_chart(holdings, limit=top, currency=currency)
         elif chart_type == 'by-broker':
-            fig = create_broker_distribution_chart(aggregated)
+            fig = create_broker_distribution_chart(table.by_broker(), currency=currency)
         elif chart_type == 'concentration':
-            fig = create_concentration_chart(aggregated, total_portfolio_value)
+            fig = create_concentration_chart(holdings, total_portfolio_value)
         else:
             click.echo(f"Unknown chart type: {chart_type}")
             raise click.Abort()
@@ -661,6 +1135,8 @@ def plot(chart_type, top, output, no_browser):
         if not no_browser:
             click.echo("✓ Opening in browser...")
         
+    except click.Abort:
+        raise
     except Exception as e:
         click.echo(f"❌ Error: {e}", err=True)
         import traceback
@@ -668,5 +1144,191 @@ def plot(chart_type, top, output, no_browser):
         raise click.Abort()
 
 
+
+@cli.group()
+def fx():
+    """Exchange rates for totaling holdings in one currency
+    
+    Rates are cached by date in data/fx_rates.csv. `portfolio`, `plot` and
+    `status` convert other currencies to FENN_BASE_CURRENCY (or --currency)
+    at the latest cached rates.
+    """
+
+
+@fx.command('update')
+def fx_update():
+    """Cache today's exchange rates from SnapTrade"""
+    try:
+        result = SnapTradeClient().fetch_currency_rates()
+        if result.ok:
+            rates = FxRates()
+            added = rates.add_pairs(result.value)
+            rates.save()
+    except ValueError as e:
+        click.echo(f"❌ Configuration error: {e}", err=True)
+        raise click.Abort()
+    except Exception as e:
+        click.echo(f"❌ Error updating exchange rates: {e}", err=True)
+        raise click.Abort()
+    
+    if not result.ok:
+        click.echo(f"❌ Error fetching exchange rates: {result.error}", err=True)
+        raise click.Abort()
+    click.echo(f"✓ Cached {added} exchange rate(s) for {date.today().isoformat()} in {rates.path}")
+
+
+@fx.command('set')
+@click.argument('source')
+@click.argument('target')
+@click.argument('rate')
+@click.option('--date', 'day', help='Date the rate applies from (YYYY-MM-DD, default today)')
+def fx_set(source, target, rate, day):
+    """Record that one SOURCE is worth RATE TARGET, e.g. `fenn fx set EUR USD 1.09`"""
+    from decimal import Decimal, InvalidOperation
+    
+    try:
+        amount = Decimal(rate)
+    except InvalidOperation:
+        raise click.BadParameter(f"invalid rate {rate}", param_hint='RATE')
+    try:
+        rates = FxRates()
+        rates.add(day or date.today(), source, target, amount)
+        rates.save()
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    click.echo(f"✓ 1 {source.upper()} = {rate} {target.upper()} from {day or date.today().isoformat()}")
+
+
+@fx.command('list')
+@click.option('--currency', '-c', help='Currency to show rates into (default FENN_BASE_CURRENCY)')
+@click.option('--date', 'day', help='Show the rates in effect on this date (YYYY-MM-DD)')
+def fx_list(currency, day):
+    """Show the cached rates into the base currency"""
+    currency = (currency or Config.BASE_CURRENCY).upper()
+    try:
+        rates = FxRates()
+    except ValueError as e:
+        click.echo(f"❌ {e}", err=True)
+        raise click.Abort()
+    
+    codes = sorted({code for pairs in rates.rates.values() for pair in pairs for code in pair} - {currency})
+    if not codes:
+        click.echo("No exchange rates cached. Run 'fenn fx update' or 'fenn fx set'.")
+        return
+    
+    click.echo(f"{'Currency':<10} {'Rate':>16} {'As of':<10}")
+    for code in codes:
+        try:
+            rate, as_of = rates.rate(code, currency, day)
+            click.echo(f"{code:<10} {float(rate):>16,.6f} {as_of}")
+        except KeyError:
+            click.echo(f"{code:<10} {'N/A':>16}")
+    click.echo(f"\nUnits of {currency} per unit of each currency")
+
+
+@cli.group()
+def manual():
+    """Holdings SnapTrade does not report (data/manual_holdings.json)
+    
+    Manual holdings are merged into `portfolio` and `plot`. The file can be
+    edited by hand; these commands change it and its parsed cache together.
+    """
+
+
+def _amount_option(value, name):
+    """Decimal from a command-line amount, or None if not given"""
+    from decimal import Decimal, InvalidOperation
+    
+    if value is None:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise click.BadParameter(f"invalid number {value}", param_hint=name)
+
+
+@manual.command('list')
+def manual_list():
+    """Show the manual holdings"""
+    try:
+        holdings = ManualHoldings()
+    except (OSError, ValueError) as e:
+        click.echo(f"❌ {e}", err=True)
+        raise click.Abort()
+    
+    if not len(holdings):
+        click.echo("No manual holdings. Add one with 'fenn manual add SYMBOL QUANTITY'.")
+        return
+    
+    click.echo(f"{'Symbol':<10} {'Quantity':>15} {'Value':>15} {'Currency':<8} {'Account':<30} {'Institution':<20}")
+    click.echo("-" * 103)
+    for row in holdings.rows():
+        click.echo(f"{row['symbol']:<10} {float(row['quantity']):>15,.4f} {float(row['value']):>15,.2f} "
+                   f"{row['currency']:<8} {row['account_name']:<30} {row['institution_name']:<20}")
+    click.echo(f"\n{len(holdings)} manual holding(s) in {holdings.path}")
+
+
+@manual.command('add')
+@click.argument('symbol')
+@click.argument('quantity')
+@click.option('--price', help='Price per share (the value is quantity x price unless --value is given)')
+@click.option('--value', help='Total value of the position')
+@click.option('--avg-cost', help='Average cost per share, for `portfolio --gains`')
+@click.option('--account', 'account_name', help='Account name (default "Manual Account")')
+@click.option('--institution', 'institution_name', help='Broker or institution (default "Manual")')
+@click.option('--description', help='Full position name')
+@click.option('--currency', help='Currency of the price and value (default USD)')
+@click.option('--type', 'account_type', help='Account type, e.g. ESPP, RSU or IRA')
+@click.option('--notes', help='Notes kept with the holding')
+def manual_add(symbol, quantity, price, value, avg_cost, **fields):
+    """Add a holding of QUANTITY shares of SYMBOL"""
+    entry = holding_entry(symbol, _amount_option(quantity, 'QUANTITY'), _amount_option(price, '--price'),
+                          _amount_option(value, '--value'), _amount_option(avg_cost, '--avg-cost'), **fields)
+    try:
+        with ManualHoldings.edit() as holdings:
+            holdings.add(entry)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    except OSError as e:
+        click.echo(f"❌ Error saving manual holdings: {e}", err=True)
+        raise click.Abort()
+    click.echo(f"✓ Added {entry['quantity']} {symbol} ({len(holdings)} manual holding(s))")
+
+
+@manual.command('remove')
+@click.argument('symbol')
+@click.option('--account', 'account_name', help='Only remove the holding in this account')
+@click.option('--institution', 'institution_name', help='Only remove the holding at this institution')
+def manual_remove(symbol, account_name, institution_name):
+    """Remove the holdings of SYMBOL"""
+    try:
+        with ManualHoldings.edit() as holdings:
+            removed = holdings.remove(symbol, account_name, institution_name)
+    except (OSError, ValueError) as e:
+        click.echo(f"❌ Error updating manual holdings: {e}", err=True)
+        raise click.Abort()
+    if not removed:
+        click.echo(f"No manual holding of {symbol} to remove")
+        return
+    click.echo(f"✓ Removed {removed} holding(s) of {symbol} ({len(holdings)} left)")
+
+
+@manual.command('import')
+@click.argument('file', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--replace', is_flag=True, help='Replace all manual holdings instead of adding to them')
+def manual_import(file, replace):
+    """Add the holdings in FILE (JSON or CSV with the same fields)"""
+    try:
+        entries = read_entries(file)
+        with ManualHoldings.edit(load=not replace) as holdings:
+            if replace:
+                holdings.clear()
+            holdings.extend(entries, where=str(file))
+    except (OSError, ValueError) as e:
+        click.echo(f"❌ Error importing {file}: {e}", err=True)
+        raise click.Abort()
+    click.echo(f"✓ Imported {len(entries)} holding(s) from {file} ({len(holdings)} manual holding(s))")
+
+
 if __name__ == "__main__":
     main()
@@ -16,9 +16,70 @@ class Config:
     SNAPTRADE_USER_ID = os.getenv("SNAPTRADE_USER_ID", "jin_portfolio")
     SNAPTRADE_USER_SECRET = os.getenv("SNAPTRADE_USER_SECRET")
     
+    # Alternative API base URL, e.g. a local `fenn fake-server`
+    SNAPTRADE_API_HOST = os.getenv("SNAPTRADE_API_HOST")
+    
     # Data storage
     DATA_DIR = Path("../data")
     PORTFOLIO_DB = DATA_DIR / "portfolio.json"
+    SUMMARY_FILE = DATA_DIR / "portfolio.summary.json"
+    SNAPSHOT_DB = DATA_DIR / "snapshots.db"
+    ARCHIVE_DIR = DATA_DIR / "archive"
+    TIMESERIES_DIR = DATA_DIR / "timeseries"
+    METRICS_FILE = DATA_DIR / "sync_metrics.json"
+    METRICS_PROM_FILE = DATA_DIR / "sync_metrics.prom"
+    WATCH_STATUS_FILE = DATA_DIR / "watch_status.json"
+    SYMBOL_RULES_FILE = DATA_DIR / "symbol_rules.json"
+    MANUAL_HOLDINGS_FILE = DATA_DIR / "manual_holdings.json"
+    QUOTES_FILE = DATA_DIR / "quotes.csv"
+    FX_RATES_FILE = DATA_DIR / "fx_rates.csv"
+    
+    # Currency totals are converted into
+    BASE_CURRENCY = os.getenv("FENN_BASE_CURRENCY", "USD").upper()
+    
+    # Sync tuning
+    SYNC_MAX_WORKERS = int(os.getenv("FENN_SYNC_MAX_WORKERS", "8"))
+    
+    # Snapshot retention for `fenn compact`: every snapshot for RETAIN_ALL_DAYS,
+    # then one per day up to RETAIN_DAILY_DAYS, then one per month for
+    # RETAIN_MONTHLY_MONTHS (0 keeps monthly snapshots forever)
+    RETAIN_ALL_DAYS = int(os.getenv("FENN_RETAIN_ALL_DAYS", "7"))
+    RETAIN_DAILY_DAYS = int(os.getenv("FENN_RETAIN_DAILY_DAYS", "365"))
+    RETAIN_MONTHLY_MONTHS = int(os.getenv("FENN_RETAIN_MONTHLY_MONTHS", "0"))
+    # Unreferenced archive blobs younger than this (hours) are kept for in-flight syncs
+    ARCHIVE_GC_GRACE_HOURS = float(os.getenv("FENN_ARCHIVE_GC_GRACE_HOURS", "24"))
+    
+    # Holdings cache for `fenn portfolio`, in seconds: accounts older than
+    # HOLDINGS_MAX_AGE are refreshed in the background, and refetched before
+    # use once they are HOLDINGS_MAX_STALE past that
+    HOLDINGS_MAX_AGE = float(os.getenv("FENN_HOLDINGS_MAX_AGE", "21600"))
+    HOLDINGS_MAX_STALE = float(os.getenv("FENN_HOLDINGS_MAX_STALE", "86400"))
+    
+    # `fenn watch` schedule, in seconds: each connection is synced every
+    # WATCH_INTERVAL plus up to WATCH_JITTER, and connections due within
+    # WATCH_COALESCE of each other are synced together
+    WATCH_INTERVAL = float(os.getenv("FENN_WATCH_INTERVAL", "3600"))
+    WATCH_JITTER = float(os.getenv("FENN_WATCH_JITTER", "300"))
+    WATCH_COALESCE = float(os.getenv("FENN_WATCH_COALESCE", "60"))
+    WATCH_RETRY_DELAY = float(os.getenv("FENN_WATCH_RETRY_DELAY", "300"))
+    
+    # Positions listed per account by `fenn status`
+    STATUS_POSITIONS = int(os.getenv("FENN_STATUS_POSITIONS", "5"))
+    
+    # API resilience (rate limits are per brokerage and endpoint)
+    API_RATE_LIMIT = float(os.getenv("FENN_API_RATE_LIMIT", "5"))
+    API_RATE_BURST = int(os.getenv("FENN_API_RATE_BURST", "10"))
+    API_MAX_RETRIES = int(os.getenv("FENN_API_MAX_RETRIES", "3"))
+    API_RETRY_BASE_DELAY = float(os.getenv("FENN_API_RETRY_BASE_DELAY", "0.5"))
+    API_RETRY_MAX_DELAY = float(os.getenv("FENN_API_RETRY_MAX_DELAY", "8"))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("FENN_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_TIMEOUT = float(os.getenv("FENN_CIRCUIT_RESET_TIMEOUT", "60"))
+    
+    # Deadlines in seconds (0 disables) and hedged position requests
+    API_CALL_TIMEOUT = float(os.getenv("FENN_API_CALL_TIMEOUT", "30"))
+    SYNC_DEADLINE = float(os.getenv("FENN_SYNC_DEADLINE", "0"))
+    HEDGE_POSITIONS = os.getenv("FENN_HEDGE_POSITIONS", "").lower() in ("1", "true", "yes")
+    HEDGE_DEFAULT_DELAY = float(os.getenv("FENN_HEDGE_DEFAULT_DELAY", "5"))
     
     @classmethod
     def validate(cls):
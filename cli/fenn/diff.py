@@ -0,0 +1,172 @@
+"""Differences between two archived syncs
+
+Every archived snapshot lists a content hash per account record, so two
+syncs are compared hash by hash first: accounts whose records hash the same
+are identical and are never loaded. Only accounts whose hashes differ, or
+that exist on one side only, are read back from the archive and compared
+position by position, so a diff costs time in proportion to what changed
+rather than to the size of the portfolio.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from .archive import SnapshotArchive
+from .models import ZERO, Account, Balance, Position, parse_positions, to_plain
+
+
+@dataclass
+class PositionChange:
+    """A symbol added to, removed from or changed in an account"""
+    symbol: str
+    old: Optional[Position] = None
+    new: Optional[Position] = None
+    
+    @property
+    def status(self) -> str:
+        if self.old is None:
+            return "added"
+        if self.new is None:
+            return "removed"
+        return "changed"
+    
+    @property
+    def quantity_change(self) -> Decimal:
+        return (self.new.quantity if self.new else ZERO) - (self.old.quantity if self.old else ZERO)
+    
+    @property
+    def value_change(self) -> Decimal:
+        return (self.new.value if self.new else ZERO) - (self.old.value if self.old else ZERO)
+
+
+@dataclass
+class AccountDiff:
+    """Changes to one account between two syncs"""
+    account: Account
+    status: str
+    old_balance: Optional[Balance] = None
+    new_balance: Optional[Balance] = None
+    old_cash: Dict[str, Decimal] = field(default_factory=dict)
+    new_cash: Dict[str, Decimal] = field(default_factory=dict)
+    positions: List[PositionChange] = field(default_factory=list)
+    incomplete: bool = False
+    
+    @property
+    def balance_changed(self) -> bool:
+        old = (self.old_balance.amount, self.old_balance.currency) if self.old_balance else None
+        new = (self.new_balance.amount, self.new_balance.currency) if self.new_balance else None
+        return old != new
+    
+    @property
+    def cash_changed(self) -> bool:
+        return self.old_cash != self.new_cash
+    
+    @property
+    def changed(self) -> bool:
+        return self.status != "changed" or self.balance_changed or self.cash_changed or bool(self.positions)
+
+
+@dataclass
+class SnapshotDiff:
+    """Changes between two archived syncs"""
+    from_id: str
+    to_id: str
+    accounts: List[AccountDiff]
+    unchanged: int
+    compared: int
+
+
+def _positions_by_symbol(record: Dict[str, Any]) -> Dict[str, Position]:
+    """An account record's positions, merging repeated symbols"""
+    positions, _ = parse_positions(record.get("positions"))
+    merged: Dict[str, Position] = {}
+    for position in positions:
+        existing = merged.get(position.symbol)
+        if existing is None:
+            merged[position.symbol] = position
+            continue
+        quantity = existing.quantity + position.quantity
+        value = existing.value + position.value
+        merged[position.symbol] = Position(
+            symbol=position.symbol,
+            description=existing.description or position.description,
+            quantity=quantity,
+            price=value / quantity if quantity else ZERO,
+            currency=existing.currency
+        )
+    return merged
+
+
+def _cash_balances(record: Dict[str, Any]) -> Dict[str, Decimal]:
+    """Cash per currency from an account record's ``balances`` entries"""
+    balances = record.get("balances")
+    if isinstance(balances, dict):
+        balances = [balances]
+    cash: Dict[str, Decimal] = defaultdict(Decimal)
+    if isinstance(balances, list):
+        for item in map(to_plain, balances):
+            if isinstance(item, dict):
+                balance = Balance.from_raw(item)
+                if balance.amount is not None:
+                    cash[balance.currency] += balance.amount
+    return dict(cash)
+
+
+def diff_records(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> AccountDiff:
+    """Compare two versions of an account record (either may be missing)"""
+    old_account = Account.from_raw(old.get("info", {})) if old else None
+    new_account = Account.from_raw(new.get("info", {})) if new else None
+    status = "added" if old is None else "removed" if new is None else "changed"
+    
+    old_positions = _positions_by_symbol(old) if old else {}
+    new_positions = _positions_by_symbol(new) if new else {}
+    changes = []
+    for symbol in sorted(old_positions.keys() | new_positions.keys()):
+        before = old_positions.get(symbol)
+        after = new_positions.get(symbol)
+        if before and after and before.quantity == after.quantity and before.price == after.price:
+            continue
+        changes.append(PositionChange(symbol, before, after))
+    
+    return AccountDiff(
+        account=new_account or old_account,
+        status=status,
+        old_balance=old_account.balance if old_account else None,
+        new_balance=new_account.balance if new_account else None,
+        old_cash=_cash_balances(old) if old else {},
+        new_cash=_cash_balances(new) if new else {},
+        positions=changes,
+        incomplete=bool((old and old.get("errors")) or (new and new.get("errors")))
+    )
+
+
+def diff_snapshots(archive: SnapshotArchive, from_id: str, to_id: str) -> SnapshotDiff:
+    """Compare two archived syncs, loading only the accounts that differ
+    
+    Raises:
+        KeyError: If either snapshot does not exist
+    """
+    old_hashes = {account_id: digest for account_id, digest in archive.account_hashes(from_id) if account_id}
+    new_hashes = {account_id: digest for account_id, digest in archive.account_hashes(to_id) if account_id}
+    
+    accounts = []
+    unchanged = compared = 0
+    # Accounts in the order of the newer sync, then the ones it no longer has
+    for account_id in list(new_hashes) + [a for a in old_hashes if a not in new_hashes]:
+        old_digest = old_hashes.get(account_id)
+        new_digest = new_hashes.get(account_id)
+        if old_digest == new_digest:
+            unchanged += 1
+            continue
+        
+        compared += 1
+        account_diff = diff_records(
+            archive.get(old_digest) if old_digest else None,
+            archive.get(new_digest) if new_digest else None
+        )
+        # Records can differ in fields that are not compared (e.g. errors)
+        if account_diff.changed or account_diff.incomplete:
+            accounts.append(account_diff)
+    
+    return SnapshotDiff(from_id, to_id, accounts, unchanged, compared)
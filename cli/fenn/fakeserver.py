@@ -0,0 +1,365 @@
+"""Local SnapTrade stand-in for offline sync testing and load tests
+
+The server speaks the subset of the SnapTrade HTTP API that Fenn uses, so
+``SnapTradeClient`` can be pointed at it with ``SNAPTRADE_API_HOST``. It
+runs in one of three modes:
+
+- synthetic: serves a generated portfolio of any size
+- record: proxies to the real API and saves every response to a cassette
+  directory
+- replay: serves previously recorded responses without network access
+
+In every mode latency, throttling (429), server errors and hung requests
+can be injected.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+
+API_PREFIX = "/api/v1"
+
+# Query parameters that change on every request and are not part of a cassette key
+VOLATILE_PARAMS = {"clientId", "timestamp", "userId", "userSecret"}
+
+# Request headers forwarded upstream when recording
+FORWARDED_HEADERS = ("Accept", "Content-Type", "Signature", "User-Agent")
+
+INSTITUTIONS = ["Fidelity", "Robinhood", "E-Trade", "Schwab", "Vanguard"]
+SYMBOLS = [
+    "VOO", "SPY", "IVV", "FXAIX", "QQQ", "VTI", "AAPL", "MSFT", "GOOG", "GOOGL",
+    "AMZN", "NVDA", "META", "BRK.B", "TSLA", "JPM", "V", "UNH", "XOM", "JNJ"
+]
+# Units of each currency per US dollar, served by /currencies/rates
+RATES_PER_USD = {"USD": 1.0, "CAD": 1.37, "EUR": 0.92, "GBP": 0.79, "JPY": 149.5, "CHF": 0.88, "AUD": 1.52}
+
+
+def _uuid(*parts: Any) -> str:
+    """Stable UUID for synthetic entities"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "fenn-fake/" + "/".join(map(str, parts))))
+
+
+def _currency(code: str = "USD") -> Dict[str, str]:
+    return {"id": _uuid("currency", code), "code": code, "name": code}
+
+
+class SyntheticPortfolio:
+    """Deterministic generated portfolio of arbitrary size"""
+    
+    def __init__(self, connections: int = 3, accounts: int = 10, positions: int = 20, seed: int = 0,
+                 currencies: Optional[List[str]] = None):
+        self.seed = seed
+        self.positions_per_account = positions
+        # Accounts are denominated in these currencies in turn
+        self.currencies = currencies or ["USD"]
+        synced_at = (datetime.utcnow() - timedelta(hours=1)).replace(microsecond=0).isoformat() + "Z"
+        
+        self.connections = [
+            {
+                "id": _uuid("connection", seed, i),
+                "created_date": "2026-01-01T00:00:00Z",
+                "updated_date": synced_at,
+                "brokerage": {
+                    "id": _uuid("brokerage", INSTITUTIONS[i % len(INSTITUTIONS)]),
+                    "slug": INSTITUTIONS[i % len(INSTITUTIONS)].upper(),
+                    "name": INSTITUTIONS[i % len(INSTITUTIONS)]
+                },
+                "name": f"Connection {i + 1}",
+                "type": "read",
+                "disabled": False,
+                "disabled_date": None,
+                "meta": {}
+            }
+            for i in range(max(1, connections))
+        ]
+        
+        self.accounts = []
+        for i in range(accounts):
+            connection = self.connections[i % len(self.connections)]
+            self.accounts.append({
+                "id": _uuid("account", seed, i),
+                "brokerage_authorization": connection["id"],
+                "name": f"{connection['brokerage']['name']} Account {i + 1}",
+                "number": f"X{i:07d}",
+                "institution_name": connection["brokerage"]["name"],
+                "created_date": "2026-01-01T00:00:00Z",
+                "sync_status": {
+                    "transactions": {"initial_sync_completed": True, "last_successful_sync": synced_at[:10]},
+                    "holdings": {"initial_sync_completed": True, "last_successful_sync": synced_at}
+                },
+                "balance": {"total": {"amount": 0.0, "currency": self.currencies[i % len(self.currencies)]}},
+                "status": "open",
+                "raw_type": "Individual",
+                "meta": {},
+                "is_paper": False
+            })
+        self._accounts_by_id = {account["id"]: account for account in self.accounts}
+        self._positions: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        
+        # Totals need the positions, so fill them in up front
+        for account in self.accounts:
+            total = sum(p["units"] * p["price"] for p in self.positions(account["id"]))
+            account["balance"]["total"]["amount"] = round(total, 2)
+    
+    def account(self, account_id: str) -> Optional[Dict[str, Any]]:
+        return self._accounts_by_id.get(account_id)
+    
+    def positions(self, account_id: str) -> List[Dict[str, Any]]:
+        """Positions for an account, generated on first request"""
+        with self._lock:
+            if account_id not in self._positions:
+                rng = random.Random(f"{self.seed}/{account_id}")
+                currency = _currency(self.currency(account_id))
+                positions = []
+                for k in range(self.positions_per_account):
+                    ticker = SYMBOLS[k] if k < len(SYMBOLS) else f"SYN{k:05d}"
+                    price = round(rng.uniform(5, 800), 2)
+                    positions.append({
+                        "symbol": {
+                            "symbol": {
+                                "id": _uuid("symbol", ticker),
+                                "symbol": ticker,
+                                "raw_symbol": ticker,
+                                "description": f"{ticker} Synthetic Security",
+                                "currency": currency,
+                                "exchange": None,
+                                "type": {"id": _uuid("type", "cs"), "code": "cs", "description": "Common Stock",
+                                         "is_supported": True},
+                                "currencies": [currency]
+                            },
+                            "id": _uuid("position-symbol", account_id, ticker),
+                            "description": f"{ticker} Synthetic Security"
+                        },
+                        "units": round(rng.uniform(0.5, 500), 6),
+                        "price": price,
+                        "open_pnl": 0.0,
+                        "average_purchase_price": round(price * rng.uniform(0.6, 1.2), 2),
+                        "fractional_units": None,
+                        "currency": currency,
+                        "cash_equivalent": False
+                    })
+                self._positions[account_id] = positions
+            return self._positions[account_id]
+    
+    def currency(self, account_id: str) -> str:
+        return self.account(account_id)["balance"]["total"]["currency"]
+    
+    def balances(self, account_id: str) -> List[Dict[str, Any]]:
+        return [{"currency": _currency(self.currency(account_id)), "cash": 1000.0, "buying_power": 1000.0}]
+    
+    def holdings(self, account_id: str) -> Dict[str, Any]:
+        account = self.account(account_id)
+        return {
+            "account": account,
+            "balances": self.balances(account_id),
+            "positions": self.positions(account_id),
+            "option_positions": [],
+            "orders": [],
+            "total_value": {"value": account["balance"]["total"]["amount"], "currency": self.currency(account_id)}
+        }
+    
+    def route(self, method: str, path: str) -> Tuple[int, Any]:
+        """Status and JSON body for a request path (without the API prefix)"""
+        if method == "POST" and path == "/snapTrade/registerUser":
+            return 200, {"userId": "fenn-fake-user", "userSecret": "fenn-fake-secret"}
+        if method != "GET":
+            return 404, {"detail": "Not found"}
+        if path == "/authorizations":
+            return 200, self.connections
+        if path == "/accounts":
+            return 200, self.accounts
+        if path == "/holdings":
+            return 200, [self.holdings(a["id"]) for a in self.accounts]
+        if path == "/currencies/rates":
+            return 200, [
+                {"src": _currency("USD"), "dst": _currency(code), "exchange_rate": rate}
+                for code, rate in RATES_PER_USD.items() if code != "USD"
+            ]
+        
+        match = re.fullmatch(r"/accounts/([^/]+)(?:/(balances|positions|holdings))?", path)
+        if match:
+            account_id, resource = match.groups()
+            if self.account(account_id) is None:
+                return 404, {"detail": "Account not found"}
+            if resource is None:
+                return 200, self.account(account_id)
+            return 200, getattr(self, resource)(account_id)
+        
+        return 404, {"detail": "Not found"}
+
+
+class Cassette:
+    """Directory of recorded responses keyed by method, path and stable query"""
+    
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+    
+    @staticmethod
+    def key(method: str, path: str, query: str) -> str:
+        params = sorted((k, v) for k, v in parse_qsl(query) if k not in VOLATILE_PARAMS)
+        stable = "&".join(f"{k}={v}" for k, v in params)
+        return f"{method} {path}" + (f"?{stable}" if stable else "")
+    
+    def _file(self, key: str) -> Path:
+        return self.directory / (hashlib.sha1(key.encode()).hexdigest() + ".json")
+    
+    def load(self, key: str) -> Optional[Tuple[int, bytes]]:
+        file = self._file(key)
+        if not file.exists():
+            return None
+        with open(file, "r") as f:
+            entry = json.load(f)
+        return entry["status"], entry["body"].encode()
+    
+    def save(self, key: str, status: int, body: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self._file(key), "w") as f:
+            json.dump({"key": key, "status": status, "body": body.decode()}, f, indent=2)
+
+
+class Faults:
+    """Latency and failure injection settings"""
+    
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, rate_429: float = 0,
+                 rate_5xx: float = 0, hang_rate: float = 0, path_pattern: Optional[str] = None,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.hang_rate = hang_rate
+        self.path_pattern = re.compile(path_pattern) if path_pattern else None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    def pick(self, path: str) -> Optional[str]:
+        """Sleep for the configured latency and choose a fault for this request"""
+        delay = self.latency_ms + (self._uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        
+        if self.path_pattern and not self.path_pattern.search(path):
+            return None
+        roll = self._uniform(0, 1)
+        if roll < self.hang_rate:
+            return "hang"
+        if roll < self.hang_rate + self.rate_429:
+            return "429"
+        if roll < self.hang_rate + self.rate_429 + self.rate_5xx:
+            return "5xx"
+        return None
+    
+    def _uniform(self, low: float, high: float) -> float:
+        with self._lock:
+            return self._rng.uniform(low, high)
+
+
+class FakeSnapTradeServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering SnapTrade API requests
+    
+    Exactly one of ``portfolio`` (synthetic), ``upstream`` plus ``cassette``
+    (record) or ``cassette`` alone (replay) selects the mode.
+    """
+    daemon_threads = True
+    
+    def __init__(self, address: Tuple[str, int], portfolio: Optional[SyntheticPortfolio] = None,
+                 cassette: Optional[Cassette] = None, upstream: Optional[str] = None,
+                 faults: Optional[Faults] = None, quiet: bool = True):
+        super().__init__(address, _Handler)
+        self.portfolio = portfolio
+        self.cassette = cassette
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.faults = faults or Faults()
+        self.quiet = quiet
+        self.stopped = threading.Event()
+    
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+    
+    def server_close(self):
+        self.stopped.set()
+        super().server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeSnapTradeServer
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        self._handle("GET")
+    
+    def do_POST(self):
+        self._handle("POST")
+    
+    def do_DELETE(self):
+        self._handle("DELETE")
+    
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+    
+    def _handle(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        request_body = self.rfile.read(length) if length else b""
+        
+        url = urlsplit(self.path)
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+        
+        fault = self.server.faults.pick(path)
+        if fault == "hang":
+            # Never answer; the connection is dropped when the server stops
+            self.server.stopped.wait()
+            return
+        if fault == "429":
+            return self._send(429, b'{"detail": "Too many requests"}', {"Retry-After": "1"})
+        if fault == "5xx":
+            return self._send(503, b'{"detail": "Service unavailable"}')
+        
+        if self.server.portfolio is not None:
+            status, body = self.server.portfolio.route(method, path)
+            return self._send(status, json.dumps(body).encode())
+        
+        key = Cassette.key(method, path, url.query)
+        if self.server.upstream:
+            status, body = self._forward(method, request_body)
+            self.server.cassette.save(key, status, body)
+            return self._send(status, body)
+        
+        recorded = self.server.cassette.load(key)
+        if recorded is None:
+            return self._send(404, json.dumps({"detail": f"No recording for {key}"}).encode())
+        return self._send(*recorded)
+    
+    def _forward(self, method: str, body: bytes) -> Tuple[int, bytes]:
+        """Send the request unchanged to the real API"""
+        target = self.server.upstream + self.path[len(API_PREFIX):]
+        headers = {h: self.headers[h] for h in FORWARDED_HEADERS if self.headers.get(h)}
+        request = urllib.request.Request(target, data=body or None, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+    
+    def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
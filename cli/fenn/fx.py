@@ -0,0 +1,177 @@
+"""Exchange rates for valuing holdings in one base currency
+
+Positions and balances keep the currency they are reported in. Totals are
+converted to a base currency (``FENN_BASE_CURRENCY``, USD by default) with
+rates from a local table, ``data/fx_rates.csv``, kept by date:
+
+    date,from,to,rate
+    2026-10-18,USD,CAD,1.37
+
+meaning one unit of ``from`` was worth ``rate`` units of ``to`` that day.
+``fenn fx update`` adds the day's rates from SnapTrade and ``fenn fx set``
+adds one by hand. A conversion uses the latest rates on or before the day
+asked for; a pair that is not in the table is derived from its inverse or
+through a currency both sides have a rate with, so USD-quoted rates are
+enough to convert between any two currencies.
+
+Rates are looked up once per currency, not per position: ``conversion``
+returns one rate per currency, and ``PositionTable.convert`` applies them
+to every position at once.
+"""
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .config import Config
+from .storage import atomic_open
+
+ONE = Decimal(1)
+
+
+def _day(value: Union[date, str, None]) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    return date.fromisoformat(str(value)[:10]).isoformat()
+
+
+class FxRates:
+    """Exchange rates by date, cached in a CSV file
+    
+    Args:
+        path: Rates file; defaults to ``Config.FX_RATES_FILE``
+    
+    Raises:
+        ValueError: If the file has malformed rows
+    """
+    
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or Config.FX_RATES_FILE)
+        # date -> (from, to) -> rate
+        self.rates: Dict[str, Dict[Tuple[str, str], Decimal]] = {}
+        if self.path.exists():
+            self._load()
+    
+    def _load(self):
+        with open(self.path, "r", newline="") as f:
+            reader = csv.DictReader(f)
+            if not {"date", "from", "to", "rate"} <= set(reader.fieldnames or []):
+                raise ValueError(f"{self.path} needs a header row with date, from, to and rate columns")
+            for row in reader:
+                try:
+                    self.add(row["date"], row["from"], row["to"], Decimal(row["rate"]))
+                except (InvalidOperation, ValueError, TypeError) as e:
+                    raise ValueError(f"{self.path}:{reader.line_num}: {e}") from None
+    
+    def save(self):
+        """Write the table back to its file"""
+        with atomic_open(self.path, "w") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["date", "from", "to", "rate"])
+            for day in sorted(self.rates):
+                for (source, target), rate in sorted(self.rates[day].items()):
+                    writer.writerow([day, source, target, str(rate)])
+    
+    def add(self, day: Union[date, str], source: str, target: str, rate: Decimal):
+        """Record that one ``source`` was worth ``rate`` ``target`` on ``day``"""
+        source, target = source.strip().upper(), target.strip().upper()
+        if not source or not target:
+            raise ValueError("currency codes cannot be empty")
+        if not rate.is_finite() or rate <= 0:
+            raise ValueError(f"invalid {source}/{target} rate {rate}")
+        if source != target:
+            self.rates.setdefault(_day(day), {})[(source, target)] = rate
+    
+    def add_pairs(self, pairs: Iterable[dict], day: Union[date, str, None] = None) -> int:
+        """Record SnapTrade exchange rate pairs (``{"src", "dst", "exchange_rate"}``)
+        
+        Returns:
+            Number of rates recorded
+        """
+        day = _day(day) or date.today().isoformat()
+        added = 0
+        for pair in pairs:
+            source, target = pair.get("src"), pair.get("dst")
+            source = source.get("code") if isinstance(source, dict) else source
+            target = target.get("code") if isinstance(target, dict) else target
+            if not source or not target or not pair.get("exchange_rate"):
+                continue
+            self.add(day, str(source), str(target), Decimal(str(pair["exchange_rate"])))
+            added += 1
+        return added
+    
+    def dates(self) -> List[str]:
+        return sorted(self.rates)
+    
+    # Lookups
+    
+    def _rate_on(self, day: str, source: str, target: str) -> Optional[Decimal]:
+        pairs = self.rates[day]
+        if (source, target) in pairs:
+            return pairs[(source, target)]
+        if (target, source) in pairs:
+            return ONE / pairs[(target, source)]
+        
+        # Through a currency both sides are quoted against
+        worth: Dict[str, Decimal] = {}
+        for (a, b), rate in pairs.items():
+            if a == source:
+                worth[b] = rate
+            elif b == source:
+                worth[a] = ONE / rate
+        for via in sorted(worth, key=lambda code: code != "USD"):
+            if (via, target) in pairs:
+                return worth[via] * pairs[(via, target)]
+            if (target, via) in pairs:
+                return worth[via] / pairs[(target, via)]
+        return None
+    
+    def rate(self, source: str, target: str, on: Union[date, str, None] = None) -> Tuple[Decimal, Optional[str]]:
+        """Units of ``target`` one ``source`` was worth, and the date of the rate
+        
+        Uses the latest rates on or before ``on`` (default: the latest).
+        
+        Raises:
+            KeyError: If no rate between the two currencies is known
+        """
+        if source == target:
+            return ONE, None
+        on = _day(on)
+        for day in reversed(self.dates()):
+            if on is not None and day > on:
+                continue
+            rate = self._rate_on(day, source, target)
+            if rate is not None:
+                return rate, day
+        raise KeyError(f"No {source}/{target} exchange rate" + (f" on or before {on}" if on else ""))
+    
+    def partial_conversion(self, currencies: Iterable[str], base: str, on: Union[date, str, None] = None
+                           ) -> Tuple[Dict[str, Decimal], Optional[str], List[str]]:
+        """Rate into ``base`` for each currency that has one, the latest date
+        among them, and the currencies without a rate"""
+        rates, latest, missing = {}, None, []
+        for currency in sorted(set(currencies)):
+            try:
+                rates[currency], day = self.rate(currency, base, on)
+            except KeyError:
+                missing.append(currency)
+                continue
+            if day is not None and (latest is None or day > latest):
+                latest = day
+        return rates, latest, missing
+    
+    def conversion(self, currencies: Iterable[str], base: str,
+                   on: Union[date, str, None] = None) -> Tuple[Dict[str, Decimal], Optional[str]]:
+        """Rate into ``base`` for each currency, and the latest date among them
+        
+        Raises:
+            KeyError: Naming every currency without a rate
+        """
+        rates, latest, missing = self.partial_conversion(currencies, base, on)
+        if missing:
+            raise KeyError(f"No exchange rate into {base} for {', '.join(missing)}"
+                           + (f" on or before {_day(on)}" if on else "") + "; run 'fenn fx update'")
+        return rates, latest
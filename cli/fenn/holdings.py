@@ -0,0 +1,240 @@
+"""Per-account holdings cache for ``fenn portfolio``
+
+Holdings fetched by ``fenn portfolio`` are kept as ``holdings`` snapshots in
+the snapshot store, and every account in a snapshot records when its own
+holdings were fetched. An account's entry is fresh for ``max_age`` seconds.
+After that it is still served for up to ``max_stale`` more seconds while a
+background process refreshes it, and is refetched before use once it is
+older than that. Accounts whose last fetch failed are always refetched.
+When the latest ``fenn sync`` is newer than the latest holdings fetch, its
+positions seed the cache instead, so a sync is never followed by a refetch.
+
+A refresh fetches only the accounts that need it and writes a new snapshot
+in which every other account is carried forward unchanged, with its
+original fetch time. Only one process refreshes at a time: another one
+waits for it, and for any running ``fenn sync``, and then fetches only
+what they did not.
+"""
+import re
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from .config import Config
+from .models import Account, parse_accounts, parse_positions
+from .storage import file_lock, is_locked, lock_file, wait_for
+from .store import AccountRecord, SnapshotStore
+
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> float:
+    """Seconds in a duration such as ``90``, ``90s``, ``30m``, ``6h`` or ``2d``
+    
+    Raises:
+        ValueError: If the duration is malformed
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", str(value).lower())
+    if not match:
+        raise ValueError(f"Invalid duration: {value!r} (use e.g. 90s, 30m, 6h or 2d)")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+
+
+def _utc_time(timestamp: str) -> datetime:
+    """UTC time of a snapshot timestamp; naive ones are UTC, like the sync's"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def _timestamp(moment: datetime) -> str:
+    """ISO timestamp in naive UTC, as syncs are stamped"""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class HoldingsCache:
+    """The latest holdings of every account, with per-account freshness
+    
+    Args:
+        store: Snapshot store holding the cache
+        max_age: Seconds an account's holdings are fresh
+        max_stale: Seconds past ``max_age`` that they may still be served
+            while they are refreshed in the background
+    """
+    
+    def __init__(self, store: SnapshotStore, max_age: Optional[float] = None,
+                 max_stale: Optional[float] = None):
+        self.store = store
+        self.max_age = Config.HOLDINGS_MAX_AGE if max_age is None else max_age
+        self.max_stale = Config.HOLDINGS_MAX_STALE if max_stale is None else max_stale
+        self.lock_path = lock_file(store.path.parent, "holdings")
+        self.sync_lock_path = lock_file(store.path.parent, "sync")
+        self._load()
+    
+    def _load(self):
+        """Start from the latest holdings fetch, or from the latest sync if that is newer"""
+        self.source: Optional[str] = None
+        self.records: List[AccountRecord] = []
+        self.fetched_at: Dict[str, datetime] = {}
+        
+        candidates = []
+        for source in ("holdings", "sync"):
+            snapshot = self.store.latest_snapshot(source)
+            if snapshot is not None:
+                candidates.append((_utc_time(snapshot["taken_at"]), snapshot))
+        if candidates:
+            _, snapshot = max(candidates, key=lambda candidate: candidate[0])
+            self.source = snapshot["source"]
+            self.records = self.store.records(snapshot["id"])
+            self.fetched_at = {
+                account_id: _utc_time(fetched)
+                for account_id, fetched in self.store.fetched_times(snapshot["id"]).items()
+            }
+    
+    def age(self, account_id: str, now: Optional[datetime] = None) -> Optional[timedelta]:
+        """How long ago an account's holdings were fetched, or None if never"""
+        fetched = self.fetched_at.get(account_id)
+        return None if fetched is None else (now or datetime.now(timezone.utc)) - fetched
+    
+    def _older_than(self, seconds: float, now: Optional[datetime]) -> List[str]:
+        limit = timedelta(seconds=seconds)
+        ids = []
+        for account, _, errors in self.records:
+            age = self.age(account.id, now)
+            if errors or age is None or age > limit:
+                ids.append(account.id)
+        return ids
+    
+    def expired(self, now: Optional[datetime] = None) -> List[str]:
+        """Accounts that are due for a refresh (stale or failed)"""
+        return self._older_than(self.max_age, now)
+    
+    def unusable(self, now: Optional[datetime] = None) -> List[str]:
+        """Accounts too old (or failed) to serve before refreshing them"""
+        return self._older_than(self.max_age + self.max_stale, now)
+    
+    def kept(self) -> List[str]:
+        """Accounts whose last refresh failed and that are served their earlier holdings"""
+        # A failed sync's positions may be partial, so only fetches keep them
+        if self.source != "holdings":
+            return []
+        return [account.id for account, positions, errors in self.records if errors and positions]
+    
+    def refreshing(self) -> bool:
+        """Whether another process is refreshing holdings right now"""
+        return is_locked(self.lock_path)
+    
+    def refresh(self, client, account_ids: Optional[List[str]] = None,
+                progress: Optional[Callable[[Account, int, int, Optional[str]], None]] = None,
+                blocking: bool = True, on_wait: Optional[Callable[[], None]] = None) -> List[AccountRecord]:
+        """Refetch some accounts, or every account (including new ones), and save the result
+        
+        A partial refresh fetches each account individually; a full one
+        lists the user's accounts again and uses the bulk holdings request.
+        An account that fails to refresh keeps its previous holdings, marked
+        with the error (see ``kept``), so it is retried next time.
+        
+        If another refresh or a sync is running, this waits for it and then
+        skips the accounts it fetched, so concurrent commands never fetch
+        the same holdings twice.
+        
+        Args:
+            client: ``SnapTradeClient`` to fetch with
+            account_ids: Accounts to refresh; None refreshes all of them
+            progress: Called with (account, positions, positions skipped,
+                error) for each refreshed account
+            blocking: Wait for a refresh in another process; otherwise
+                leave the cache as it is if one is running
+            on_wait: Called before waiting for another process
+        
+        Returns:
+            The updated records, which are also the cache's new contents
+        """
+        known = dict(self.fetched_at)
+        try:
+            with file_lock(self.lock_path, blocking=blocking, on_wait=on_wait) as waited:
+                # A sync fetches the same holdings, so let it finish and reuse them
+                if wait_for(self.sync_lock_path, on_wait) or waited:
+                    self._load()
+                    # Accounts fetched while this process was waiting
+                    fresh = {
+                        account.id for account, _, errors in self.records
+                        if not errors and account.id in self.fetched_at
+                        and (account.id not in known or self.fetched_at[account.id] > known[account.id])
+                    }
+                    if account_ids is None:
+                        if self.records and len(fresh) == len(self.records):
+                            return self.records
+                    else:
+                        account_ids = [account_id for account_id in account_ids if account_id not in fresh]
+                        if not account_ids:
+                            return self.records
+                return self._fetch(client, account_ids, progress)
+        except BlockingIOError:
+            return self.records
+    
+    def _fetch(self, client, account_ids: Optional[List[str]],
+               progress: Optional[Callable[[Account, int, int, Optional[str]], None]]) -> List[AccountRecord]:
+        now = datetime.now(timezone.utc)
+        cached = {account.id: (account, positions, errors) for account, positions, errors in self.records}
+        
+        if account_ids is None:
+            # Saving an empty listing would show an empty portfolio until it expires
+            result = client.fetch_accounts()
+            if not result.ok:
+                raise RuntimeError(f"Could not list accounts: {result.error}")
+            accounts = parse_accounts(result.value)
+            refreshing = {account.id for account in accounts}
+            holdings, errors = client.get_all_holdings(list(refreshing))
+        else:
+            accounts = [account for account, _, _ in self.records]
+            refreshing = set(account_ids)
+            holdings, errors = client.get_all_holdings(list(refreshing), bulk=False)
+        
+        records = []
+        fetched_at = {}
+        for account in accounts:
+            previous = cached.get(account.id)
+            if account.id not in refreshing:
+                records.append(previous)
+                fetched_at[account.id] = _timestamp(self.fetched_at[account.id])
+                continue
+            
+            if account.id in errors:
+                records.append((account, previous[1] if previous else [], errors[account.id]))
+                if account.id in self.fetched_at:
+                    fetched_at[account.id] = _timestamp(self.fetched_at[account.id])
+                if progress:
+                    progress(account, 0, 0, errors[account.id])
+                continue
+            
+            holdings_data = holdings.get(account.id, {})
+            # Holdings carry the account's current details, e.g. its balance
+            info = holdings_data.get("account")
+            if isinstance(info, dict) and info.get("id") == account.id:
+                account = Account.from_raw(info)
+            positions, skipped = parse_positions(holdings_data.get("positions"))
+            records.append((account, positions, None))
+            fetched_at[account.id] = _timestamp(now)
+            if progress:
+                progress(account, len(positions), skipped, None)
+        
+        self.store.add_snapshot("holdings", records, taken_at=_timestamp(now), fetched_at=fetched_at)
+        self.source = "holdings"
+        self.records = records
+        self.fetched_at = {account_id: _utc_time(fetched) for account_id, fetched in fetched_at.items()}
+        return records
+
+
+def spawn_refresh():
+    """Start ``fenn portfolio --revalidate`` in the background"""
+    # A frozen (PyInstaller) build is the fenn executable itself
+    command = [sys.executable] if getattr(sys, "frozen", False) else [sys.executable, "-m", "fenn"]
+    subprocess.Popen(
+        command + ["portfolio", "--revalidate"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
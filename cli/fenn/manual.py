@@ -0,0 +1,463 @@
+"""Manual holdings: positions SnapTrade does not report
+
+Holdings kept by hand (ESPP and RSU shares, private holdings) live in
+``data/manual_holdings.json`` and are merged into ``fenn portfolio`` and
+``fenn plot`` as ``ManualTotals``: the holdings summed per account, symbol
+and currency, in fixed-point columns ready for ``PositionTable.add_rows``.
+The file is validated and summed once per version of it, and only the
+totals are cached, in ``data/manual_holdings.cache.json``. The cache is
+keyed by the file's size and mtime, with its SHA-256 as a fallback, so an
+unchanged file costs a ``stat`` (a touched but unchanged one, a hash) and a
+read of its totals, however many holdings it lists.
+
+``ManualHoldings`` is the file itself, parsed in full, for ``fenn manual``.
+``add``, ``remove`` and ``import`` validate only the holdings they add, and
+write the file and its cached totals together so the next reader finds the
+cache current.
+"""
+import csv
+import hashlib
+import json
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .aggregate import NO_COST, PositionTable
+from .config import Config
+from .models import Account
+from .storage import atomic_write, file_lock, lock_file
+from .timeseries import MONEY_SCALE, QUANTITY_SCALE, from_fixed, to_fixed
+
+CACHE_VERSION = 3
+
+DEFAULT_ACCOUNT = "Manual Account"
+DEFAULT_INSTITUTION = "Manual"
+
+# Parsed columns, one row per holding
+COLUMNS = ("account", "symbol", "description", "quantity", "price", "value", "currency", "cost")
+
+# Fields read as amounts when importing CSV files
+AMOUNT_FIELDS = ("quantity", "price", "value", "avg_cost")
+
+
+def _amount(entry: Dict[str, Any], field: str) -> Optional[Decimal]:
+    value = entry.get(field)
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{field} must be a number, not {value!r}")
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{field} must be a number, not {value!r}") from None
+    if not amount.is_finite():
+        raise ValueError(f"{field} must be a finite number, not {value!r}")
+    return amount
+
+
+def _text(entry: Dict[str, Any], field: str, default: str = "") -> str:
+    value = entry.get(field)
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string, not {value!r}")
+    return value.strip() or default
+
+
+def parse_holding(entry: Any) -> Tuple[Tuple[str, str], Dict[str, Any]]:
+    """(account name, institution) and parsed row of one holding
+    
+    Raises:
+        ValueError: If the holding is invalid
+    """
+    if not isinstance(entry, dict):
+        raise ValueError(f"expected an object, not {entry!r}")
+    symbol = _text(entry, "symbol")
+    if not symbol:
+        raise ValueError("symbol is required")
+    quantity = _amount(entry, "quantity")
+    if quantity is None:
+        raise ValueError(f"{symbol}: quantity is required")
+    price = _amount(entry, "price") or Decimal(0)
+    value = _amount(entry, "value")
+    avg_cost = _amount(entry, "avg_cost")
+    if price < 0:
+        raise ValueError(f"{symbol}: price cannot be negative")
+    if avg_cost is not None and avg_cost < 0:
+        raise ValueError(f"{symbol}: avg_cost cannot be negative")
+    currency = _text(entry, "currency", "USD").upper()
+    if not currency.isalpha():
+        raise ValueError(f"{symbol}: invalid currency {currency!r}")
+    
+    account = (_text(entry, "account_name", DEFAULT_ACCOUNT), _text(entry, "institution_name", DEFAULT_INSTITUTION))
+    row = {
+        "symbol": symbol,
+        "description": _text(entry, "description"),
+        "quantity": to_fixed(quantity, QUANTITY_SCALE),
+        "price": to_fixed(price, MONEY_SCALE),
+        "value": to_fixed(quantity * price if value is None else value, MONEY_SCALE),
+        "currency": currency,
+        "cost": None if avg_cost is None else to_fixed(quantity * avg_cost, MONEY_SCALE),
+    }
+    return account, row
+
+
+def _number(amount: Decimal):
+    """JSON form of an amount: a number when that is exact, else a string"""
+    if not amount.is_finite():
+        return str(amount)
+    if amount == amount.to_integral_value():
+        return int(amount)
+    if Decimal(repr(float(amount))) == amount:
+        return float(amount)
+    return str(amount)
+
+
+def holding_entry(symbol: str, quantity: Decimal, price: Optional[Decimal] = None,
+                  value: Optional[Decimal] = None, avg_cost: Optional[Decimal] = None,
+                  **fields: Optional[str]) -> Dict[str, Any]:
+    """Holding as written in the file, leaving out fields that are not given"""
+    entry: Dict[str, Any] = {"symbol": symbol, "description": fields.pop("description", None),
+                             "quantity": _number(quantity)}
+    if price is not None:
+        entry["price"] = _number(price)
+    if value is not None:
+        entry["value"] = _number(value)
+    if avg_cost is not None:
+        entry["avg_cost"] = _number(avg_cost)
+    entry.update(fields)
+    return {field: given for field, given in entry.items() if given is not None}
+
+
+def read_entries(path: Path) -> List[Dict[str, Any]]:
+    """Holdings in a file to import: a manual holdings file, a JSON list of
+    holdings, or a CSV file with a header row of field names
+    
+    Raises:
+        ValueError: If the file cannot be read as holdings
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        with open(path, "r", newline="") as f:
+            reader = csv.DictReader(f)
+            if "symbol" not in (reader.fieldnames or []):
+                raise ValueError(f"{path} needs a header row with symbol and quantity columns")
+            entries = []
+            for row in reader:
+                entry = {field: value.strip() for field, value in row.items() if field and value and value.strip()}
+                for field in AMOUNT_FIELDS:
+                    try:
+                        entry[field] = _number(Decimal(entry[field]))
+                    except (KeyError, InvalidOperation):
+                        pass
+                entries.append(entry)
+            return entries
+    try:
+        with open(path, "r") as f:
+            document = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{path} is not valid JSON: {e}") from None
+    entries = document.get("holdings") if isinstance(document, dict) else document
+    if not isinstance(entries, list):
+        raise ValueError(f"{path} has no list of holdings")
+    return entries
+
+
+def _cache_path(path: Path) -> Path:
+    return path.with_suffix(".cache.json")
+
+
+def _stamp(path: Path) -> List[int]:
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_cache(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return None
+    return cache
+
+
+class ManualHoldings:
+    """Manual holdings file, parsed and validated
+    
+    Args:
+        path: Holdings file; defaults to ``Config.MANUAL_HOLDINGS_FILE``
+        load: Read the file; otherwise start empty, e.g. to replace it
+    
+    Raises:
+        ValueError: If the file is not valid JSON or has invalid holdings
+            (all of them are reported)
+    """
+    
+    def __init__(self, path: Optional[Path] = None, load: bool = True):
+        self.path = Path(path or Config.MANUAL_HOLDINGS_FILE)
+        # Top-level keys of the file other than "holdings", e.g. a comment
+        self.document: Dict[str, Any] = {}
+        # Holdings as written in the file, and their parsed rows
+        self.entries: List[Dict[str, Any]] = []
+        self.accounts: List[Tuple[str, str]] = []
+        self.columns: Dict[str, list] = {name: [] for name in COLUMNS}
+        if load and self.path.exists():
+            self._parse(self.path.read_bytes())
+        # Whether the holdings differ from the file
+        self.changed = False
+    
+    @classmethod
+    @contextmanager
+    def edit(cls, path: Optional[Path] = None, load: bool = True) -> Iterator['ManualHoldings']:
+        """Load the holdings for changing, and save them if the block completes
+        and changed them
+        
+        Edits of the same file are serialized with a lock.
+        """
+        path = Path(path or Config.MANUAL_HOLDINGS_FILE)
+        with file_lock(lock_file(path.parent, path.stem)):
+            holdings = cls(path, load)
+            yield holdings
+            if holdings.changed:
+                holdings.save()
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    # Loading
+    
+    def _parse(self, data: bytes):
+        try:
+            document = json.loads(data)
+        except ValueError as e:
+            raise ValueError(f"{self.path} is not valid JSON: {e}") from None
+        if not isinstance(document, dict) or not isinstance(document.get("holdings", []), list):
+            raise ValueError(f'{self.path} must be an object with a "holdings" list')
+        
+        self.document = {key: value for key, value in document.items() if key != "holdings"}
+        self.extend(document.get("holdings", []), where=str(self.path))
+    
+    # Changes
+    
+    def _account_index(self, account: Tuple[str, str]) -> int:
+        try:
+            return self.accounts.index(account)
+        except ValueError:
+            self.accounts.append(account)
+            return len(self.accounts) - 1
+    
+    def extend(self, entries: Iterable[Any], where: str = "holdings"):
+        """Validate and add holdings; nothing is added if any is invalid
+        
+        Raises:
+            ValueError: Listing every invalid holding
+        """
+        parsed, errors = [], []
+        for number, entry in enumerate(entries):
+            try:
+                parsed.append((entry, *parse_holding(entry)))
+            except ValueError as e:
+                errors.append(f"  holding {number + 1}: {e}")
+        if errors:
+            raise ValueError(f"{where} has {len(errors)} invalid holding(s):\n" + "\n".join(errors))
+        
+        for entry, account, row in parsed:
+            self.changed = True
+            self.entries.append(entry)
+            self.columns["account"].append(self._account_index(account))
+            for name, value in row.items():
+                self.columns[name].append(value)
+    
+    def add(self, entry: Dict[str, Any]):
+        """Validate and add one holding
+        
+        Raises:
+            ValueError: If the holding is invalid
+        """
+        self.extend([entry], where=entry.get("symbol") or "holding")
+    
+    def remove(self, symbol: str, account_name: Optional[str] = None,
+               institution_name: Optional[str] = None) -> int:
+        """Remove the holdings of ``symbol``, optionally only from one account
+        
+        Returns:
+            Number of holdings removed
+        """
+        keep = [
+            row_symbol != symbol
+            or (account_name is not None and self.accounts[account][0] != account_name)
+            or (institution_name is not None and self.accounts[account][1] != institution_name)
+            for row_symbol, account in zip(self.columns["symbol"], self.columns["account"])
+        ]
+        removed = keep.count(False)
+        if removed:
+            self.entries = [entry for entry, kept in zip(self.entries, keep) if kept]
+            for name in COLUMNS:
+                self.columns[name] = [value for value, kept in zip(self.columns[name], keep) if kept]
+            self._drop_unused_accounts()
+            self.changed = True
+        return removed
+    
+    def clear(self):
+        """Remove every holding"""
+        self.entries = []
+        self.accounts = []
+        self.columns = {name: [] for name in COLUMNS}
+        self.changed = True
+    
+    def _drop_unused_accounts(self):
+        used = sorted(set(self.columns["account"]))
+        renumber = {old: new for new, old in enumerate(used)}
+        self.accounts = [self.accounts[old] for old in used]
+        self.columns["account"] = [renumber[account] for account in self.columns["account"]]
+    
+    # Saving
+    
+    def save(self):
+        """Write the holdings file and its cached totals"""
+        data = (json.dumps({**self.document, "holdings": self.entries}, indent=2) + "\n").encode()
+        atomic_write(self.path, data)
+        ManualTotals.of(self).save_cache(self.path, _stamp(self.path), hashlib.sha256(data).hexdigest())
+    
+    # Reading
+    
+    def rows(self) -> List[Dict[str, Any]]:
+        """Parsed holdings with ``Decimal`` amounts, in file order"""
+        columns = self.columns
+        return [
+            {
+                "symbol": columns["symbol"][row],
+                "description": columns["description"][row],
+                "quantity": from_fixed(columns["quantity"][row], QUANTITY_SCALE),
+                "price": from_fixed(columns["price"][row], MONEY_SCALE),
+                "value": from_fixed(columns["value"][row], MONEY_SCALE),
+                "cost": None if columns["cost"][row] is None else from_fixed(columns["cost"][row], MONEY_SCALE),
+                "currency": columns["currency"][row],
+                "account_name": self.accounts[columns["account"][row]][0],
+                "institution_name": self.accounts[columns["account"][row]][1],
+            }
+            for row in range(len(self.entries))
+        ]
+
+
+class ManualTotals:
+    """Manual holdings summed per account, symbol and currency
+    
+    Holdings with and without a cost basis are summed separately, so that
+    unrealized gains stay exact.
+    
+    Args:
+        holdings: Number of holdings summed
+        accounts: (account name, institution) of each account index
+        columns: ``COLUMNS`` of the summed rows, with ``NO_COST`` for an
+            unknown cost
+    """
+    
+    def __init__(self, holdings: int = 0, accounts: Optional[List[Tuple[str, str]]] = None,
+                 columns: Optional[Dict[str, list]] = None):
+        self.holdings = holdings
+        self.accounts = accounts or []
+        self.columns = columns or {name: [] for name in COLUMNS}
+    
+    def __len__(self) -> int:
+        return self.holdings
+    
+    @classmethod
+    def of(cls, holdings: ManualHoldings) -> 'ManualTotals':
+        """Totals of parsed holdings"""
+        columns = holdings.columns
+        groups: Dict[Tuple[int, str, str, bool], List[int]] = {}
+        keys = zip(columns["account"], columns["symbol"], columns["currency"],
+                   (cost is not None for cost in columns["cost"]))
+        for row, key in enumerate(keys):
+            groups.setdefault(key, []).append(row)
+        
+        totals: Dict[str, list] = {name: [] for name in COLUMNS}
+        for (account, symbol, currency, has_cost), rows in groups.items():
+            quantity = sum(columns["quantity"][row] for row in rows)
+            value = sum(columns["value"][row] for row in rows)
+            prices = {columns["price"][row] for row in rows}
+            if len(prices) > 1 and quantity:
+                # Lots at different prices: the price the total is worth
+                price = int((Decimal(value) * 10 ** QUANTITY_SCALE / quantity).to_integral_value())
+            else:
+                price = max(prices)
+            totals["account"].append(account)
+            totals["symbol"].append(symbol)
+            totals["description"].append(next((columns["description"][row] for row in rows
+                                                if columns["description"][row]), ""))
+            totals["quantity"].append(quantity)
+            totals["price"].append(price)
+            totals["value"].append(value)
+            totals["currency"].append(currency)
+            totals["cost"].append(sum(columns["cost"][row] for row in rows) if has_cost else NO_COST)
+        return cls(len(holdings), list(holdings.accounts), totals)
+    
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> 'ManualTotals':
+        """Totals of a holdings file, from its cache when that is current
+        
+        Args:
+            path: Holdings file; defaults to ``Config.MANUAL_HOLDINGS_FILE``
+        
+        Raises:
+            ValueError: If the file is not valid JSON or has invalid holdings
+        """
+        path = Path(path or Config.MANUAL_HOLDINGS_FILE)
+        if not path.exists():
+            return cls()
+        
+        stamp = _stamp(path)
+        cache = _read_cache(_cache_path(path))
+        if cache and cache.get("stamp") == stamp:
+            return cls(cache["holdings"], [tuple(account) for account in cache["accounts"]], cache["columns"])
+        
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if cache and cache.get("sha256") == digest:
+            # Touched but not changed: note the new stamp
+            totals = cls(cache["holdings"], [tuple(account) for account in cache["accounts"]], cache["columns"])
+        else:
+            holdings = ManualHoldings(path, load=False)
+            holdings._parse(data)
+            totals = cls.of(holdings)
+        totals.save_cache(path, stamp, digest)
+        return totals
+    
+    def save_cache(self, path: Path, stamp: List[int], digest: str):
+        """Cache the totals of the holdings file ``path`` for ``load``"""
+        cache = {
+            "version": CACHE_VERSION,
+            "stamp": stamp,
+            "sha256": digest,
+            "holdings": self.holdings,
+            "accounts": self.accounts,
+            "columns": self.columns,
+        }
+        try:
+            atomic_write(_cache_path(path), json.dumps(cache, separators=(",", ":")))
+        except OSError:
+            # Only a cache: the next reader parses the file again
+            pass
+    
+    def add_to(self, table: PositionTable) -> int:
+        """Merge the totals into a position table in one bulk append
+        
+        Returns:
+            Number of holdings merged
+        """
+        columns = self.columns
+        if columns["symbol"]:
+            table.add_rows(
+                [Account('manual', name, institution) for name, institution in self.accounts],
+                np.array(columns["account"], dtype=np.int32), columns["symbol"], columns["description"],
+                np.array(columns["quantity"], dtype=np.int64), np.array(columns["price"], dtype=np.int64),
+                np.array(columns["value"], dtype=np.int64), columns["currency"],
+                np.array(columns["cost"], dtype=np.int64)
+            )
+        return self.holdings
@@ -0,0 +1,195 @@
+"""Call and stage instrumentation for syncs
+
+Metrics are written next to ``portfolio.json`` after each sync, as JSON and
+in the Prometheus text exposition format (suitable for node_exporter's
+textfile collector), so cron-driven syncs can be tracked over time.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .resilience import CallResult
+from .storage import atomic_write
+
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def response_size(response: Any) -> Optional[int]:
+    """Size in bytes of an SDK response's HTTP payload, if known"""
+    raw = getattr(response, "response", None)
+    data = getattr(raw, "data", None)
+    if data is not None:
+        return len(data)
+    
+    headers = getattr(response, "headers", None) or {}
+    try:
+        length = headers.get("Content-Length")
+        return int(length) if length is not None else None
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds"""
+    
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(upper bound, count of observations <= bound) pairs, ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            pairs.append(("+Inf" if bound == float("inf") else f"{bound:g}", total))
+        return pairs
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": dict(self.cumulative())
+        }
+
+
+class EndpointStats:
+    """Counters and histograms for one SnapTrade endpoint"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "latency_seconds": self.latency.to_dict(),
+            "response_bytes": self.size.to_dict()
+        }
+
+
+class Metrics:
+    """Thread-safe collector for API call and sync stage metrics"""
+    
+    def __init__(self):
+        self.started_at = time.time()
+        self._endpoints: Dict[str, EndpointStats] = {}
+        self._stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def record_call(self, result: CallResult, seconds: float):
+        """Record a finished (possibly retried) API call"""
+        size = response_size(result.value) if result.ok else None
+        with self._lock:
+            stats = self._endpoints.get(result.endpoint)
+            if stats is None:
+                stats = self._endpoints[result.endpoint] = EndpointStats()
+            stats.calls += 1
+            stats.retries += max(0, result.attempts - 1)
+            stats.latency.observe(seconds)
+            if not result.ok:
+                stats.errors += 1
+            if size is not None:
+                stats.bytes += size
+                stats.size.observe(size)
+    
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a sync stage; repeated stages accumulate"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._stages[name] = self._stages.get(name, 0.0) + elapsed
+    
+    def to_dict(self, status: str = "ok") -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "duration_seconds": round(time.time() - self.started_at, 6),
+                "status": status,
+                "stages": {name: round(seconds, 6) for name, seconds in self._stages.items()},
+                "endpoints": {name: stats.to_dict() for name, stats in sorted(self._endpoints.items())}
+            }
+    
+    def to_prometheus(self, status: str = "ok") -> str:
+        """Metrics in the Prometheus text exposition format"""
+        data = self.to_dict(status)
+        lines = [
+            "# HELP fenn_sync_start_time_seconds Unix time the last sync started",
+            "# TYPE fenn_sync_start_time_seconds gauge",
+            f"fenn_sync_start_time_seconds {data['started_at']:.3f}",
+            "# HELP fenn_sync_duration_seconds Wall time of the last sync",
+            "# TYPE fenn_sync_duration_seconds gauge",
+            f"fenn_sync_duration_seconds {data['duration_seconds']}",
+            "# HELP fenn_sync_success Whether the last sync completed",
+            "# TYPE fenn_sync_success gauge",
+            f"fenn_sync_success {1 if status == 'ok' else 0}",
+            "# HELP fenn_sync_stage_seconds Wall time spent in each sync stage",
+            "# TYPE fenn_sync_stage_seconds gauge"
+        ]
+        for name, seconds in data["stages"].items():
+            lines.append(f'fenn_sync_stage_seconds{{stage="{name}"}} {seconds}')
+        
+        counters = (
+            ("calls", "fenn_api_calls_total", "API calls, counting retried calls once"),
+            ("errors", "fenn_api_errors_total", "API calls that failed after retries"),
+            ("retries", "fenn_api_retries_total", "Retried API attempts"),
+            ("bytes", "fenn_api_response_bytes_total", "Response payload bytes")
+        )
+        for key, metric, description in counters:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} counter")
+            for endpoint, stats in data["endpoints"].items():
+                lines.append(f'{metric}{{endpoint="{endpoint}"}} {stats[key]}')
+        
+        histograms = (
+            ("latency_seconds", "fenn_api_latency_seconds", "API call latency including retries"),
+            ("response_bytes", "fenn_api_response_size_bytes", "API response payload size")
+        )
+        for key, metric, description in histograms:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} histogram")
+            for endpoint, stats in data["endpoints"].items():
+                histogram = stats[key]
+                for bound, count in histogram["buckets"].items():
+                    lines.append(f'{metric}_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_sum{{endpoint="{endpoint}"}} {histogram["sum"]}')
+                lines.append(f'{metric}_count{{endpoint="{endpoint}"}} {histogram["count"]}')
+        
+        return "\n".join(lines) + "\n"
+    
+    def write(self, json_path: Path, prometheus_path: Path, status: str = "ok"):
+        """Write the JSON and Prometheus metrics files
+        
+        Each file is replaced atomically so a scraper never sees a partial
+        write.
+        """
+        for path, content in (
+            (json_path, json.dumps(self.to_dict(status), indent=2) + "\n"),
+            (prometheus_path, self.to_prometheus(status))
+        ):
+            atomic_write(path, content)
@@ -0,0 +1,179 @@
+"""Compact account, position and balance records parsed from SnapTrade responses
+
+Every command reads SnapTrade data through these helpers so that response
+unwrapping (``.body``, ``to_dict()``, nested symbols, numeric coercion)
+lives in one place.
+"""
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+ZERO = Decimal('0')
+
+
+def unwrap(response: Any) -> Any:
+    """Body of an SDK response (ApiResponseFor200 or already a body)"""
+    return getattr(response, 'body', response)
+
+
+def to_plain(item: Any) -> Any:
+    """Plain-dict form of an SDK model, or the item itself"""
+    return item.to_dict() if hasattr(item, 'to_dict') else item
+
+
+def as_list(response: Any) -> List[Any]:
+    """List of plain items from a list-valued response
+    
+    SDK list bodies are tuple-like schemas rather than ``list`` instances,
+    so any non-string, non-mapping iterable is accepted.
+    """
+    data = unwrap(response)
+    if isinstance(data, (str, bytes, dict)) or not hasattr(data, '__iter__'):
+        return []
+    return [to_plain(item) for item in data]
+
+
+def as_dict(response: Any) -> Dict[str, Any]:
+    """Plain dict from a mapping-valued response, or {} for anything else"""
+    data = to_plain(unwrap(response))
+    return data if isinstance(data, dict) else {}
+
+
+def to_decimal(value: Any) -> Decimal:
+    """Decimal from an API number, treating missing or malformed values as 0"""
+    if value is None:
+        return ZERO
+    if isinstance(value, Decimal):
+        return value
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        return ZERO
+
+
+def _currency_code(value: Any, default: str = 'USD') -> str:
+    """Currency code from either a plain code or a SnapTrade currency object"""
+    if isinstance(value, dict):
+        value = value.get('code')
+    return str(value) if value else default
+
+
+class Account:
+    """A brokerage account"""
+    __slots__ = ('id', 'name', 'institution', 'connection_id', 'balance')
+    
+    def __init__(self, id: Optional[str], name: str, institution: str,
+                 connection_id: Optional[str] = None, balance: Optional['Balance'] = None):
+        self.id = id
+        self.name = name
+        self.institution = institution
+        self.connection_id = connection_id
+        self.balance = balance
+    
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> 'Account':
+        """Parse an account from ``list_user_accounts`` or a holdings payload"""
+        balance = raw.get('balance')
+        connection = raw.get('brokerage_authorization')
+        if isinstance(connection, dict):
+            connection = connection.get('id')
+        return cls(
+            id=raw.get('id'),
+            name=raw.get('name') or 'Unknown Account',
+            institution=raw.get('institution_name') or 'Unknown',
+            connection_id=str(connection) if connection else None,
+            balance=Balance.from_raw(balance) if isinstance(balance, dict) else None
+        )
+
+
+class Balance:
+    """A cash or total balance in one currency"""
+    __slots__ = ('amount', 'currency')
+    
+    def __init__(self, amount: Optional[Decimal], currency: str = 'USD'):
+        self.amount = amount
+        self.currency = currency
+    
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> 'Balance':
+        """Parse an account ``balance`` (``{"total": {...}}``) or a per-currency balance entry"""
+        if 'total' in raw:
+            total = raw.get('total') or {}
+            amount = total.get('amount') if isinstance(total, dict) else None
+            currency = total.get('currency') if isinstance(total, dict) else None
+        else:
+            amount = raw.get('cash')
+            currency = raw.get('currency')
+        return cls(
+            amount=None if amount is None else to_decimal(amount),
+            currency=_currency_code(currency)
+        )
+
+
+class Position:
+    """A holding of one symbol in one account"""
+    __slots__ = ('symbol', 'description', 'quantity', 'price', 'avg_cost', 'currency')
+    
+    def __init__(self, symbol: str, description: str, quantity: Decimal, price: Decimal,
+                 avg_cost: Decimal = ZERO, currency: str = 'USD'):
+        self.symbol = symbol
+        self.description = description
+        self.quantity = quantity
+        self.price = price
+        self.avg_cost = avg_cost
+        self.currency = currency
+    
+    @property
+    def value(self) -> Decimal:
+        return self.quantity * self.price
+    
+    @classmethod
+    def from_raw(cls, raw: Any) -> 'Position':
+        """Parse a position from the positions or holdings endpoints
+        
+        The symbol is nested as ``position.symbol.symbol`` (a universal
+        symbol); ``units`` holds the quantity.
+        """
+        raw = to_plain(raw)
+        symbol_data = raw.get('symbol', {})
+        symbol_info = symbol_data.get('symbol', {}) if isinstance(symbol_data, dict) else symbol_data
+        
+        if isinstance(symbol_info, dict):
+            symbol = symbol_info.get('symbol', 'UNKNOWN')
+            description = symbol_info.get('description') or ''
+            currency = _currency_code(symbol_info.get('currency'))
+        else:
+            symbol = 'UNKNOWN'
+            description = ''
+            currency = 'USD'
+        
+        return cls(
+            symbol=symbol,
+            description=description,
+            quantity=to_decimal(raw.get('units', raw.get('quantity'))),
+            price=to_decimal(raw.get('price')),
+            avg_cost=to_decimal(raw.get('average_purchase_price')),
+            currency=_currency_code(raw.get('currency'), currency)
+        )
+
+
+def parse_accounts(items: Iterable[Any]) -> List[Account]:
+    """Accounts from an account listing, skipping entries that are not mappings"""
+    return [Account.from_raw(item) for item in map(to_plain, items) if isinstance(item, dict)]
+
+
+def parse_positions(items: Optional[Iterable[Any]]) -> Tuple[List[Position], int]:
+    """Positions from a positions list in a single pass
+    
+    Returns:
+        Tuple of (parsed positions, number of entries skipped as unparseable)
+    """
+    positions = []
+    skipped = 0
+    for item in items or ():
+        try:
+            positions.append(Position.from_raw(item))
+        except Exception:
+            # Skip positions with bad data
+            skipped += 1
+    return positions, skipped
@@ -2,29 +2,40 @@
 import plotly.graph_objects as go
 import plotly.express as px
 from decimal import Decimal
-from typing import Dict, List, Any
+from typing import List, Tuple
 import webbrowser
 import tempfile
 from pathlib import Path
 
+from .aggregate import BrokerTotal, SymbolTotal
 
-def create_allocation_chart(holdings: Dict[str, Any], total_value: Decimal, top_n: int = 10) -> go.Figure:
+
+def _affixes(currency: str) -> Tuple[str, str]:
+    """Text before and after an amount: a $ for US dollars, otherwise the currency code"""
+    return ("$", "") if currency == "USD" else ("", f" {currency}")
+
+
+def _money(amount: float, currency: str, decimals: int = 2) -> str:
+    prefix, suffix = _affixes(currency)
+    return f"{prefix}{amount:,.{decimals}f}{suffix}"
+
+
+def create_allocation_chart(holdings: List[SymbolTotal], total_value: Decimal, top_n: int = 10,
+                            currency: str = "USD") -> go.Figure:
     """Create a donut chart showing top holdings allocation
     
     Args:
-        holdings: Dict of symbol -> holding data
+        holdings: Holdings per symbol, largest first (``PositionTable.by_symbol``)
         total_value: Total portfolio value
         top_n: Number of top holdings to show individually
+        currency: Currency the values are in
     
     Returns:
         Plotly Figure object
     """
-    # Sort by value
-    sorted_holdings = sorted(holdings.items(), key=lambda x: x[1]['total_value'], reverse=True)
-    
     # Take top N
-    top_holdings = sorted_holdings[:top_n]
-    other_value = sum(float(h[1]['total_value']) for h in sorted_holdings[top_n:])
+    top_holdings = holdings[:top_n]
+    other_value = float(sum((h.value for h in holdings[top_n:]), Decimal('0')))
     
     # Prepare data
     labels = []
@@ -35,16 +46,15 @@ def create_allocation_chart(holdings: Dict[str, Any], total_value: Decimal, top_
     # Color palette
     symbol_colors = px.colors.qualitative.Set3
     
-    for i, (symbol, data) in enumerate(top_holdings):
-        labels.append(symbol)
-        values.append(float(data['total_value']))
+    for i, holding in enumerate(top_holdings):
+        labels.append(holding.symbol)
+        values.append(float(holding.value))
         colors.append(symbol_colors[i % len(symbol_colors)])
         
-        # Build hover text
-        # Access 'breakdown' safely using .get() since 'data' is a dict
-        breakdown = data.get('breakdown', '')
+        # Build hover text, listing the symbols merged into this one
+        breakdown = "<br>".join(f"{symbol}: {_money(float(value), currency, 0)}" for symbol, value in holding.components)
         
-        hover = f"<b>{symbol}</b><br>Value: ${float(data['total_value']):,.2f}<br>Allocation: %{{percent}}"
+        hover = f"<b>{holding.symbol}</b><br>Value: {_money(float(holding.value), currency)}<br>Allocation: %{{percent}}"
         if breakdown:
             hover += f"<br><br>Includes:<br>{breakdown}"
         hover += "<extra></extra>"
@@ -54,7 +64,7 @@ def create_allocation_chart(holdings: Dict[str, Any], total_value: Decimal, top_
         labels.append("Other Holdings")
         values.append(other_value)
         colors.append('#cccccc')
-        hover_texts.append(f"<b>Other Holdings</b><br>Value: ${other_value:,.2f}<br>Allocation: %{{percent}}<extra></extra>")
+        hover_texts.append(f"<b>Other Holdings</b><br>Value: {_money(other_value, currency)}<br>Allocation: %{{percent}}<extra></extra>")
     
     # Create donut chart
     fig = go.Figure(data=[go.Pie(
@@ -68,7 +78,7 @@ def create_allocation_chart(holdings: Dict[str, Any], total_value: Decimal, top_
     )])
     
     # Define title updater
-    total_str = f"${float(total_value):,.2f}"
+    total_str = _money(float(total_value), currency)
     
     fig.update_layout(
         title=dict(
@@ -110,33 +120,34 @@ def create_allocation_chart(holdings: Dict[str, Any], total_value: Decimal, top_
     return fig
 
 
-def create_top_holdings_chart(holdings: Dict[str, Any], limit: int = 20) -> go.Figure:
+def create_top_holdings_chart(holdings: List[SymbolTotal], limit: int = 20, currency: str = "USD") -> go.Figure:
     """Create a horizontal bar chart of top holdings
     
     Args:
-        holdings: Dict of symbol -> holding data
+        holdings: Holdings per symbol, largest first (``PositionTable.by_symbol``)
         limit: Number of top holdings to show
+        currency: Currency the values are in
     
     Returns:
         Plotly Figure object
     """
-    # Sort by value
-    sorted_holdings = sorted(holdings.items(), key=lambda x: x[1]['total_value'], reverse=True)
-    top_holdings = sorted_holdings[:limit]
+    top_holdings = holdings[:limit]
+    total_value = float(sum((h.value for h in holdings), Decimal('0')))
     
     # Prepare data
     symbols = []
     values = []
     allocations = []
     
-    for symbol, data in reversed(top_holdings):  # Reverse for bottom-to-top display
-        symbols.append(symbol)
-        values.append(float(data['total_value']))
+    for holding in reversed(top_holdings):  # Reverse for bottom-to-top display
+        symbols.append(holding.symbol)
+        values.append(float(holding.value))
         # Calculate allocation percentage
-        allocation = float(data['total_value']) / sum(float(h[1]['total_value']) for h in sorted_holdings) * 100
+        allocation = float(holding.value) / total_value * 100 if total_value else 0.0
         allocations.append(allocation)
     
     # Create bar chart
+    prefix, suffix = _affixes(currency)
     fig = go.Figure(data=[go.Bar(
         x=values,
         y=symbols,
@@ -147,14 +158,14 @@ def create_top_holdings_chart(holdings: Dict[str, Any], limit: int = 20) -> go.F
             showscale=True,
             colorbar=dict(title="Allocation %")
         ),
-        text=[f'${v:,.0f}' for v in values],
+        text=[_money(v, currency, 0) for v in values],
         textposition='outside',
-        hovertemplate='<b>%{y}</b><br>Value: $%{x:,.2f}<br>Allocation: %{marker.color:.2f}%<extra></extra>'
+        hovertemplate='<b>%{y}</b><br>Value: ' + prefix + '%{x:,.2f}' + suffix + '<br>Allocation: %{marker.color:.2f}%<extra></extra>'
     )])
     
     fig.update_layout(
         title=f'Top {limit} Holdings by Value',
-        xaxis_title='Value ($)',
+        xaxis_title=f'Value ({"$" if currency == "USD" else currency})',
         yaxis_title='Symbol',
         height=max(400, limit * 25),
         showlegend=False,
@@ -165,11 +176,12 @@ def create_top_holdings_chart(holdings: Dict[str, Any], limit: int = 20) -> go.F
     return fig
 
 
-def create_broker_distribution_chart(holdings: Dict[str, Any]) -> go.Figure:
+def create_broker_distribution_chart(brokers: List[BrokerTotal], currency: str = "USD") -> go.Figure:
     """Create a treemap showing broker -> holdings distribution
     
     Args:
-        holdings: Dict of symbol -> holding data
+        brokers: Holdings per broker and symbol (``PositionTable.by_broker``)
+        currency: Currency the values are in
     
     Returns:
         Plotly Figure object
@@ -183,38 +195,27 @@ def create_broker_distribution_chart(holdings: Dict[str, Any]) -> go.Figure:
     # Add root
     labels.append("Portfolio")
     parents.append("")
-    total_value = sum(float(h['total_value']) for h in holdings.values())
+    total_value = float(sum((b.value for b in brokers), Decimal('0')))
     values.append(total_value)
     colors.append(0)
     
-    # Collect broker totals
-    broker_totals = {}
-    for symbol, data in holdings.items():
-        for broker in data['brokers']:
-            if broker not in broker_totals:
-                broker_totals[broker] = 0
-            # Distribute value proportionally if multiple brokers
-            value_per_broker = float(data['total_value']) / len(data['brokers'])
-            broker_totals[broker] += value_per_broker
-    
     # Add brokers
-    for broker, value in broker_totals.items():
-        labels.append(broker)
+    for broker in brokers:
+        labels.append(broker.broker)
         parents.append("Portfolio")
-        values.append(value)
-        colors.append(value)
-    
-    # Add holdings under brokers
-    for symbol, data in holdings.items():
-        for broker in data['brokers']:
-            labels.append(f"{symbol}<br>(${float(data['total_value']):,.0f})")
-            parents.append(broker)
-            # Distribute value if symbol appears in multiple brokers
-            value_per_broker = float(data['total_value']) / len(data['brokers'])
-            values.append(value_per_broker)
-            colors.append(value_per_broker)
+        values.append(float(broker.value))
+        colors.append(float(broker.value))
+    
+    # Add each broker's holdings, valued at what that broker holds
+    for broker in brokers:
+        for symbol, value in broker.holdings:
+            labels.append(f"{symbol}<br>({_money(float(value), currency, 0)})")
+            parents.append(broker.broker)
+            values.append(float(value))
+            colors.append(float(value))
     
     # Create treemap
+    prefix, suffix = _affixes(currency)
     fig = go.Figure(go.Treemap(
         labels=labels,
         parents=parents,
@@ -222,14 +223,14 @@ def create_broker_distribution_chart(holdings: Dict[str, Any]) -> go.Figure:
         marker=dict(
             colorscale='Blues',
             cmid=total_value/2,
-            colorbar=dict(title="Value ($)")
+            colorbar=dict(title=f'Value ({"$" if currency == "USD" else currency})')
         ),
         textinfo="label+value+percent parent",
-        hovertemplate='<b>%{label}</b><br>Value: $%{value:,.2f}<br>%{percentParent}<extra></extra>'
+        hovertemplate='<b>%{label}</b><br>Value: ' + prefix + '%{value:,.2f}' + suffix + '<br>%{percentParent}<extra></extra>'
     ))
     
     fig.update_layout(
-        title=f'Portfolio Distribution by Broker<br><sub>Total: ${total_value:,.2f}</sub>',
+        title=f'Portfolio Distribution by Broker<br><sub>Total: {_money(total_value, currency)}</sub>',
         height=700,
         font=dict(size=12)
     )
@@ -237,27 +238,26 @@ def create_broker_distribution_chart(holdings: Dict[str, Any]) -> go.Figure:
     return fig
 
 
-def create_concentration_chart(holdings: Dict[str, Any], total_value: Decimal) -> go.Figure:
+def create_concentration_chart(holdings: List[SymbolTotal], total_value: Decimal) -> go.Figure:
     """Create a concentration curve showing cumulative allocation
     
     Args:
-        holdings: Dict of symbol -> holding data
+        holdings: Holdings per symbol, largest first (``PositionTable.by_symbol``)
         total_value: Total portfolio value
     
     Returns:
         Plotly Figure object
     """
-    # Sort by value
-    sorted_holdings = sorted(holdings.items(), key=lambda x: x[1]['total_value'], reverse=True)
+    sorted_holdings = holdings
     
     # Calculate cumulative allocation
     cumulative_count = []
     cumulative_percent = []
     cumulative_value = Decimal('0')
     
-    for i, (symbol, data) in enumerate(sorted_holdings, 1):
+    for i, holding in enumerate(sorted_holdings, 1):
         cumulative_count.append(i)
-        cumulative_value += data['total_value']
+        cumulative_value += holding.value
         cumulative_percent.append(float(cumulative_value / total_value * 100))
     
     # Create line chart
@@ -0,0 +1,170 @@
+"""Quote providers for repricing cached holdings
+
+``fenn portfolio --reprice`` keeps the quantities in the holdings cache and
+values them at prices from a quote provider instead of refetching every
+account from the brokerages. A provider answers ``quotes(symbols)`` with
+the latest price of each symbol it knows and the currency of that price;
+symbols are requested in batches of ``batch_size``, so providers backed by
+a remote API make one request per batch rather than one per symbol. Only
+positions held in a quote's currency are repriced with it.
+
+Two local providers are included, chosen by the file's extension:
+
+- ``CsvQuoteProvider`` (``.csv``): a ``symbol,price`` file with a header
+  row and an optional ``currency`` column; other columns (such as
+  ``as_of``) are ignored
+- ``SqliteQuoteProvider`` (``.db``, ``.sqlite``, ``.sqlite3``): a
+  ``quotes(symbol, price)`` table, optionally with a ``currency`` column
+
+Quotes that do not name a currency are in ``Config.BASE_CURRENCY``.
+
+Other providers subclass ``QuoteProvider`` and are added to ``PROVIDERS``.
+"""
+import csv
+import sqlite3
+from abc import ABC, abstractmethod
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import Config
+
+# (price, currency) of a symbol
+Quote = Tuple[Decimal, str]
+
+
+class QuoteProvider(ABC):
+    """Source of latest prices, queried in batches
+    
+    Args:
+        batch_size: Most symbols asked for at once
+        currency: Currency of quotes that do not name one; defaults to
+            ``Config.BASE_CURRENCY``
+    """
+    
+    def __init__(self, batch_size: int = 500, currency: Optional[str] = None):
+        self.batch_size = batch_size
+        self.currency = (currency or Config.BASE_CURRENCY).upper()
+    
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, Quote]:
+        """Latest price and its currency for each symbol the provider has a quote for"""
+        symbols = sorted(set(symbols))
+        quotes: Dict[str, Quote] = {}
+        for start in range(0, len(symbols), self.batch_size):
+            quotes.update(self.fetch_batch(symbols[start:start + self.batch_size]))
+        return quotes
+    
+    @abstractmethod
+    def fetch_batch(self, symbols: List[str]) -> Dict[str, Quote]:
+        """Quotes for one batch of symbols, omitting those without one"""
+    
+    def close(self):
+        pass
+    
+    def __enter__(self) -> 'QuoteProvider':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _price(value, where: str) -> Decimal:
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{where}: invalid price {value!r}") from None
+    if not price.is_finite() or price < 0:
+        raise ValueError(f"{where}: invalid price {value!r}")
+    return price
+
+
+def _currency(value, default: str, where: str) -> str:
+    currency = str(value or "").strip().upper() or default
+    if not currency.isalpha():
+        raise ValueError(f"{where}: invalid currency {value!r}")
+    return currency
+
+
+class CsvQuoteProvider(QuoteProvider):
+    """Quotes from a ``symbol,price[,currency]`` CSV file, read once"""
+    
+    def __init__(self, path: Path, batch_size: int = 500, currency: Optional[str] = None):
+        super().__init__(batch_size, currency)
+        self.path = Path(path)
+        self._quotes: Optional[Dict[str, Quote]] = None
+    
+    def _load(self) -> Dict[str, Quote]:
+        quotes = {}
+        with open(self.path, "r", newline="") as f:
+            reader = csv.DictReader(f)
+            fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+            if "symbol" not in fields or "price" not in fields:
+                raise ValueError(f"{self.path} needs a header row with symbol and price columns")
+            for row in reader:
+                symbol = (row[fields["symbol"]] or "").strip()
+                if symbol:
+                    where = f"{self.path}:{reader.line_num}"
+                    currency = row[fields["currency"]] if "currency" in fields else None
+                    quotes[symbol] = (_price(row[fields["price"]], where), _currency(currency, self.currency, where))
+        return quotes
+    
+    def fetch_batch(self, symbols: List[str]) -> Dict[str, Quote]:
+        if self._quotes is None:
+            self._quotes = self._load()
+        return {symbol: self._quotes[symbol] for symbol in symbols if symbol in self._quotes}
+
+
+class SqliteQuoteProvider(QuoteProvider):
+    """Quotes from the ``quotes(symbol, price[, currency])`` table of a SQLite database"""
+    
+    def __init__(self, path: Path, batch_size: int = 500, currency: Optional[str] = None):
+        super().__init__(batch_size, currency)
+        self.path = Path(path)
+        self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        self._currency_column: Optional[bool] = None
+    
+    def fetch_batch(self, symbols: List[str]) -> Dict[str, Quote]:
+        placeholders = ", ".join("?" * len(symbols))
+        try:
+            if self._currency_column is None:
+                self._currency_column = any(
+                    row[1].lower() == "currency" for row in self.conn.execute("PRAGMA table_info(quotes)"))
+            currency = "currency" if self._currency_column else "NULL"
+            rows = self.conn.execute(
+                f"SELECT symbol, price, {currency} FROM quotes WHERE symbol IN ({placeholders})", symbols
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"{self.path}: {e}") from None
+        return {
+            symbol: (_price(price, f"{self.path} ({symbol})"), _currency(currency, self.currency, f"{self.path} ({symbol})"))
+            for symbol, price, currency in rows if price is not None
+        }
+    
+    def close(self):
+        self.conn.close()
+
+
+# File extension -> provider class
+PROVIDERS = {
+    ".csv": CsvQuoteProvider,
+    ".db": SqliteQuoteProvider,
+    ".sqlite": SqliteQuoteProvider,
+    ".sqlite3": SqliteQuoteProvider,
+}
+
+
+def open_provider(path: Optional[Path] = None) -> QuoteProvider:
+    """Quote provider for a quotes file (default ``Config.QUOTES_FILE``)
+    
+    Raises:
+        FileNotFoundError: If the file does not exist
+        ValueError: If there is no provider for the file's extension
+    """
+    path = Path(path or Config.QUOTES_FILE)
+    provider = PROVIDERS.get(path.suffix.lower())
+    if provider is None:
+        raise ValueError(f"No quote provider for {path.suffix or path.name} files "
+                         f"(expected one of {', '.join(PROVIDERS)})")
+    if not path.exists():
+        raise FileNotFoundError(f"Quotes file not found: {path}")
+    return provider(path)
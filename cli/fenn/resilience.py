@@ -0,0 +1,365 @@
+"""Rate limiting, retries and circuit breaking for SnapTrade API calls"""
+import queue
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import urllib3
+
+from .config import Config
+
+
+# HTTP statuses worth retrying: throttling and server-side failures
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CallTimeoutError(TimeoutError):
+    """Raised when an API call does not answer within its deadline"""
+
+
+@dataclass
+class CallResult:
+    """Outcome of a single (possibly retried) SnapTrade API call"""
+    endpoint: str
+    value: Any = None
+    error: Optional[str] = None
+    status: Optional[int] = None
+    attempts: int = 0
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable description of a failed call"""
+        return {
+            "endpoint": self.endpoint,
+            "error": self.error,
+            "status": self.status,
+            "attempts": self.attempts
+        }
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status carried by an SDK exception, if any"""
+    status = getattr(error, "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed if repeated"""
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return isinstance(error, (ConnectionError, TimeoutError, urllib3.exceptions.HTTPError))
+
+
+def describe_error(error: BaseException) -> str:
+    """One-line description of an SDK exception"""
+    status = error_status(error)
+    if status is not None:
+        reason = getattr(error, "reason", None) or ""
+        return f"HTTP {status} {reason}".strip()
+    return str(error) or error.__class__.__name__
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After response header, if present"""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        value = headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def call_with_timeout(fn: Callable[..., Any], timeout: float, **kwargs) -> Any:
+    """Call ``fn(**kwargs)``, giving up after ``timeout`` seconds
+    
+    The call runs on a daemon thread, so a socket that never answers cannot
+    keep the process alive after the caller has moved on.
+    
+    Raises:
+        CallTimeoutError: If no answer arrived in time
+    """
+    outcome: Dict[str, Any] = {}
+    done = threading.Event()
+    
+    def run():
+        try:
+            outcome["value"] = fn(**kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+    
+    threading.Thread(target=run, daemon=True).start()
+    if not done.wait(timeout):
+        raise CallTimeoutError(f"no response after {timeout:g}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+def hedged(primary: Callable[[], CallResult], secondary: Callable[[], CallResult], delay: float) -> CallResult:
+    """Run ``primary``, racing it against ``secondary`` if it is slow
+    
+    ``secondary`` is only started when ``primary`` has not answered after
+    ``delay`` seconds. The first successful result wins; if both fail the
+    primary's failure is returned.
+    """
+    results: "queue.Queue[Tuple[bool, CallResult]]" = queue.Queue()
+    
+    def run(fn: Callable[[], CallResult], is_hedge: bool):
+        results.put((is_hedge, fn()))
+    
+    threading.Thread(target=run, args=(primary, False), daemon=True).start()
+    try:
+        return results.get(timeout=delay)[1]
+    except queue.Empty:
+        pass
+    
+    threading.Thread(target=run, args=(secondary, True), daemon=True).start()
+    failures: Dict[bool, CallResult] = {}
+    while len(failures) < 2:
+        is_hedge, result = results.get()
+        if result.ok:
+            return result
+        failures[is_hedge] = result
+    return failures[False]
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per endpoint"""
+    
+    def __init__(self, window: int = 200):
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+    
+    def record(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._samples[endpoint].append(seconds)
+    
+    def percentile(self, endpoint: str, fraction: float, min_samples: int = 20) -> Optional[float]:
+        """Latency below which ``fraction`` of recent calls finished
+        
+        Returns None until ``min_samples`` calls have been recorded.
+        """
+        with self._lock:
+            samples = sorted(self._samples[endpoint])
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Token buckets keyed by (brokerage, endpoint)
+    
+    A rate of 0 disables limiting.
+    """
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+    
+    def acquire(self, brokerage: str, endpoint: str):
+        if self.rate <= 0:
+            return
+        
+        key = (brokerage, endpoint)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        bucket.acquire()
+
+
+class CircuitBreaker:
+    """Stops calling a brokerage after repeated failures
+    
+    The circuit opens after ``failure_threshold`` consecutive failures.
+    Once ``reset_timeout`` seconds have passed a single trial call is let
+    through (half-open); its success closes the circuit again, its failure
+    re-opens it.
+    """
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+    
+    def allow(self) -> bool:
+        """Whether a call may be made now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_in_flight = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class ResilientCaller:
+    """Runs SDK calls through rate limiting, retries and circuit breakers
+    
+    Every setting defaults to the matching ``Config`` value.
+    """
+    
+    def __init__(self,
+                 rate: Optional[float] = None,
+                 burst: Optional[int] = None,
+                 max_retries: Optional[int] = None,
+                 base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None,
+                 failure_threshold: Optional[int] = None,
+                 reset_timeout: Optional[float] = None,
+                 timeout: Optional[float] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.limiter = RateLimiter(
+            Config.API_RATE_LIMIT if rate is None else rate,
+            Config.API_RATE_BURST if burst is None else burst
+        )
+        self.max_retries = Config.API_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = Config.API_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = Config.API_RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.failure_threshold = Config.CIRCUIT_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.reset_timeout = Config.CIRCUIT_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.timeout = Config.API_CALL_TIMEOUT if timeout is None else timeout
+        self.latency = LatencyTracker()
+        self._sleep = sleep
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+    
+    def breaker(self, brokerage: str) -> CircuitBreaker:
+        """Circuit breaker for a brokerage, created on first use"""
+        with self._lock:
+            breaker = self._breakers.get(brokerage)
+            if breaker is None:
+                breaker = self._breakers[brokerage] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+    
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay before retry ``attempt``"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+    
+    def call(self, endpoint: str, fn: Callable[..., Any], brokerage: Optional[str] = None,
+             deadline: Optional[float] = None, **kwargs) -> CallResult:
+        """Call ``fn(**kwargs)`` and describe the outcome
+        
+        Args:
+            endpoint: Endpoint name used for rate limiting and reporting
+            fn: SDK method to call
+            brokerage: Institution the call targets; user-level endpoints
+                share the ``"*"`` limiter and breaker
+            deadline: ``time.monotonic()`` value after which no attempt is
+                made or waited for, across all retries
+        
+        Returns:
+            CallResult holding the response or the final error
+        """
+        brokerage = brokerage or "*"
+        breaker = self.breaker(brokerage)
+        result = CallResult(endpoint=endpoint)
+        
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                result.error = "deadline exceeded"
+                return result
+            
+            if not breaker.allow():
+                result.error = f"circuit open for {brokerage} after repeated failures"
+                return result
+            
+            self.limiter.acquire(brokerage, endpoint)
+            result.attempts += 1
+            
+            # Each attempt gets the per-call timeout, cut short by the deadline
+            timeouts = [t for t in (self.timeout, remaining) if t]
+            started = time.monotonic()
+            
+            try:
+                if timeouts:
+                    result.value = call_with_timeout(fn, min(timeouts), **kwargs)
+                else:
+                    result.value = fn(**kwargs)
+                self.latency.record(endpoint, time.monotonic() - started)
+                result.error = None
+                result.status = None
+                breaker.record_success()
+                return result
+            except Exception as e:
+                result.error = describe_error(e)
+                result.status = error_status(e)
+                retryable = is_retryable(e)
+                
+                # Client errors say nothing about the brokerage's health
+                if retryable or result.status is None:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                
+                if not retryable or result.attempts > self.max_retries:
+                    return result
+                
+                delay = self.backoff(result.attempts)
+                requested = retry_after(e)
+                if requested is not None:
+                    delay = max(delay, min(requested, self.max_delay))
+                if deadline is not None:
+                    delay = min(delay, max(0.0, deadline - time.monotonic()))
+                self._sleep(delay)
@@ -0,0 +1,133 @@
+"""Snapshot retention for ``fenn compact``
+
+History is thinned out with age: every snapshot is kept for the most recent
+days, then one per day, then one per month (see ``Config.RETAIN_*``). Each
+day or month is represented by its latest complete snapshot, one in which
+every account synced, or by its latest snapshot if none is complete, so
+that thinning never trades a full picture of a period for a partial one.
+
+The same policy is applied to the snapshot store and to the payload
+archive, so a sync kept in one is kept in the other.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .archive import SnapshotArchive
+from .config import Config
+from .store import SnapshotStore
+
+
+@dataclass
+class RetentionPolicy:
+    """How long snapshots are kept at each granularity
+    
+    ``monthly_months`` of 0 keeps monthly snapshots forever.
+    """
+    all_days: int = Config.RETAIN_ALL_DAYS
+    daily_days: int = Config.RETAIN_DAILY_DAYS
+    monthly_months: int = Config.RETAIN_MONTHLY_MONTHS
+    
+    def retained(self, snapshots: Iterable[Tuple[Any, str, bool]], now: datetime) -> Set[Any]:
+        """Keys of the snapshots to keep
+        
+        Args:
+            snapshots: (key, ISO timestamp, complete) for each snapshot
+            now: Current time, in naive UTC like the timestamps
+        """
+        kept = set()
+        best: Dict[str, Tuple[bool, str, Any]] = {}
+        
+        for key, taken_at, complete in snapshots:
+            moment = datetime.fromisoformat(taken_at)
+            age = now - moment
+            if age < timedelta(days=self.all_days):
+                kept.add(key)
+                continue
+            
+            if age < timedelta(days=self.daily_days):
+                period = moment.strftime("%Y-%m-%d")
+            else:
+                months = (now.year - moment.year) * 12 + now.month - moment.month
+                if self.monthly_months and months >= self.monthly_months:
+                    continue
+                period = moment.strftime("%Y-%m")
+            
+            candidate = (complete, taken_at, key)
+            if period not in best or candidate[:2] > best[period][:2]:
+                best[period] = candidate
+        
+        kept.update(key for _, _, key in best.values())
+        return kept
+
+
+@dataclass
+class CompactionReport:
+    """What ``compact`` removed (or would remove, in a dry run)"""
+    # source -> (snapshots before, snapshots removed)
+    snapshots: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    manifests: Tuple[int, int] = (0, 0)
+    objects_removed: int = 0
+    bytes_freed: int = 0
+
+
+def compact(store: SnapshotStore, archive: SnapshotArchive, policy: Optional[RetentionPolicy] = None,
+            grace: Optional[float] = None, dry_run: bool = False) -> CompactionReport:
+    """Drop snapshots the policy does not keep and garbage-collect the archive
+    
+    Snapshots are only ever selected from those present when ``compact``
+    starts and the newest snapshot of every period is kept, so a sync that
+    runs meanwhile is never touched.
+    
+    Args:
+        store: Snapshot store to thin out
+        archive: Payload archive to thin out
+        policy: Retention policy; defaults to the configured one
+        grace: Seconds unreferenced archive blobs are kept for in-flight
+            syncs; defaults to ``Config.ARCHIVE_GC_GRACE_HOURS``
+        dry_run: Only report what would be removed
+    """
+    policy = policy or RetentionPolicy()
+    grace = Config.ARCHIVE_GC_GRACE_HOURS * 3600 if grace is None else grace
+    report = CompactionReport()
+    
+    # Syncs are judged across the store and the archive together, by timestamp
+    manifest_times: Dict[str, str] = {}
+    for snapshot_id in archive.list():
+        try:
+            manifest_times[snapshot_id] = archive.manifest(snapshot_id)["synced_at"]
+        except KeyError:
+            continue
+    
+    for source in ("sync", "holdings"):
+        rows = store.snapshots(source)
+        incomplete = store.incomplete_snapshots(source)
+        candidates: List[Tuple[Any, str, bool]] = [
+            (row["taken_at"], row["taken_at"], row["id"] not in incomplete) for row in rows
+        ]
+        if source == "sync":
+            # Archived syncs the store never saw are taken to be complete
+            stored = {row["taken_at"] for row in rows}
+            candidates.extend(
+                (synced_at, synced_at, True) for synced_at in manifest_times.values() if synced_at not in stored
+            )
+        
+        kept_times = policy.retained(candidates, datetime.utcnow())
+        removed = [row["id"] for row in rows if row["taken_at"] not in kept_times]
+        if not dry_run:
+            store.delete_snapshots(removed)
+        report.snapshots[source] = (len(rows), len(removed))
+        
+        if source == "sync":
+            removed_manifests = [
+                snapshot_id for snapshot_id, synced_at in manifest_times.items() if synced_at not in kept_times
+            ]
+            if not dry_run:
+                for snapshot_id in removed_manifests:
+                    archive.delete(snapshot_id)
+            report.manifests = (len(manifest_times), len(removed_manifests))
+    
+    if not dry_run:
+        report.objects_removed, report.bytes_freed = archive.collect_garbage(grace)
+    
+    return report
@@ -1,10 +1,17 @@
 """SnapTrade client wrapper for Fenn"""
 import json
-from typing import Dict, List, Any
-from snaptrade_client import SnapTrade
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Set, Tuple
+from snaptrade_client import Configuration, SnapTrade
 from snaptrade_client.models import UserIDandSecret
+from urllib3.util import Retry
 
 from .config import Config
+from .metrics import Metrics
+from .models import as_dict, as_list
+from .resilience import CallResult, ResilientCaller, hedged
+from .sync_writer import Checkpoint, SyncWriter
 
 
 class SnapTradeClient:
@@ -13,12 +20,23 @@ class SnapTradeClient:
     def __init__(self):
         Config.validate()
         
-        self.client = SnapTrade(
+        configuration = Configuration(
+            host=Config.SNAPTRADE_API_HOST,
             consumer_key=Config.SNAPTRADE_CONSUMER_KEY,
             client_id=Config.SNAPTRADE_CLIENT_ID
         )
+        # urllib3 would otherwise silently retry 429/503 responses carrying
+        # Retry-After; leave those to the resilience layer so they are
+        # counted and bounded by the sync deadline
+        configuration.retries = Retry(total=3, respect_retry_after_header=False)
+        
+        self.client = SnapTrade(configuration)
         self.user_id = Config.SNAPTRADE_USER_ID
         self.user_secret = Config.SNAPTRADE_USER_SECRET
+        self.resilience = ResilientCaller()
+        self.metrics = Metrics()
+        self.hedge_positions = Config.HEDGE_POSITIONS
+        self._account_brokerages: Dict[str, Optional[str]] = {}
     
     def ensure_user(self) -> Dict[str, str]:
         """Ensure SnapTrade user exists, creating if necessary"""
@@ -64,155 +82,444 @@ class SnapTradeClient:
             print(f"Error ensuring user: {e}")
             raise
     
-    def list_connections(self) -> List[Dict[str, Any]]:
-        """List all brokerage connections for the user"""
+    def _call(self, endpoint: str, fn, brokerage: Optional[str] = None, **kwargs) -> CallResult:
+        """Call an SDK method for the configured user through the resilience layer"""
         if not self.user_secret:
             self.ensure_user()
         
-        try:
-            response = self.client.connections.list_brokerage_authorizations(
-                user_id=self.user_id,
-                user_secret=self.user_secret
-            )
-            
-            # Handle ApiResponseFor200 objects
-            if hasattr(response, 'body'):
-                data = response.body
-            else:
-                data = response
-            
-            # Convert to list if it's a list-like object
-            if isinstance(data, list):
-                return data
-            elif hasattr(data, '__iter__') and not isinstance(data, (str, dict)):
-                return list(data)
-            
-            return []
-        except Exception as e:
-            print(f"Error listing connections: {e}")
+        started = time.monotonic()
+        result = self.resilience.call(
+            endpoint,
+            fn,
+            brokerage=brokerage,
+            user_id=self.user_id,
+            user_secret=self.user_secret,
+            **kwargs
+        )
+        self.metrics.record_call(result, time.monotonic() - started)
+        return result
+    
+    def _brokerage(self, account_id: str) -> Optional[str]:
+        """Institution an account belongs to, if its account listing has been seen"""
+        return self._account_brokerages.get(account_id)
+    
+    def fetch_connections(self) -> CallResult:
+        """List all brokerage connections, as a structured result"""
+        result = self._call("connections", self.client.connections.list_brokerage_authorizations)
+        if not result.ok:
+            return result
+        
+        result.value = as_list(result.value)
+        return result
+    
+    def list_connections(self) -> List[Dict[str, Any]]:
+        """List all brokerage connections for the user"""
+        result = self.fetch_connections()
+        if not result.ok:
+            print(f"Error listing connections: {result.error}")
             return []
+        return result.value
+    
+    def fetch_accounts(self) -> CallResult:
+        """Get all accounts across all connections, as a structured result"""
+        result = self._call("accounts", self.client.account_information.list_user_accounts)
+        if not result.ok:
+            return result
+        
+        accounts = as_list(result.value)
+        
+        # Remember each account's institution for per-brokerage rate limits
+        for account in accounts:
+            if isinstance(account, dict) and account.get('id'):
+                self._account_brokerages[account['id']] = account.get('institution_name')
+        
+        result.value = accounts
+        return result
     
     def get_all_accounts(self) -> List[Dict[str, Any]]:
         """Get all accounts across all connections"""
-        if not self.user_secret:
-            self.ensure_user()
-        
-        try:
-            response = self.client.account_information.list_user_accounts(
-                user_id=self.user_id,
-                user_secret=self.user_secret
-            )
-            
-            # Handle ApiResponseFor200 objects
-            if hasattr(response, 'body'):
-                data = response.body
-            else:
-                data = response
-            
-            accounts = []
-            if isinstance(data, list):
-                for account in data:
-                    if hasattr(account, 'to_dict'):
-                        accounts.append(account.to_dict())
-                    elif isinstance(account, dict):
-                        accounts.append(account)
-                    else:
-                        accounts.append(str(account))
-            elif hasattr(data, '__iter__') and not isinstance(data, (str, dict)):
-                for account in data:
-                    if hasattr(account, 'to_dict'):
-                        accounts.append(account.to_dict())
-                    elif isinstance(account, dict):
-                        accounts.append(account)
-                    else:
-                        accounts.append(str(account))
-            
-            return accounts
-        except Exception as e:
-            print(f"Error getting accounts: {e}")
+        result = self.fetch_accounts()
+        if not result.ok:
+            print(f"Error getting accounts: {result.error}")
             return []
+        return result.value
+    
+    def fetch_account_balances(self, account_id: str, deadline: Optional[float] = None) -> CallResult:
+        """Get balance information for a specific account, as a structured result"""
+        result = self._call(
+            "balances",
+            self.client.account_information.get_user_account_balance,
+            brokerage=self._brokerage(account_id),
+            deadline=deadline,
+            account_id=account_id
+        )
+        if result.ok:
+            result.value = as_dict(result.value)
+        return result
     
     def get_account_balances(self, account_id: str) -> Dict[str, Any]:
         """Get balance information for a specific account"""
-        if not self.user_secret:
-            self.ensure_user()
-        
-        try:
-            response = self.client.account_information.get_user_account_balance(
-                user_id=self.user_id,
-                user_secret=self.user_secret,
-                account_id=account_id
-            )
-            
-            if hasattr(response, 'to_dict'):
-                return response.to_dict()
-            return response if isinstance(response, dict) else {}
-        except Exception as e:
-            print(f"Error getting balance for account {account_id}: {e}")
+        result = self.fetch_account_balances(account_id)
+        if not result.ok:
+            print(f"Error getting balance for account {account_id}: {result.error}")
             return {}
+        return result.value
+    
+    def fetch_account_positions(self, account_id: str, deadline: Optional[float] = None,
+                                hedge: Optional[bool] = None) -> CallResult:
+        """Get positions for a specific account, as a structured result
+        
+        With hedging enabled (``hedge``, defaulting to ``self.hedge_positions``)
+        a positions request that runs past the endpoint's recent p95 latency
+        is raced against the equivalent ``get_user_holdings`` request, and
+        whichever answers first successfully is used.
+        """
+        if hedge is None:
+            hedge = self.hedge_positions
+        if not hedge:
+            return self._fetch_positions(account_id, deadline)
+        
+        return hedged(
+            lambda: self._fetch_positions(account_id, deadline),
+            lambda: self._fetch_positions_from_holdings(account_id, deadline),
+            self.hedge_delay("positions")
+        )
+    
+    def hedge_delay(self, endpoint: str) -> float:
+        """Seconds to wait on ``endpoint`` before hedging: its p95 latency once known"""
+        p95 = self.resilience.latency.percentile(endpoint, 0.95)
+        return Config.HEDGE_DEFAULT_DELAY if p95 is None else p95
+    
+    def _fetch_positions_from_holdings(self, account_id: str, deadline: Optional[float] = None) -> CallResult:
+        """Positions taken from the account's holdings, as a hedge for the positions endpoint"""
+        result = self.fetch_account_holdings(account_id, deadline=deadline)
+        if result.ok:
+            result.value = as_list(result.value.get('positions') or [])
+        return result
+    
+    def _fetch_positions(self, account_id: str, deadline: Optional[float] = None) -> CallResult:
+        """Positions from the positions endpoint"""
+        result = self._call(
+            "positions",
+            self.client.account_information.get_user_account_positions,
+            brokerage=self._brokerage(account_id),
+            deadline=deadline,
+            account_id=account_id
+        )
+        if result.ok:
+            result.value = as_list(result.value)
+        return result
     
     def get_account_positions(self, account_id: str) -> List[Dict[str, Any]]:
         """Get positions for a specific account"""
-        if not self.user_secret:
-            self.ensure_user()
+        result = self.fetch_account_positions(account_id)
+        if not result.ok:
+            print(f"Error getting positions for account {account_id}: {result.error}")
+            return []
+        return result.value
+    
+    def fetch_account_holdings(self, account_id: str, deadline: Optional[float] = None) -> CallResult:
+        """Get holdings (balances and positions) for a specific account, as a structured result"""
+        # Use get_user_holdings which works (not get_user_account_positions which hangs)
+        result = self._call(
+            "holdings",
+            self.client.account_information.get_user_holdings,
+            brokerage=self._brokerage(account_id),
+            deadline=deadline,
+            account_id=account_id
+        )
+        if result.ok:
+            result.value = as_dict(result.value)
+        return result
+    
+    def get_account_holdings(self, account_id: str) -> Dict[str, Any]:
+        """Get holdings (balances and positions) for a specific account
         
-        try:
-            response = self.client.account_information.get_user_account_positions(
-                user_id=self.user_id,
-                user_secret=self.user_secret,
-                account_id=account_id
-            )
-            
-            body = getattr(response, 'body', response)
-            positions = []
-            if isinstance(body, list):
-                for position in body:
-                    if hasattr(position, 'to_dict'):
-                        positions.append(position.to_dict())
+        Unlike the other account methods, errors are raised to the caller so
+        that they can be reported per account.
+        """
+        result = self.fetch_account_holdings(account_id)
+        if not result.ok:
+            raise RuntimeError(result.error)
+        return result.value
+    
+    def fetch_currency_rates(self) -> CallResult:
+        """Get SnapTrade's exchange rates, as a structured result
+        
+        Each rate is a ``{"src": {...}, "dst": {...}, "exchange_rate": ...}``
+        pair: one unit of ``src`` is worth ``exchange_rate`` units of ``dst``.
+        """
+        # Reference data, so there are no user credentials to pass
+        started = time.monotonic()
+        result = self.resilience.call("currency_rates", self.client.reference_data.list_all_currencies_rates)
+        self.metrics.record_call(result, time.monotonic() - started)
+        if result.ok:
+            result.value = as_list(result.value)
+        return result
+    
+    def get_all_holdings(self, account_ids: List[str], max_workers: Optional[int] = None,
+                         bulk: bool = True) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """Get holdings for many accounts with a single bulk request
+        
+        Holdings for every account come from one ``get_all_user_holdings``
+        call. Accounts that the bulk response leaves out, or returns without
+        a positions list, are fetched individually with
+        ``fetch_account_holdings`` (at most ``max_workers`` at a time).
+        With ``bulk=False`` every account is fetched individually, which is
+        cheaper when only a few of the user's accounts are needed.
+        
+        Returns:
+            Tuple of (account_id -> holdings dict, account_id -> error message)
+        """
+        if max_workers is None:
+            max_workers = Config.SYNC_MAX_WORKERS
+        
+        holdings = {}
+        if bulk:
+            result = self._call("all_holdings", self.client.account_information.get_all_user_holdings)
+            if result.ok:
+                for item in as_list(result.value):
+                    if not isinstance(item, dict):
+                        continue
+                    account = item.get('account') or {}
+                    account_id = account.get('id') if isinstance(account, dict) else None
+                    if account_id and item.get('positions') is not None:
+                        holdings[account_id] = item
+            else:
+                print(f"Bulk holdings request failed, fetching accounts individually: {result.error}")
+        
+        missing = [account_id for account_id in account_ids if account_id not in holdings]
+        errors = {}
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                futures = [(account_id, executor.submit(self.fetch_account_holdings, account_id))
+                           for account_id in missing]
+                for account_id, future in futures:
+                    account_result = future.result()
+                    if account_result.ok:
+                        holdings[account_id] = account_result.value
                     else:
-                        positions.append(position)
-            
-            return positions
-        except Exception as e:
-            print(f"Error getting positions for account {account_id}: {e}")
-            return []
+                        errors[account_id] = account_result.error
+        
+        return holdings, errors
+    
+    @staticmethod
+    def _sync_markers(account: Dict[str, Any], connections: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Upstream sync markers for an account, or None if SnapTrade has none
+        
+        The markers change whenever the brokerage refreshes the account's
+        holdings or its connection is updated, re-enabled or disabled.
+        """
+        sync_status = account.get("sync_status") or {}
+        holdings_status = sync_status.get("holdings") or {}
+        last_sync = holdings_status.get("last_successful_sync")
+        if not last_sync:
+            return None
+        
+        connection = connections.get(str(account.get("brokerage_authorization")), {})
+        return {
+            "holdings_synced_at": str(last_sync),
+            "connection_updated_at": str(connection.get("updated_date")),
+            "connection_disabled": bool(connection.get("disabled", False))
+        }
     
-    def sync_all_data(self) -> Dict[str, Any]:
-        """Sync all portfolio data from all connected brokers"""
+    def sync_all_data(self, max_workers: Optional[int] = None,
+                      previous: Optional[Dict[str, Any]] = None,
+                      deadline: Optional[float] = None,
+                      writer: Optional[SyncWriter] = None,
+                      checkpoint: Optional[Checkpoint] = None,
+                      connection_ids: Optional[Set[str]] = None,
+                      incremental: bool = True) -> Dict[str, Any]:
+        """Sync all portfolio data from all connected brokers
+        
+        Balance and position requests for every account are issued through a
+        thread pool with at most ``max_workers`` requests in flight (defaults
+        to ``Config.SYNC_MAX_WORKERS``). Results are collected in the order
+        SnapTrade lists the accounts, so the output matches a sequential sync.
+        
+        Failed balance or position requests (after retries) are recorded in
+        the account's ``errors`` list rather than aborting the sync. The same
+        applies to requests still outstanding when the overall ``deadline``
+        (seconds, defaulting to ``Config.SYNC_DEADLINE``; 0 disables) runs
+        out, so a hung endpoint yields a partial sync instead of blocking.
+        
+        If ``previous`` (an earlier result of this method) is given, the sync
+        is incremental: accounts whose upstream sync markers are unchanged
+        since that sync keep their previous balances and positions instead of
+        being refetched. ``incremental=False`` uses ``previous`` only for
+        ``connection_ids``.
+        
+        With ``connection_ids``, only accounts on those connections are
+        synced; the others are carried forward from ``previous`` as they
+        were, with their previous sync markers, unless they are missing
+        from it or were incomplete there.
+        
+        With a ``writer``, each account record is journaled as soon as it is
+        complete instead of being collected in memory, and the returned
+        ``accounts`` is the writer's lazy view of the journal. Accounts found
+        complete in ``checkpoint`` (left by an interrupted sync) are reused
+        without being refetched.
+        """
+        if max_workers is None:
+            max_workers = Config.SYNC_MAX_WORKERS
+        max_workers = max(1, max_workers)
+        if deadline is None:
+            deadline = Config.SYNC_DEADLINE
+        expires_at = time.monotonic() + deadline if deadline else None
+        
         print("🔄 Syncing portfolio data...")
         
         # Ensure user exists
         user_info = self.ensure_user()
         print(f"✓ User configured: {user_info['user_id']}")
         
-        # Get connections
-        connections = self.list_connections()
+        # Get connections; without them (or the accounts) a sync would
+        # silently produce an empty portfolio, so failures abort the sync
+        with self.metrics.stage("connections"):
+            result = self.fetch_connections()
+        if not result.ok:
+            raise RuntimeError(f"Could not list connections: {result.error}")
+        connections = result.value
         print(f"✓ Found {len(connections)} brokerage connection(s)")
         
         # Get all accounts
-        accounts = self.get_all_accounts()
+        with self.metrics.stage("accounts"):
+            result = self.fetch_accounts()
+        if not result.ok:
+            raise RuntimeError(f"Could not list accounts: {result.error}")
+        accounts = result.value
         print(f"✓ Found {len(accounts)} account(s)")
         
+        connections_by_id = {
+            str(connection.get("id")): connection
+            for connection in connections if isinstance(connection, dict)
+        }
+        
+        # Index the previous sync for carry-forward
+        previous_accounts = {}
+        previous_markers = {}
+        if previous:
+            for record in previous.get("accounts", []):
+                info = record.get("info", {})
+                if isinstance(info, dict) and info.get("id"):
+                    previous_accounts[info["id"]] = record
+            previous_markers = previous.get("sync_state", {}).get("accounts", {})
+        
         # Get detailed data for each account
         portfolio_data = {
             "user": user_info,
             "connections": connections,
-            "accounts": []
+            "accounts": [],
+            "sync_state": {
+                "connections": {
+                    connection_id: {
+                        "updated_date": str(connection.get("updated_date")),
+                        "disabled": bool(connection.get("disabled", False))
+                    }
+                    for connection_id, connection in connections_by_id.items()
+                },
+                "accounts": {}
+            }
         }
         
-        for account in accounts:
-            account_id = account.get("id") if isinstance(account, dict) else getattr(account, "id", None)
-            
-            if account_id:
-                print(f"  Syncing account: {account_id}")
-                
-                balances = self.get_account_balances(account_id)
-                positions = self.get_account_positions(account_id)
+        if writer is not None:
+            writer.begin({"user": user_info, "connections": connections})
+        
+        carried = 0
+        resumed = 0
+        failed = 0
+        unscheduled = 0
+        with self.metrics.stage("account_data"), ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Every account's requests are queued up front; on Ctrl-C drop
+            # the queued ones rather than waiting for them to run
+            pending = []
+            try:
+                for account in accounts:
+                    account_id = account.get("id") if isinstance(account, dict) else getattr(account, "id", None)
+                    
+                    if account_id:
+                        markers = self._sync_markers(account, connections_by_id) if isinstance(account, dict) else None
+                        
+                        if checkpoint is not None and account_id in checkpoint:
+                            print(f"  Resumed account: {account_id}")
+                            pending.append((account, account_id, None, None, None))
+                            resumed += 1
+                            continue
+                        
+                        previous_record = previous_accounts.get(account_id)
+                        if (connection_ids is not None and previous_record is not None
+                                and "errors" not in previous_record and isinstance(account, dict)
+                                and str(account.get("brokerage_authorization")) not in connection_ids):
+                            pending.append((account, account_id, previous_markers.get(account_id), previous_record, None))
+                            unscheduled += 1
+                            continue
+                        
+                        if (incremental and markers and previous_record is not None
+                                and previous_markers.get(account_id) == markers):
+                            print(f"  Unchanged account: {account_id}")
+                            pending.append((account, account_id, markers, previous_accounts[account_id], None))
+                            carried += 1
+                            continue
+                        
+                        print(f"  Syncing account: {account_id}")
+                        
+                        futures = (
+                            executor.submit(self.fetch_account_balances, account_id, expires_at),
+                            executor.submit(self.fetch_account_positions, account_id, expires_at)
+                        )
+                        pending.append((account, account_id, markers, None, futures))
                 
-                portfolio_data["accounts"].append({
-                    "info": account,
-                    "balances": balances,
-                    "positions": positions
-                })
+                for account, account_id, markers, previous_record, futures in pending:
+                    if futures is None:
+                        # Resumed records are only read back from the checkpoint
+                        # when their turn comes to be written, with the markers
+                        # they were synced at rather than the current ones
+                        if previous_record is None:
+                            previous_record, markers = checkpoint.get(account_id)
+                        record = {
+                            "info": account,
+                            "balances": previous_record.get("balances", {}),
+                            "positions": previous_record.get("positions", [])
+                        }
+                    else:
+                        balances, positions = (future.result() for future in futures)
+                        record = {
+                            "info": account,
+                            "balances": balances.value if balances.ok else {},
+                            "positions": positions.value if positions.ok else []
+                        }
+                        errors = [result.to_dict() for result in (balances, positions) if not result.ok]
+                        if errors:
+                            record["errors"] = errors
+                            failed += 1
+                            details = "; ".join(f"{error['endpoint']}: {error['error']}" for error in errors)
+                            print(f"  ⚠️  Account {account_id} incomplete ({details})")
+                    
+                    # Only record markers for complete data so failed accounts
+                    # are retried by the next incremental sync
+                    if markers and "errors" not in record:
+                        portfolio_data["sync_state"]["accounts"][account_id] = markers
+                    if writer is not None:
+                        writer.add(record, markers)
+                    else:
+                        portfolio_data["accounts"].append(record)
+            except KeyboardInterrupt:
+                for *_, futures in pending:
+                    for future in futures or ():
+                        future.cancel()
+                executor.shutdown(wait=False)
+                raise
+        
+        if writer is not None:
+            portfolio_data["accounts"] = writer.records()
+        
+        if checkpoint is not None:
+            print(f"✓ Resumed {resumed} account(s) from the interrupted sync")
+        if previous and incremental:
+            print(f"✓ Carried forward {carried} unchanged account(s)")
+        if connection_ids is not None:
+            print(f"✓ Carried forward {unscheduled} account(s) on other connections")
+        if failed:
+            print(f"⚠️  {failed} account(s) could not be fully synced")
         
         return portfolio_data
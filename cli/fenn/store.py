@@ -0,0 +1,318 @@
+"""SQLite archive of portfolio snapshots
+
+Every ``fenn sync`` and every holdings fetch by ``fenn portfolio`` is kept as
+a snapshot instead of overwriting the previous one. Accounts, balances and
+positions are stored in normalized tables indexed by account and by symbol
+against snapshot time, so commands query only the rows they need rather
+than loading a whole JSON document.
+
+Amounts are stored as decimal strings so they round-trip exactly. The
+schema version is kept in SQLite's ``user_version``, and stores written by
+an older fenn are upgraded in place when opened.
+"""
+import json
+import sqlite3
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .config import Config
+from .models import Account, Balance, Position, parse_positions
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    taken_at TEXT NOT NULL,
+    source TEXT NOT NULL,
+    connection_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS snapshots_source_time ON snapshots (source, taken_at);
+
+CREATE TABLE IF NOT EXISTS accounts (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    taken_at TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    institution TEXT NOT NULL,
+    connection_id TEXT,
+    errors TEXT,
+    fetched_at TEXT,
+    PRIMARY KEY (snapshot_id, account_id)
+);
+CREATE INDEX IF NOT EXISTS accounts_account_time ON accounts (account_id, taken_at);
+
+CREATE TABLE IF NOT EXISTS balances (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    taken_at TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, account_id, currency)
+);
+CREATE INDEX IF NOT EXISTS balances_account_time ON balances (account_id, taken_at);
+
+CREATE TABLE IF NOT EXISTS positions (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    taken_at TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    description TEXT NOT NULL,
+    quantity TEXT NOT NULL,
+    price TEXT NOT NULL,
+    avg_cost TEXT NOT NULL,
+    currency TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS positions_snapshot ON positions (snapshot_id, account_id, seq);
+CREATE INDEX IF NOT EXISTS positions_symbol_time ON positions (symbol, taken_at);
+CREATE INDEX IF NOT EXISTS positions_account_time ON positions (account_id, taken_at);
+"""
+
+def _add_fetched_at(conn: sqlite3.Connection):
+    """Version 2: accounts record when they were fetched"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(accounts)")}
+    if "fetched_at" not in columns:
+        conn.execute("ALTER TABLE accounts ADD COLUMN fetched_at TEXT")
+
+
+# MIGRATIONS[n - 1] upgrades a version n store to version n + 1
+MIGRATIONS = [_add_fetched_at]
+SCHEMA_VERSION = len(MIGRATIONS) + 1
+
+# A snapshot's accounts: (account, its positions, its errors if incomplete)
+AccountRecord = Tuple[Account, List[Position], Optional[Any]]
+
+
+def sync_records(portfolio_data: Dict[str, Any]) -> Iterator[AccountRecord]:
+    """Parsed account records of a ``SnapTradeClient.sync_all_data`` result"""
+    for record in portfolio_data.get("accounts", []):
+        info = record.get("info", {})
+        if not isinstance(info, dict):
+            continue
+        positions, _ = parse_positions(record.get("positions"))
+        yield Account.from_raw(info), positions, record.get("errors")
+
+
+class SnapshotStore:
+    """Append-only SQLite archive of portfolio snapshots"""
+    
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or Config.SNAPSHOT_DB)
+        # Wait out writes by a concurrent sync or compaction
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        # WAL lets commands read while a sync is writing
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self._upgrade()
+    
+    def _upgrade(self):
+        """Create the schema, or bring a store written by an older fenn up to date"""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"{self.path} was written by a newer version of fenn (schema {version}, "
+                f"this version reads up to {SCHEMA_VERSION})"
+            )
+        if version == SCHEMA_VERSION:
+            return
+        
+        # Stores from before versioning have tables but no user_version
+        legacy = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'snapshots'").fetchone()
+        if version == 0 and not legacy:
+            self.conn.executescript(SCHEMA)
+        else:
+            for migration in MIGRATIONS[max(version, 1) - 1:]:
+                migration(self.conn)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    def close(self):
+        self.conn.close()
+    
+    def __enter__(self) -> 'SnapshotStore':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def add_snapshot(self, source: str, records: Iterable[AccountRecord],
+                     taken_at: Optional[str] = None, connection_count: int = 0,
+                     fetched_at: Optional[Dict[str, str]] = None) -> int:
+        """Store one snapshot in a single transaction
+        
+        Args:
+            source: What produced the snapshot (``"sync"`` or ``"holdings"``)
+            records: Accounts with their positions and errors, in display order
+            taken_at: ISO timestamp; defaults to now (UTC)
+            connection_count: Number of brokerage connections at the time
+            fetched_at: ISO fetch time per account id, for accounts carried
+                forward from an earlier snapshot; others count as fetched at
+                ``taken_at``
+        
+        Returns:
+            The new snapshot's id
+        """
+        taken_at = taken_at or datetime.utcnow().isoformat()
+        
+        account_rows = []
+        balance_rows = []
+        position_rows = []
+        
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO snapshots (taken_at, source, connection_count) VALUES (?, ?, ?)",
+                (taken_at, source, connection_count)
+            )
+            snapshot_id = cursor.lastrowid
+            
+            for account_seq, (account, positions, errors) in enumerate(records):
+                if not account.id:
+                    continue
+                account_rows.append((
+                    snapshot_id, taken_at, account.id, account_seq, account.name, account.institution,
+                    account.connection_id, json.dumps(errors) if errors else None,
+                    (fetched_at or {}).get(account.id)
+                ))
+                if account.balance is not None and account.balance.amount is not None:
+                    balance_rows.append((
+                        snapshot_id, taken_at, account.id, account.balance.currency, str(account.balance.amount)
+                    ))
+                position_rows.extend(
+                    (snapshot_id, taken_at, account.id, seq, position.symbol, position.description,
+                     str(position.quantity), str(position.price), str(position.avg_cost), position.currency)
+                    for seq, position in enumerate(positions)
+                )
+            
+            self.conn.executemany("INSERT INTO accounts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", account_rows)
+            self.conn.executemany("INSERT OR REPLACE INTO balances VALUES (?, ?, ?, ?, ?)", balance_rows)
+            self.conn.executemany("INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", position_rows)
+        
+        return snapshot_id
+    
+    def add_sync(self, portfolio_data: Dict[str, Any]) -> int:
+        """Store the result of ``SnapTradeClient.sync_all_data`` as a snapshot"""
+        return self.add_snapshot(
+            "sync",
+            sync_records(portfolio_data),
+            taken_at=portfolio_data.get("synced_at"),
+            connection_count=len(portfolio_data.get("connections", []))
+        )
+    
+    def snapshots(self, source: str, after: Optional[str] = None) -> List[sqlite3.Row]:
+        """Snapshots from ``source``, oldest first, optionally only those taken after ``after``"""
+        return self.conn.execute(
+            "SELECT * FROM snapshots WHERE source = ? AND taken_at > ? ORDER BY taken_at, id",
+            (source, after or "")
+        ).fetchall()
+    
+    def latest_snapshot(self, source: str) -> Optional[sqlite3.Row]:
+        """Most recent snapshot from ``source``, or None"""
+        return self.conn.execute(
+            "SELECT * FROM snapshots WHERE source = ? ORDER BY taken_at DESC, id DESC LIMIT 1",
+            (source,)
+        ).fetchone()
+    
+    def incomplete_snapshots(self, source: str) -> Set[int]:
+        """Ids of snapshots from ``source`` in which some account has errors"""
+        return {row[0] for row in self.conn.execute(
+            "SELECT DISTINCT a.snapshot_id FROM accounts a JOIN snapshots s ON s.id = a.snapshot_id "
+            "WHERE s.source = ? AND a.errors IS NOT NULL",
+            (source,)
+        )}
+    
+    def delete_snapshots(self, snapshot_ids: Iterable[int], batch_size: int = 100) -> int:
+        """Delete snapshots with their accounts, balances and positions
+        
+        Deletes in short transactions of ``batch_size`` snapshots so that a
+        concurrent sync is never blocked for long.
+        
+        Returns:
+            Number of snapshots deleted
+        """
+        snapshot_ids = list(snapshot_ids)
+        deleted = 0
+        for start in range(0, len(snapshot_ids), batch_size):
+            batch = snapshot_ids[start:start + batch_size]
+            with self.conn:
+                cursor = self.conn.execute(
+                    f"DELETE FROM snapshots WHERE id IN ({', '.join('?' * len(batch))})", batch
+                )
+                deleted += cursor.rowcount
+        return deleted
+    
+    def vacuum(self):
+        """Reclaim the space of deleted snapshots and refresh index statistics"""
+        self.conn.execute("VACUUM")
+        self.conn.execute("ANALYZE")
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    
+    def accounts(self, snapshot_id: int) -> List[Tuple[Account, Optional[Any]]]:
+        """A snapshot's accounts, in order, with their errors"""
+        rows = self.conn.execute(
+            """
+            SELECT a.*, b.currency, b.amount
+            FROM accounts a
+            LEFT JOIN balances b ON b.snapshot_id = a.snapshot_id AND b.account_id = a.account_id
+            WHERE a.snapshot_id = ?
+            ORDER BY a.seq
+            """,
+            (snapshot_id,)
+        ).fetchall()
+        
+        accounts = {}
+        for row in rows:
+            if row["account_id"] in accounts:
+                continue
+            balance = Balance(Decimal(row["amount"]), row["currency"]) if row["amount"] is not None else None
+            account = Account(row["account_id"], row["name"], row["institution"], row["connection_id"], balance)
+            accounts[row["account_id"]] = (account, json.loads(row["errors"]) if row["errors"] else None)
+        return list(accounts.values())
+    
+    def fetched_times(self, snapshot_id: int) -> Dict[str, str]:
+        """When each account of a snapshot was fetched (ISO timestamps)"""
+        return {row["account_id"]: row["fetched_at"] for row in self.conn.execute(
+            "SELECT account_id, COALESCE(fetched_at, taken_at) AS fetched_at FROM accounts WHERE snapshot_id = ?",
+            (snapshot_id,)
+        )}
+    
+    def position_counts(self, snapshot_id: int) -> Dict[str, int]:
+        """Number of positions per account in a snapshot"""
+        rows = self.conn.execute(
+            "SELECT account_id, COUNT(*) AS n FROM positions WHERE snapshot_id = ? GROUP BY account_id",
+            (snapshot_id,)
+        )
+        return {row["account_id"]: row["n"] for row in rows}
+    
+    def positions(self, snapshot_id: int, limit_per_account: Optional[int] = None) -> Dict[str, List[Position]]:
+        """A snapshot's positions grouped by account, in their original order
+        
+        With ``limit_per_account`` only the first that many positions of each
+        account are read.
+        """
+        query = "SELECT * FROM positions WHERE snapshot_id = ?"
+        params: Tuple[Any, ...] = (snapshot_id,)
+        if limit_per_account is not None:
+            query += " AND seq < ?"
+            params += (limit_per_account,)
+        query += " ORDER BY account_id, seq"
+        
+        positions: Dict[str, List[Position]] = {}
+        for row in self.conn.execute(query, params):
+            positions.setdefault(row["account_id"], []).append(Position(
+                symbol=row["symbol"],
+                description=row["description"],
+                quantity=Decimal(row["quantity"]),
+                price=Decimal(row["price"]),
+                avg_cost=Decimal(row["avg_cost"]),
+                currency=row["currency"]
+            ))
+        return positions
+    
+    def records(self, snapshot_id: int) -> List[AccountRecord]:
+        """A snapshot's accounts with their positions and errors, in order"""
+        positions = self.positions(snapshot_id)
+        return [(account, positions.get(account.id, []), errors)
+                for account, errors in self.accounts(snapshot_id)]
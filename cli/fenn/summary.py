@@ -0,0 +1,118 @@
+"""Compact summary of the latest sync for ``fenn status``
+
+Each sync writes ``portfolio.summary.json`` next to ``portfolio.json`` with
+everything ``status`` prints: per-account name, balance, position count and
+first positions, plus totals. ``status`` reads only this file. The summary
+records the size and modification time of the ``portfolio.json`` it
+describes, and is treated as stale when that file has changed since.
+"""
+import json
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .models import Account, Position, parse_positions
+from .storage import atomic_open
+
+
+SUMMARY_VERSION = 1
+
+
+def source_stamp(path: Path) -> Optional[List[int]]:
+    """(size, mtime in ns) identifying a version of ``path``, or None if missing"""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_summary(synced_at: Optional[str], connection_count: int,
+                  accounts: Iterable[Tuple[Account, int, List[Position], bool]]) -> Dict[str, Any]:
+    """Summary document from per-account details
+    
+    Args:
+        synced_at: Sync timestamp
+        connection_count: Number of brokerage connections
+        accounts: (account, position count, first positions, incomplete) tuples
+    """
+    summary_accounts = []
+    balance_totals: Dict[str, Decimal] = defaultdict(Decimal)
+    position_total = 0
+    
+    for account, position_count, first_positions, incomplete in accounts:
+        balance = account.balance
+        if balance is not None and balance.amount is not None:
+            balance_totals[balance.currency] += balance.amount
+            balance_data = {"amount": str(balance.amount), "currency": balance.currency}
+        else:
+            balance_data = None
+        
+        position_total += position_count
+        summary_accounts.append({
+            "id": account.id,
+            "name": account.name,
+            "institution": account.institution,
+            "balance": balance_data,
+            "position_count": position_count,
+            "positions": [{"symbol": p.symbol, "quantity": str(p.quantity)} for p in first_positions],
+            "incomplete": incomplete
+        })
+    
+    return {
+        "version": SUMMARY_VERSION,
+        "synced_at": synced_at,
+        "connection_count": connection_count,
+        "accounts": summary_accounts,
+        "totals": {
+            "accounts": len(summary_accounts),
+            "positions": position_total,
+            "balances": {currency: str(amount) for currency, amount in sorted(balance_totals.items())}
+        }
+    }
+
+
+def summarize_sync(portfolio_data: Dict[str, Any], top_n: int) -> Dict[str, Any]:
+    """Summary of a ``sync_all_data`` result, in one pass over its accounts"""
+    def details():
+        for record in portfolio_data.get("accounts", []):
+            info = record.get("info", {})
+            if not isinstance(info, dict):
+                continue
+            positions = record.get("positions") or []
+            first_positions, _ = parse_positions(positions[:top_n])
+            yield Account.from_raw(info), len(positions), first_positions, bool(record.get("errors"))
+    
+    return build_summary(
+        portfolio_data.get("synced_at"),
+        len(portfolio_data.get("connections", [])),
+        details()
+    )
+
+
+def write_summary(summary: Dict[str, Any], path: Path, source: Path, stamp: Optional[List[int]] = None):
+    """Write a summary of ``source`` atomically
+    
+    Args:
+        stamp: ``source_stamp`` of the version of ``source`` summarized
+            (default: the current one)
+    """
+    summary = {**summary, "source_stamp": stamp or source_stamp(source)}
+    with atomic_open(path) as f:
+        json.dump(summary, f, indent=2)
+
+
+def load_summary(path: Path, source: Path) -> Optional[Dict[str, Any]]:
+    """The summary at ``path`` if it is current for ``source``, else None"""
+    try:
+        with open(path, "r") as f:
+            summary = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    
+    if summary.get("version") != SUMMARY_VERSION:
+        return None
+    if summary.get("source_stamp") != source_stamp(source):
+        return None
+    return summary
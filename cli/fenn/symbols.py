@@ -0,0 +1,123 @@
+"""Symbol equivalence rules for ``fenn portfolio`` and ``fenn plot``
+
+Rules say which symbols count as the same holding. They are read from
+``data/symbol_rules.json``:
+
+    {
+      "aliases": {"BRKB": "BRK.B"},
+      "groups": {
+        "GOOG/L": {"description": "Alphabet Inc. (Class A & C)", "members": ["GOOG", "GOOGL"]},
+        "S&P-track": {"description": "S&P 500 Trackers", "members": ["VOO", "SPY", "IVV"]}
+      }
+    }
+
+An alias is another name for the same security (a broker's spelling of a
+ticker) and is renamed everywhere. A group gathers different securities
+that are held as one (share classes, funds tracking the same index); it is
+applied where holdings are totaled by symbol, while per-account listings
+keep the members apart. Members may be given by alias.
+
+``SymbolRules`` compiles the rules once into symbol -> canonical symbol
+lookup tables, so a table of positions is relabeled in a single pass
+(``PositionTable.relabel``) however many rules there are. Without a rules
+file, ``DEFAULT_RULES`` apply.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .config import Config
+
+DEFAULT_RULES = {
+    "aliases": {
+        "BRKB": "BRK.B"
+    },
+    "groups": {
+        "GOOG/L": {
+            "description": "Alphabet Inc. (Class A & C)",
+            "members": ["GOOG", "GOOGL"]
+        },
+        # FNILX is Fidelity ZERO Large Cap Index (tracks similar to S&P 500)
+        "S&P-track": {
+            "description": "S&P 500 Trackers",
+            "members": ["VOO", "SPY", "IVV", "FXAIX", "O8I1", "VFIAX", "FNILX"]
+        }
+    }
+}
+
+
+class SymbolRules:
+    """Aliases and groups compiled into lookup tables
+    
+    Args:
+        aliases: Symbol -> the symbol it is another name for
+        groups: Group symbol -> ``{"description": ..., "members": [...]}``
+            (or just the list of members)
+    
+    Raises:
+        ValueError: If the rules are inconsistent (an alias cycle, or a
+            symbol in more than one group)
+    """
+    
+    def __init__(self, aliases: Optional[Dict[str, str]] = None, groups: Optional[Dict[str, Any]] = None):
+        self.aliases: Dict[str, str] = {}
+        self.lookup: Dict[str, str] = {}
+        self.descriptions: Dict[str, str] = {}
+        
+        aliases = {str(alias).strip(): str(symbol).strip() for alias, symbol in (aliases or {}).items()}
+        for alias in aliases:
+            self.aliases[alias] = self._resolve(alias, aliases)
+        
+        for group, rule in (groups or {}).items():
+            group = self.aliases.get(group, group)
+            if isinstance(rule, dict):
+                members = rule.get("members", [])
+                if rule.get("description"):
+                    self.descriptions[group] = rule["description"]
+            else:
+                members = rule
+            for member in members:
+                member = self.aliases.get(member, member)
+                if self.lookup.get(member, group) != group:
+                    raise ValueError(f"{member} is in both {self.lookup[member]} and {group}")
+                self.lookup[member] = group
+        
+        # Every alias of a group member (or of the group) maps straight to the group
+        for alias, symbol in self.aliases.items():
+            self.lookup.setdefault(alias, self.lookup.get(symbol, symbol))
+        self.lookup = {symbol: group for symbol, group in self.lookup.items() if symbol != group}
+    
+    @staticmethod
+    def _resolve(symbol: str, aliases: Dict[str, str]) -> str:
+        seen = [symbol]
+        while symbol in aliases and aliases[symbol] != symbol:
+            symbol = aliases[symbol]
+            if symbol in seen:
+                raise ValueError(f"Alias cycle: {' -> '.join(seen + [symbol])}")
+            seen.append(symbol)
+        return symbol
+    
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> 'SymbolRules':
+        """Rules from a rules file, or ``DEFAULT_RULES`` if it does not exist
+        
+        Raises:
+            ValueError: If the file is not valid JSON or its rules are inconsistent
+        """
+        path = Path(path or Config.SYMBOL_RULES_FILE)
+        if not path.exists():
+            return cls(DEFAULT_RULES["aliases"], DEFAULT_RULES["groups"])
+        try:
+            with open(path, "r") as f:
+                rules = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path} is not valid JSON: {e}") from None
+        return cls(rules.get("aliases"), rules.get("groups"))
+    
+    def mapping(self, groups: bool = True) -> Dict[str, str]:
+        """Symbol -> canonical symbol, with or without groups applied"""
+        return self.lookup if groups else self.aliases
+    
+    def canonical(self, symbol: str, groups: bool = True) -> str:
+        """The symbol ``symbol`` is counted as"""
+        return self.mapping(groups).get(symbol, symbol)
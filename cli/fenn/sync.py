@@ -0,0 +1,55 @@
+"""Saving a completed sync
+
+A sync is kept in several places: ``portfolio.json``, the snapshot store and
+its history index, the payload archive and the summary ``fenn status`` reads.
+``fenn sync`` and ``fenn watch`` both save through ``save_sync`` so they
+always leave the same files behind.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from .archive import SnapshotArchive
+from .config import Config
+from .metrics import Metrics
+from .store import SnapshotStore
+from .summary import summarize_sync, write_summary
+from .sync_writer import SyncWriter
+from .timeseries import TimeSeriesIndex
+
+
+@dataclass
+class SavedSync:
+    """Where a sync was saved"""
+    snapshot_id: str
+    objects_written: int
+    bytes_written: int
+    summary: Dict[str, Any]
+
+
+def save_sync(portfolio_data: Dict[str, Any], writer: SyncWriter, metrics: Metrics) -> SavedSync:
+    """Publish a sync and record it in the store, index, archive and summary
+    
+    Args:
+        portfolio_data: Result of ``SnapTradeClient.sync_all_data``, with ``synced_at`` set
+        writer: Writer the sync was journaled through
+        metrics: Metrics to time each step in
+    """
+    with metrics.stage("write"):
+        writer.publish(portfolio_data)
+    
+    # Keep the sync in the snapshot store, its history index and the raw payload archive
+    with SnapshotStore() as store:
+        with metrics.stage("store"):
+            store.add_sync(portfolio_data)
+        with metrics.stage("index"):
+            TimeSeriesIndex().update(store)
+    with metrics.stage("archive"):
+        archive = SnapshotArchive()
+        snapshot_id, _ = archive.add(portfolio_data)
+    
+    # Summarize the sync for `fenn status`
+    with metrics.stage("summary"):
+        summary = summarize_sync(portfolio_data, Config.STATUS_POSITIONS)
+        write_summary(summary, Config.SUMMARY_FILE, writer.output)
+    
+    return SavedSync(snapshot_id, archive.objects_written, archive.bytes_written, summary)
@@ -0,0 +1,187 @@
+"""Streaming, checkpointed writer for sync results
+
+Account records are appended to an NDJSON journal as soon as they are
+fetched, so a crashed or interrupted sync keeps everything it has already
+downloaded and ``fenn sync --resume`` can pick up where it stopped. Once the
+sync finishes, ``portfolio.json`` is streamed from the journal into a temp
+file and renamed into place, so readers never see a torn file and the
+account records are never all held in memory at once.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, Optional, Tuple
+
+from .storage import atomic_open
+
+
+def _indented(value: Any, level: int) -> str:
+    """``json.dumps(value, indent=2)`` for a value nested ``level`` deep"""
+    return json.dumps(value, indent=2, default=str).replace("\n", "\n" + "  " * level)
+
+
+class JournalRecords:
+    """Re-iterable view of the account records in a journal"""
+    
+    def __init__(self, path: Path, count: int):
+        self.path = path
+        self.count = count
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for entry in _read_journal(self.path):
+            if "account" in entry:
+                yield entry["account"]
+
+
+def _read_journal(path: Path) -> Iterator[Dict[str, Any]]:
+    """Entries of a journal, skipping lines torn by a crash mid-write"""
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+class Checkpoint:
+    """Account records kept by an interrupted sync, loaded on demand
+    
+    Only complete records (without ``errors``) are offered for reuse; their
+    journal offsets are indexed up front and the records themselves read
+    back one at a time.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = path
+        # Later entries for an account (from a resumed run) win
+        self._offsets: Dict[str, int] = {}
+        
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    entry = {}
+                record = entry.get("account")
+                info = record.get("info", {}) if isinstance(record, dict) else {}
+                if isinstance(info, dict) and info.get("id") and not record.get("errors"):
+                    self._offsets[info["id"]] = offset
+                offset += len(line)
+    
+    def __len__(self) -> int:
+        return len(self._offsets)
+    
+    def __contains__(self, account_id: str) -> bool:
+        return account_id in self._offsets
+    
+    def get(self, account_id: str) -> Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """(record, sync markers) checkpointed for an account, or None"""
+        offset = self._offsets.get(account_id)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            entry = json.loads(f.readline())
+        return entry["account"], entry.get("markers")
+
+
+class SyncWriter:
+    """Journals a sync account by account and publishes it atomically
+    
+    Args:
+        output: The file to publish (``portfolio.json``)
+        journal: NDJSON journal; defaults to ``<output>.journal``
+    """
+    
+    def __init__(self, output: Path, journal: Optional[Path] = None):
+        self.output = Path(output)
+        self.journal_path = Path(journal) if journal else self.output.with_name(self.output.name + ".journal")
+        self._resume_path = self.journal_path.with_name(self.journal_path.name + ".resume")
+        self._journal: Optional[IO[str]] = None
+        self._count = 0
+    
+    def checkpoint(self) -> Optional[Checkpoint]:
+        """Records left by an interrupted sync, if there is one to resume
+        
+        The old journal is moved aside so that the new sync can journal its
+        own progress (including the resumed records) from the start. If a
+        resumed sync was itself interrupted, its journal is appended to the
+        one it resumed from so no checkpointed record is lost.
+        """
+        if self.journal_path.exists():
+            if self._resume_path.exists():
+                with open(self._resume_path, "ab") as merged, open(self.journal_path, "rb") as f:
+                    merged.write(b"\n" + f.read())
+                self.journal_path.unlink()
+            else:
+                os.replace(self.journal_path, self._resume_path)
+        if not self._resume_path.exists():
+            return None
+        return Checkpoint(self._resume_path)
+    
+    def begin(self, header: Dict[str, Any]):
+        """Start a new journal with the sync's user and connections"""
+        self._journal = open(self.journal_path, "w")
+        self._count = 0
+        self._append({"header": header})
+    
+    def add(self, record: Dict[str, Any], markers: Optional[Dict[str, Any]] = None):
+        """Append an account record and make it durable"""
+        self._append({"account": record, "markers": markers})
+        self._count += 1
+    
+    def _append(self, entry: Dict[str, Any]):
+        self._journal.write(json.dumps(entry, default=str) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+    
+    def records(self) -> JournalRecords:
+        """The journaled account records"""
+        return JournalRecords(self.journal_path, self._count)
+    
+    def publish(self, portfolio_data: Dict[str, Any]):
+        """Write ``portfolio_data`` to the output file atomically
+        
+        ``portfolio_data["accounts"]`` may be the lazy ``records()`` view; it
+        is streamed into place. The result is laid out exactly like
+        ``json.dump(portfolio_data, f, indent=2, default=str)``.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        
+        with atomic_open(self.output) as f:
+            f.write("{")
+            for index, (key, value) in enumerate(portfolio_data.items()):
+                f.write(",\n  " if index else "\n  ")
+                f.write(json.dumps(key) + ": ")
+                if key == "accounts":
+                    f.write("[")
+                    count = 0
+                    for record in value:
+                        f.write(",\n    " if count else "\n    ")
+                        f.write(_indented(record, 2))
+                        count += 1
+                    f.write("\n  ]" if count else "]")
+                else:
+                    f.write(_indented(value, 1))
+            f.write("\n}" if portfolio_data else "}")
+    
+    def discard(self):
+        """Remove the journal once everything that reads it is done"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        for path in (self.journal_path, self._resume_path):
+            if path.exists():
+                path.unlink()
+    
+    def close(self):
+        """Stop journaling, keeping the journal for a later ``--resume``"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
@@ -0,0 +1,300 @@
+"""Columnar time-series index over synced snapshots
+
+Answers "VOO across the last 500 syncs" or "account X's balance history"
+without reading any snapshot. Each symbol and each account has its own
+series, and every column of a series is a separate file of fixed-width
+integers that is appended to at each sync and loaded with one read:
+
+    timeseries/meta.json
+    timeseries/symbols/<symbol>.{time,account,quantity,price,value}
+    timeseries/accounts/<n>.{time,balance,value}
+
+Times are microseconds since the epoch (UTC). Quantities are stored as
+fixed-point integers with ``QUANTITY_SCALE`` decimal places and money with
+``MONEY_SCALE``, so values read back exactly as they were synced (to that
+precision). ``meta.json`` holds the row count of every series and is
+replaced atomically after the columns are appended; rows beyond that count
+(left by a crash mid-append) are ignored and trimmed by the next update.
+Updates hold ``.timeseries.lock`` so a sync and ``fenn compact`` never write
+the index at the same time.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import Config
+from .storage import atomic_write, file_lock, lock_file
+from .store import AccountRecord
+
+
+INDEX_VERSION = 1
+QUANTITY_SCALE = 8
+MONEY_SCALE = 6
+
+SYMBOL_COLUMNS = ("time", "account", "quantity", "price", "value")
+ACCOUNT_COLUMNS = ("time", "balance", "value")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_micros(timestamp: str) -> int:
+    """Microseconds since the epoch for an ISO timestamp (naive means UTC)"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def to_fixed(value: Decimal, scale: int) -> int:
+    return int(value.scaleb(scale).to_integral_value())
+
+
+def from_fixed(value: int, scale: int) -> Decimal:
+    return Decimal(value).scaleb(-scale)
+
+
+def _series_file(name: str) -> str:
+    """Filesystem-safe, collision-free file stem for a series name"""
+    safe = re.sub(r"[^A-Za-z0-9_-]", "_", name)[:40]
+    return f"{safe}-{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+
+
+class TimeSeriesIndex:
+    """Per-symbol and per-account history, stored column by column"""
+    
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or Config.TIMESERIES_DIR)
+        self.meta_path = self.root / "meta.json"
+        self.meta = self._load_meta()
+        self._account_lookup: Dict[str, int] = {}
+    
+    def _load_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("version") == INDEX_VERSION:
+                return meta
+        except (OSError, json.JSONDecodeError):
+            pass
+        return {"version": INDEX_VERSION, "last_indexed": None, "accounts": [], "symbols": {}, "account_series": {}}
+    
+    def _save_meta(self):
+        atomic_write(self.meta_path, json.dumps(self.meta))
+    
+    @property
+    def last_indexed(self) -> Optional[str]:
+        return self.meta["last_indexed"]
+    
+    # Writing
+    
+    def _account_index(self, account) -> int:
+        """Position of an account in the account dictionary, adding it if new"""
+        if not self._account_lookup:
+            self._account_lookup = {entry["id"]: index for index, entry in enumerate(self.meta["accounts"])}
+        
+        index = self._account_lookup.get(account.id)
+        if index is None:
+            index = self._account_lookup[account.id] = len(self.meta["accounts"])
+            self.meta["accounts"].append({"id": account.id})
+        
+        # Keep the latest name for display
+        self.meta["accounts"][index].update(name=account.name, institution=account.institution)
+        return index
+    
+    def _append(self, directory: str, series: Dict[str, Any], columns: Dict[str, List[int]]):
+        """Append rows to a series' column files and bump its row count"""
+        base = self.root / directory
+        base.mkdir(parents=True, exist_ok=True)
+        rows = series["rows"]
+        added = len(next(iter(columns.values())))
+        
+        for column, values in columns.items():
+            path = base / f"{series['file']}.{column}"
+            with open(path, "ab") as f:
+                # Drop rows a crashed update appended but never counted
+                if f.tell() > rows * 8:
+                    f.truncate(rows * 8)
+                array("q", values).tofile(f)
+        
+        series["rows"] = rows + added
+    
+    def add_snapshot(self, taken_at: str, records: Iterable[AccountRecord]) -> bool:
+        """Index one snapshot; snapshots not newer than the last one indexed are skipped
+        
+        Accounts whose sync was incomplete are left out rather than recorded
+        with missing positions.
+        
+        Returns:
+            Whether the snapshot was indexed
+        """
+        if self.last_indexed is not None and to_micros(taken_at) <= to_micros(self.last_indexed):
+            return False
+        
+        time = to_micros(taken_at)
+        symbol_rows: Dict[str, Dict[str, List[int]]] = {}
+        account_rows: Dict[str, Dict[str, List[int]]] = {}
+        
+        for account, positions, errors in records:
+            if errors or not account.id:
+                continue
+            account_index = self._account_index(account)
+            
+            total = Decimal(0)
+            for position in positions:
+                value = position.value
+                total += value
+                columns = symbol_rows.setdefault(position.symbol, {column: [] for column in SYMBOL_COLUMNS})
+                columns["time"].append(time)
+                columns["account"].append(account_index)
+                columns["quantity"].append(to_fixed(position.quantity, QUANTITY_SCALE))
+                columns["price"].append(to_fixed(position.price, MONEY_SCALE))
+                columns["value"].append(to_fixed(value, MONEY_SCALE))
+            
+            balance = account.balance.amount if account.balance is not None else None
+            if account.balance is not None:
+                self.meta["accounts"][account_index]["currency"] = account.balance.currency
+            account_rows[account.id] = {
+                "time": [time],
+                "balance": [to_fixed(balance, MONEY_SCALE) if balance is not None else 0],
+                "value": [to_fixed(total, MONEY_SCALE)]
+            }
+        
+        for symbol, columns in symbol_rows.items():
+            series = self.meta["symbols"].setdefault(symbol, {"file": _series_file(symbol), "rows": 0})
+            self._append("symbols", series, columns)
+        
+        for account_id, columns in account_rows.items():
+            series = self.meta["account_series"].setdefault(account_id, {"file": _series_file(account_id), "rows": 0})
+            self._append("accounts", series, columns)
+        
+        self.meta["last_indexed"] = taken_at
+        self._save_meta()
+        return True
+    
+    @contextmanager
+    def _locked(self):
+        """Hold the index's lock file and pick up changes made by other processes"""
+        with file_lock(lock_file(self.root.parent, self.root.name)):
+            self.meta = self._load_meta()
+            self._account_lookup = {}
+            yield
+    
+    def _index_from(self, store) -> int:
+        indexed = 0
+        for snapshot in store.snapshots("sync", after=self.last_indexed):
+            if self.add_snapshot(snapshot["taken_at"], store.records(snapshot["id"])):
+                indexed += 1
+        return indexed
+    
+    def update(self, store) -> int:
+        """Index the sync snapshots a ``SnapshotStore`` has gained since the last update
+        
+        Returns:
+            Number of snapshots indexed
+        """
+        with self._locked():
+            return self._index_from(store)
+    
+    def rebuild(self, store) -> int:
+        """Rebuild the index from every sync snapshot in a ``SnapshotStore``
+        
+        The new index is built alongside the old one and swapped in when
+        complete, so it can be rebuilt while ``fenn history`` reads it.
+        """
+        with self._locked():
+            staging = TimeSeriesIndex(self.root.with_name(self.root.name + ".rebuild"))
+            retired = self.root.with_name(self.root.name + ".old")
+            for path in (staging.root, retired):
+                if path.exists():
+                    shutil.rmtree(path)
+            
+            indexed = staging._index_from(store)
+            staging.root.mkdir(parents=True, exist_ok=True)
+            if self.root.exists():
+                os.replace(self.root, retired)
+            os.replace(staging.root, self.root)
+            if retired.exists():
+                shutil.rmtree(retired)
+            
+            self.meta = self._load_meta()
+            self._account_lookup = {}
+            return indexed
+    
+    # Reading
+    
+    def _read(self, directory: str, series: Dict[str, Any], columns: Iterable[str],
+              last: Optional[int] = None) -> Dict[str, array]:
+        """Load a series' columns, optionally only its last ``last`` rows"""
+        rows = series["rows"]
+        start = max(0, rows - last) if last else 0
+        data = {}
+        for column in columns:
+            values = array("q")
+            with open(self.root / directory / f"{series['file']}.{column}", "rb") as f:
+                f.seek(start * 8)
+                values.fromfile(f, rows - start)
+            data[column] = values
+        return data
+    
+    def symbols(self) -> List[str]:
+        return sorted(self.meta["symbols"])
+    
+    def find_symbol(self, ref: str) -> Optional[str]:
+        """Indexed symbol matching ``ref`` exactly or case-insensitively"""
+        if ref in self.meta["symbols"]:
+            return ref
+        matches = [symbol for symbol in self.meta["symbols"] if symbol.upper() == ref.upper()]
+        return matches[0] if matches else None
+    
+    def find_account(self, ref: str) -> Optional[Dict[str, Any]]:
+        """Indexed account whose id, or name (case-insensitive), is ``ref``"""
+        for entry in self.meta["accounts"]:
+            if entry["id"] == ref:
+                return entry
+        for entry in self.meta["accounts"]:
+            if entry["name"].lower() == ref.lower():
+                return entry
+        return None
+    
+    def symbol_history(self, symbol: str, last: Optional[int] = None) -> Dict[str, array]:
+        """Columns of a symbol's rows (one per account per sync), oldest first
+        
+        ``last`` limits the result to the rows of the last that many syncs.
+        """
+        series = self.meta["symbols"][symbol]
+        if not last:
+            return self._read("symbols", series, SYMBOL_COLUMNS)
+        
+        # Rows are grouped by sync time; read back far enough to cover ``last`` syncs
+        times = self._read("symbols", series, ("time",))["time"]
+        distinct = 0
+        start = len(times)
+        while start > 0 and distinct < last:
+            moment = times[start - 1]
+            while start > 0 and times[start - 1] == moment:
+                start -= 1
+            distinct += 1
+        return self._read("symbols", series, SYMBOL_COLUMNS, last=len(times) - start)
+    
+    def account_history(self, account_id: str, last: Optional[int] = None) -> Dict[str, array]:
+        """Columns of an account's balance and position value series, oldest first"""
+        return self._read("accounts", self.meta["account_series"][account_id], ACCOUNT_COLUMNS, last=last)
+    
+    def account_name(self, index: int) -> str:
+        return self.meta["accounts"][index]["name"]
+    
+    def account_currency(self, index: int) -> str:
+        """Currency of an account's balance, which its positions are valued in"""
+        return self.meta["accounts"][index].get("currency", "USD")
@@ -0,0 +1,306 @@
+"""Long-running sync daemon for ``fenn watch``
+
+``Watcher`` keeps one ``SnapTradeClient`` (with its rate limiters and
+circuit breakers) alive between syncs and refreshes each brokerage
+connection on its own interval. Every due time gets a random jitter, and
+the first sync is delayed by one too, so hosts started together do not hit
+SnapTrade at the same moment.
+
+Connections that come due close together (within ``coalesce`` seconds) are
+synced in one run, and a connection that comes due while a sync is running
+is picked up by the next run rather than starting another one. A run
+refetches only the accounts on the due connections and carries the others
+forward from the previous ``portfolio.json``; the result is saved through
+``save_sync`` exactly as ``fenn sync`` saves it, under the same lock.
+
+SIGTERM or SIGINT stops the daemon once the running sync (if any) is saved;
+a second one abandons the sync, leaving its journal for ``fenn sync
+--resume``. SIGUSR1 makes every connection due immediately (once, however
+many arrive during a running sync). The daemon's state and the outcome of
+its last run are kept in ``watch_status.json``.
+"""
+import json
+import os
+import random
+import signal
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+from .config import Config
+from .metrics import Metrics
+from .storage import atomic_write, file_lock, lock_file
+from .sync import save_sync
+from .sync_writer import SyncWriter
+
+# Schedule key for a sync of every connection (before any are known)
+ALL_CONNECTIONS = "*"
+
+
+def _timestamp(moment: Optional[float]) -> Optional[str]:
+    """Local ISO timestamp of a ``time.time()`` value"""
+    if moment is None:
+        return None
+    return datetime.fromtimestamp(moment).astimezone().isoformat(timespec="seconds")
+
+
+class Watcher:
+    """Sync connections on a schedule until stopped
+    
+    Args:
+        client: ``SnapTradeClient`` to reuse for every sync
+        interval: Seconds between syncs of a connection
+        intervals: Per-connection intervals, keyed by connection id or
+            (case-insensitive) brokerage name
+        jitter: Up to this many seconds are added at random to every due time
+        coalesce: Connections due within this many seconds of the first are
+            synced together
+        retry_delay: Seconds before retrying connections whose sync failed
+            (at most their interval)
+        incremental: Within due connections, refetch only accounts whose
+            upstream sync markers changed
+        max_workers: Concurrent API requests per sync
+        deadline: Seconds after which a sync saves what it has
+        status_file: Where to keep the daemon's status
+        log: Called with each progress message
+    """
+    
+    def __init__(self, client, interval: float, intervals: Optional[Dict[str, float]] = None,
+                 jitter: float = 0, coalesce: float = 0, retry_delay: float = 300,
+                 incremental: bool = False, max_workers: Optional[int] = None,
+                 deadline: Optional[float] = None, status_file: Optional[Path] = None,
+                 log: Callable[[str], None] = print):
+        self.client = client
+        self.interval = interval
+        self.intervals = {key.lower(): seconds for key, seconds in (intervals or {}).items()}
+        self.jitter = jitter
+        self.coalesce = coalesce
+        self.retry_delay = retry_delay
+        self.incremental = incremental
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.status_file = Path(status_file or Config.WATCH_STATUS_FILE)
+        self.log = log
+        
+        # connection id (or ALL_CONNECTIONS) -> time.time() it is next due
+        self.due: Dict[str, float] = {}
+        self.names: Dict[str, str] = {}
+        self.started_at = time.time()
+        self.state = "starting"
+        self.runs = 0
+        self.failures = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+        
+        self._wake = threading.Event()
+        self._stopping = False
+        self._syncing = False
+        self._triggered = False
+    
+    # Scheduling
+    
+    def interval_for(self, connection_id: str) -> float:
+        """Seconds between syncs of a connection"""
+        for key in (connection_id, self.names.get(connection_id, "")):
+            if key.lower() in self.intervals:
+                return self.intervals[key.lower()]
+        return self.interval
+    
+    def _next(self, delay: float) -> float:
+        return time.time() + delay + random.uniform(0, self.jitter)
+    
+    def _due_batch(self) -> Set[str]:
+        """Connections due now, plus those due within the coalescing window"""
+        now = time.time()
+        if min(self.due.values()) > now:
+            return set()
+        return {key for key, at in self.due.items() if at <= now + self.coalesce}
+    
+    # Signals
+    
+    def _on_stop(self, signum, frame):
+        if self._stopping and self._syncing:
+            raise KeyboardInterrupt
+        self._stopping = True
+        self._wake.set()
+        self.log(f"Received {signal.Signals(signum).name}, stopping"
+                 + (" after the current sync" if self._syncing else ""))
+    
+    def _on_trigger(self, signum, frame):
+        self._triggered = True
+        self._wake.set()
+    
+    # Status
+    
+    def write_status(self):
+        """Write the daemon's state, last run and schedule to the status file"""
+        status = {
+            "pid": os.getpid(),
+            "state": self.state,
+            "started_at": _timestamp(self.started_at),
+            "updated_at": _timestamp(time.time()),
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run": self.last_run,
+            "schedule": [
+                {
+                    "connection_id": None if key == ALL_CONNECTIONS else key,
+                    "name": "all connections" if key == ALL_CONNECTIONS else self.names.get(key),
+                    "interval": None if key == ALL_CONNECTIONS else self.interval_for(key),
+                    "next_run": _timestamp(at)
+                }
+                for key, at in sorted(self.due.items(), key=lambda item: item[1])
+            ]
+        }
+        try:
+            atomic_write(self.status_file, json.dumps(status, indent=2) + "\n")
+        except OSError as e:
+            self.log(f"Warning: Could not write {self.status_file}: {e}")
+    
+    # Running
+    
+    def run(self):
+        """Sync on schedule until SIGTERM or SIGINT
+        
+        Raises:
+            RuntimeError: If another ``fenn watch`` is running on the same data
+        """
+        Config.ensure_data_dir()
+        with ExitStack() as stack:
+            try:
+                stack.enter_context(file_lock(lock_file(Config.DATA_DIR, "watch"), blocking=False))
+            except BlockingIOError:
+                raise RuntimeError("Another fenn watch is already running on this data directory") from None
+            self._run()
+    
+    def _run(self):
+        handlers = {
+            signal.SIGTERM: signal.signal(signal.SIGTERM, self._on_stop),
+            signal.SIGINT: signal.signal(signal.SIGINT, self._on_stop),
+            signal.SIGUSR1: signal.signal(signal.SIGUSR1, self._on_trigger)
+        }
+        try:
+            self.due = {ALL_CONNECTIONS: self._next(0)}
+            self.log(f"Watching; first sync at {_timestamp(self.due[ALL_CONNECTIONS])}")
+            
+            while not self._stopping:
+                if self._triggered:
+                    self._triggered = False
+                    self.due = dict.fromkeys(self.due, time.time())
+                batch = self._due_batch()
+                if not batch:
+                    self.state = "waiting"
+                    self.write_status()
+                    self._wake.clear()
+                    self._wake.wait(max(0.0, min(self.due.values()) - time.time()))
+                    continue
+                
+                self._sync(batch)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            self.state = "stopped"
+            self.write_status()
+    
+    def _load_previous(self) -> Optional[Dict[str, Any]]:
+        if not Config.PORTFOLIO_DB.exists():
+            return None
+        try:
+            with open(Config.PORTFOLIO_DB, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            self.log(f"Warning: Could not read previous sync, syncing every connection: {e}")
+            return None
+    
+    def _label(self, connection_ids: Optional[Set[str]]) -> str:
+        if connection_ids is None:
+            return "all connections"
+        return ", ".join(sorted(self.names.get(key, key) for key in connection_ids))
+    
+    def _sync(self, batch: Set[str]):
+        """Sync the connections in ``batch`` and reschedule them"""
+        started = time.time()
+        connection_ids = None if ALL_CONNECTIONS in batch else batch
+        label = self._label(connection_ids)
+        
+        self.state = "syncing"
+        self.write_status()
+        
+        # A fresh set of metrics per sync; the client (and its limiters) stays warm
+        self.client.metrics = Metrics()
+        writer = SyncWriter(Config.PORTFOLIO_DB)
+        self._syncing = True
+        sync_status = "error"
+        try:
+            with file_lock(lock_file(Config.DATA_DIR, "sync"),
+                           on_wait=lambda: self.log("Waiting for another sync to finish")):
+                # Read the previous sync under the lock, so one that finished
+                # while this sync waited is the one it builds on
+                previous = self._load_previous() if self.incremental or connection_ids is not None else None
+                if previous is None and connection_ids is not None:
+                    connection_ids = None
+                    label = self._label(None)
+                self.log(f"Syncing {label}")
+                writer.discard()
+                portfolio_data = self.client.sync_all_data(
+                    max_workers=self.max_workers, previous=previous, deadline=self.deadline,
+                    writer=writer, connection_ids=connection_ids, incremental=self.incremental
+                )
+                portfolio_data["synced_at"] = datetime.utcnow().isoformat()
+                saved = save_sync(portfolio_data, writer, self.client.metrics)
+                writer.discard()
+            sync_status = "ok"
+        except Exception as e:
+            self.failures += 1
+            self.last_run = {
+                "started_at": _timestamp(started),
+                "finished_at": _timestamp(time.time()),
+                "duration": round(time.time() - started, 3),
+                "status": "error",
+                "error": str(e),
+                "connections": label
+            }
+            self.log(f"❌ Sync of {label} failed: {e}")
+            for key in batch:
+                self.due[key] = self._next(min(self.retry_delay, self.interval_for(key)))
+            return
+        finally:
+            self._syncing = False
+            writer.close()
+            try:
+                self.client.metrics.write(Config.METRICS_FILE, Config.METRICS_PROM_FILE, status=sync_status)
+            except OSError as e:
+                self.log(f"Warning: Could not write sync metrics: {e}")
+            self.runs += 1
+        
+        # Follow the connections the sync found: new ones were synced now, removed ones are dropped
+        connections = {
+            str(connection.get("id")): connection
+            for connection in portfolio_data.get("connections", []) if isinstance(connection, dict)
+        }
+        for connection_id, connection in connections.items():
+            brokerage = connection.get("brokerage")
+            self.names[connection_id] = (brokerage.get("name") if isinstance(brokerage, dict) else None) or connection_id
+            if connection_id in batch or connection_id not in self.due or connection_ids is None:
+                self.due[connection_id] = self._next(self.interval_for(connection_id))
+        for key in list(self.due):
+            if key not in connections:
+                del self.due[key]
+        if not self.due:
+            # No connections yet; look again after the default interval
+            self.due[ALL_CONNECTIONS] = self._next(self.interval)
+        
+        totals = saved.summary["totals"]
+        self.last_run = {
+            "started_at": _timestamp(started),
+            "finished_at": _timestamp(time.time()),
+            "duration": round(time.time() - started, 3),
+            "status": "ok",
+            "connections": label,
+            "snapshot_id": saved.snapshot_id,
+            "accounts": totals["accounts"],
+            "incomplete_accounts": sum(1 for account in saved.summary["accounts"] if account["incomplete"])
+        }
+        self.log(f"✓ Synced {label}: {totals['accounts']} account(s), snapshot {saved.snapshot_id}")
@@ -1,130 +1,74 @@
 #!/usr/bin/env python3
 """Portfolio aggregator - shows consolidated view across all accounts"""
+from fenn.aggregate import PositionTable
+from fenn.cache import PortfolioCache
+from fenn.config import Config
+from fenn.fx import FxRates
 from fenn.snaptrade_client import SnapTradeClient
-from collections import defaultdict
+from fenn.symbols import SymbolRules
 from decimal import Decimal
-import json
 
 
-def get_aggregated_portfolio(client):
-    """Fetch and aggregate holdings across all accounts"""
-    print("Fetching holdings from all accounts...")
+def _money(amount, currency):
+    return f"${float(amount):,.2f}" if currency == "USD" else f"{float(amount):,.2f} {currency}"
+
+
+def to_base_currency(table, currency):
+    """Convert a table into ``currency`` at the cached FX rates, as ``fenn portfolio`` does
+    
+    Returns:
+        The converted table, and a table per currency without a rate
+    """
+    foreign = [code for code in table.held_currencies() if code != currency]
+    if not foreign:
+        return table, {}
+    rates, day, missing = FxRates().partial_conversion(foreign, currency)
+    unconverted = {code: table.select_currencies([code]) for code in missing}
+    if missing:
+        print(f"  No exchange rate for {', '.join(f'{code}/{currency}' for code in missing)}; "
+              f"run 'fenn fx update'. Those holdings are left out of the totals.")
+        table = table.select_currencies([code for code in table.held_currencies() if code not in missing])
+    if rates:
+        print(f"  Converting {', '.join(rates)} to {currency}" + (f" at rates of {day}" if day else ""))
+    return table.convert(rates, currency), unconverted
+
+
+def get_aggregated_portfolio(client, groups=True, currency=None):
+    """Table of holdings across all accounts, refetching only expired ones
+    
+    Symbols are renamed (and, with ``groups``, grouped) by the symbol rules,
+    and values converted into ``currency`` (default ``Config.BASE_CURRENCY``).
+    
+    Returns:
+        The table and a table per currency that could not be converted,
+        or None
+    """
+    print("Loading holdings from all accounts...")
     
     try:
-        # Get all accounts
-        accounts = client.get_all_accounts()
+        with PortfolioCache() as cache:
+            holdings = cache.holdings()
+            if not holdings.records:
+                records = holdings.refresh(client)
+            else:
+                expired = holdings.expired()
+                if expired:
+                    print(f"  Refreshing {len(expired)} account(s)...")
+                    holdings.refresh(client, expired)
+                records = holdings.records
         
-        if not accounts:
+        if not records:
             print("No accounts found")
             return None
         
-        # Parse holdings data
-        aggregated = defaultdict(lambda: {
-            'symbol': '',
-            'description': '',
-            'total_quantity': Decimal('0'),
-            'total_value': Decimal('0'),
-            'accounts': [],
-            'currency': 'USD'
-        })
-        
-        total_portfolio_value = Decimal('0')
-        
-        # Fetch holdings for each account
-        for account in accounts:
-            account_id = account.get('id')
-            account_name = account.get('name', 'Unknown Account')
-            
-            print(f"  Fetching {account_name}...")
-            
-            try:
-                # Use get_user_holdings which works (not get_user_account_positions which hangs)
-                response = client.client.account_information.get_user_holdings(
-                    user_id=client.user_id,
-                    user_secret=client.user_secret,account_id=account_id
-                )
-                
-                # Extract holdings data
-                if hasattr(response, 'body'):
-                    holdings_data = response.body
-                    if hasattr(holdings_data, 'to_dict'):
-                        holdings_data = holdings_data.to_dict()
-                elif hasattr(response, 'to_dict'):
-                    holdings_data = response.to_dict().get('body', {})
-                else:
-                    holdings_data = response
-                
-                # Get positions array
-                positions = holdings_data.get('positions', [])
-                
-                for position in positions:
-                    # Handle both dict and object types
-                    if hasattr(position, 'to_dict'):
-                        pos = position.to_dict()
-                    else:
-                        pos = position
-                    
-                    # Extract symbol data
-                    symbol_data = pos.get('symbol', {})
-                    if isinstance(symbol_data, dict):
-                        symbol_info = symbol_data.get('symbol', {})
-                    else:
-                        symbol_info = symbol_data
-                    
-                    if isinstance(symbol_info, dict):
-                        symbol = symbol_info.get('symbol', 'UNKNOWN')
-                        description = symbol_info.get('description', '')
-                    else:
-                        symbol = 'UNKNOWN'
-                        description = ''
-                    
-                    # Get quantity and price
-                    try:
-                        quantity = Decimal(str(pos.get('units', 0)))
-                    except (ValueError, TypeError):
-                        quantity = Decimal('0')
-                    
-                    try:
-                        price = Decimal(str(pos.get('price', 0)))
-                    except (ValueError, TypeError):
-                        price = Decimal('0')
-                    
-                    try:
-                        avg_cost = Decimal(str(pos.get('average_purchase_price', 0)))
-                    except (ValueError, TypeError):
-                        avg_cost = Decimal('0')
-                    
-                    # Calculate value
-                    value = quantity * price
-                    
-                    # Aggregate by symbol
-                    agg = aggregated[symbol]
-                    agg['symbol'] = symbol
-                    agg['description'] = description
-                    agg['total_quantity'] += quantity
-                    agg['total_value'] += value
-                    agg['accounts'].append({
-                        'account_id': account_id,
-                        'account_name': account_name,
-                        'quantity': float(quantity),
-                        'price': float(price),
-                        'avg_cost': float(avg_cost),
-                        'value': float(value)
-                    })
-                    
-                    # Track total
-                    total_portfolio_value += value
-                    
-            except Exception as e:
-                print(f"    Error fetching holdings for {account_name}: {e}")
-                continue
-        
-        return {
-            'holdings': dict(aggregated),
-            'total_value': float(total_portfolio_value),
-            'currency': 'USD'
-        }
+        for account, positions, errors in records:
+            if errors:
+                print(f"    Error fetching holdings for {account.name}: {errors}")
         
+        table, unconverted = to_base_currency(PositionTable.from_records(records), currency or Config.BASE_CURRENCY)
+        rules = SymbolRules.load()
+        return table.relabel(rules.mapping(groups), rules.descriptions), unconverted
+    
     except Exception as e:
         print(f"Error fetching holdings: {e}")
         import traceback
@@ -132,14 +76,15 @@ def get_aggregated_portfolio(client):
         return None
 
 
-def display_portfolio(portfolio_data):
+def display_portfolio(table, currency="USD"):
     """Display aggregated portfolio in readable format"""
-    if not portfolio_data:
+    if table is None:
         print("No portfolio data to display")
         return
     
-    holdings = portfolio_data['holdings']
-    total_value = Decimal(str(portfolio_data['total_value']))
+    holdings = table.by_symbol()
+    total_value = table.total_value()
+    sign = "$" if currency == "USD" else " "
     
     if not holdings:
         print("No holdings found")
@@ -149,59 +94,38 @@ def display_portfolio(portfolio_data):
     print(f"{'Symbol':<8} {'Description':<40} {'Quantity':>15} {'Value':>15} {'Allocation':>10}")
     print("="*100)
     
-    # Sort by value descending
-    sorted_holdings = sorted(holdings.items(), key=lambda x: x[1]['total_value'], reverse=True)
-    
-    for symbol, data in sorted_holdings:
-        quantity = data['total_quantity']
-        value = data['total_value']
-        allocation = (value / total_value * 100) if total_value > 0 else Decimal('0')
+    for holding in holdings:
+        allocation = (holding.value / total_value * 100) if total_value > 0 else Decimal('0')
         
-        desc = data['description'][:40] if len(data['description']) > 40 else data['description']
+        desc = holding.description[:40]
         
-        print(f"{symbol:<8} {desc:<40} {float(quantity):>15.6f} ${float(value):>14,.2f} {float(allocation):>9.2f}%")
+        print(f"{holding.symbol:<8} {desc:<40} {float(holding.quantity):>15.6f} {sign}{float(holding.value):>14,.2f} {float(allocation):>9.2f}%")
     
     print("="*100)
-    print(f"{'TOTAL':<8} {'':40} {'':>15} ${float(total_value):>14,.2f} {'100.00%':>10}")
+    print(f"{'TOTAL':<8} {'':40} {'':>15} {sign}{float(total_value):>14,.2f} {'100.00%':>10}")
     print("="*100)
     print()
 
 
-def display_by_account(portfolio_data):
+def display_by_account(table, currency="USD"):
     """Display portfolio grouped by account"""
-    if not portfolio_data:
+    if table is None:
         return
-    
-    holdings = portfolio_data['holdings']
-    
-    # Group by account
-    accounts_data = defaultdict(lambda: {'holdings': [], 'total': Decimal('0')})
-    
-    for symbol, data in holdings.items():
-        for account in data['accounts']:
-            account_name = account['account_name']
-            accounts_data[account_name]['holdings'].append({
-                'symbol': symbol,
-                'description': data['description'],
-                'quantity': account['quantity'],
-                'price': account['price'],
-                'value': account['value']
-            })
-            accounts_data[account_name]['total'] += Decimal(str(account['value']))
+    sign = "$" if currency == "USD" else " "
     
     # Display each account
-    for account_name, account_data in sorted(accounts_data.items()):
-        print(f"\n{account_name}")
+    for account_total in table.by_account():
+        print(f"\n{account_total.account.name}")
         print("-" * 100)
         print(f"{'Symbol':<8} {'Description':<40} {'Quantity':>15} {'Price':>12} {'Value':>15}")
         print("-" * 100)
         
-        for holding in sorted(account_data['holdings'], key=lambda x: x['value'], reverse=True):
-            desc = holding['description'][:40] if len(holding['description']) > 40 else holding['description']
-            print(f"{holding['symbol']:<8} {desc:<40} {holding['quantity']:>15.6f} ${holding['price']:>11,.2f} ${holding['value']:>14,.2f}")
+        for holding in account_total.holdings:
+            desc = holding.description[:40]
+            print(f"{holding.symbol:<8} {desc:<40} {float(holding.quantity):>15.6f} {sign}{float(holding.price):>11,.2f} {sign}{float(holding.value):>14,.2f}")
         
         print("-" * 100)
-        print(f"{'Account Total:':<49} ${float(account_data['total']):>14,.2f}")
+        print(f"{'Account Total:':<49} {sign}{float(account_total.value):>14,.2f}")
         print()
 
 
@@ -213,19 +137,26 @@ def main():
     # Determine display mode
     by_account = '--by-account' in sys.argv or '-a' in sys.argv
     
+    currency = Config.BASE_CURRENCY
+    
     # Fetch portfolio
-    portfolio = get_aggregated_portfolio(client)
+    result = get_aggregated_portfolio(client, groups=not by_account, currency=currency)
     
-    if portfolio:
+    if result is not None:
+        portfolio, unconverted = result
+        if currency != "USD":
+            print(f"\nValues in {currency}")
         if by_account:
-            display_by_account(portfolio)
+            display_by_account(portfolio, currency)
         else:
-            display_portfolio(portfolio)
+            display_portfolio(portfolio, currency)
         
         # Show summary
         print(f"\nPortfolio Summary:")
-        print(f"  Total Holdings: {len(portfolio['holdings'])} unique symbols")
-        print(f"  Total Value: ${portfolio['total_value']:,.2f}")
+        print(f"  Total Holdings: {len(portfolio.by_symbol())} unique symbols")
+        print(f"  Total Value: {_money(portfolio.total_value(), currency)}")
+        for code, other in unconverted.items():
+            print(f"  Not converted: {_money(other.total_value(), code)}")
     else:
         print("Failed to fetch portfolio data")
 